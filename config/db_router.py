@@ -0,0 +1,106 @@
+""" Чтение с реплик: маршрутизатор баз данных и middleware с привязкой к основной базе после записи
+
+Запросы безопасными методами (GET, HEAD, OPTIONS) читают модели из DATABASE_REPLICA_APPS с реплики,
+одной на весь запрос. Записи, миграции, фоновые задачи и команды работают с основной базой.
+После записи пользователь на REPLICA_STICKY_SECONDS привязывается к основной базе, чтобы сразу видеть
+свои изменения, даже если реплика отстаёт. Внутри транзакции на основной базе чтения тоже идут в неё.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_current_request = ContextVar('replica_request', default=None)
+
+
+def pin_cache_key(user_id):
+    return f'replica_pin:{user_id}'
+
+
+def pin_user(user_id):
+    """ Читать данные пользователя с основной базы в течение REPLICA_STICKY_SECONDS """
+    cache.set(pin_cache_key(user_id), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+
+
+def _authenticated_user_id(request):
+    # пользователь сессии вычисляется лениво; до аутентификации привязку не проверяем
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+class RequestState:
+    """ Состояние маршрутизации одного запроса """
+
+    def __init__(self, request):
+        self.request = request
+        self.safe = request.method in SAFE_METHODS
+        self.replica = random.choice(settings.DATABASE_REPLICAS) if self.safe else None
+        self.wrote = False
+        self.pinned = None
+
+    def read_alias(self):
+        if not self.safe or self.wrote:
+            return None
+        if self.pinned is None:
+            user_id = _authenticated_user_id(self.request)
+            if user_id is None:
+                return self.replica
+            self.pinned = bool(cache.get(pin_cache_key(user_id)))
+        return None if self.pinned else self.replica
+
+
+class ReplicaRouter:
+    """ Маршрутизатор: чтения безопасных запросов — на реплику, остальное — на основную базу """
+
+    def db_for_read(self, model, **hints):
+        state = _current_request.get()
+        if state is None or model._meta.app_label not in settings.DATABASE_REPLICA_APPS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _current_request.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема реплик приходит с основной базы через репликацию
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaRoutingMiddleware:
+    """ Открывает состояние маршрутизации на время запроса и привязывает писавшего пользователя """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RequestState(request)
+        token = _current_request.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        if not state.safe or state.wrote:
+            user_id = _authenticated_user_id(request)
+            if user_id is not None:
+                pin_user(user_id)
+        return response
@@ -0,0 +1,85 @@
+""" Быстрые рендереры и парсеры: JSON на orjson и MessagePack; CSV для отчётов
+
+Клиент выбирает формат заголовками Accept (ответ) и Content-Type (тело запроса).
+"""
+import csv
+import io
+
+import msgpack
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+
+# Decimal, ленивые строки, даты вне сериализатора и т. п. кодируются так же, как в JSONRenderer DRF
+_default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    """ JSON через orjson; форматированный вывод (indent) — через JSONRenderer DRF """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        ret = orjson.dumps(data, default=_default,
+                           option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        # как и JSONRenderer, экранируем разделители строк, недопустимые в JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONParser(JSONParser):
+    """ Разбор JSON через orjson """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """ Ответ в формате MessagePack (Accept: application/msgpack) """
+    media_type = MSGPACK_MEDIA_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    """ Тело запроса в формате MessagePack (Content-Type: application/msgpack) """
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError, ValueError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class CSVRenderer(BaseRenderer):
+    """ Строки отчёта (data['results']) в CSV (?format=csv); столбцы — атрибут csv_columns представления """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        file = io.StringIO()
+        if isinstance(data, dict) and 'results' in data:
+            writer = csv.DictWriter(file, renderer_context['view'].csv_columns)
+            writer.writeheader()
+            writer.writerows(data['results'])
+        elif data:
+            # ошибки (detail, поля валидации) — парами ключ, значение
+            csv.writer(file).writerows(data.items())
+        return file.getvalue().encode(self.charset)
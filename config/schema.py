@@ -0,0 +1,109 @@
+""" Схема OpenAPI для /swagger/ и /redoc/: строится один раз и отдаётся из памяти
+
+Обход всех представлений и сериализаторов выполняется при первом запросе схемы или заранее командой
+build_openapi_schema, которая сохраняет документы в OPENAPI_SCHEMA_FILE. Документы помечены отпечатком
+исходного кода проекта: после изменения кода файл и кэш в памяти не подходят, и схема строится заново.
+Схема строится без запроса, поэтому не зависит от хоста и пользователя и отдаётся с ETag и Cache-Control.
+"""
+import hashlib
+import json
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import drf_yasg
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from drf_yasg import openapi
+from drf_yasg.renderers import _SpecRenderer
+from drf_yasg.views import SPEC_RENDERERS, get_schema_view
+from rest_framework import permissions
+
+API_INFO = openapi.Info(
+    title="Authorization Service API",
+    default_version='v1',
+    description="Проект представляет собой реализацию простой реферальной системы. "
+                "Основной функционал включает авторизацию пользователей по номеру "
+                "телефона и возможность использования инвайт-кодов.",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="artkamproject@gmail.com"),
+    license=openapi.License(name="BSD License"),
+)
+
+SchemaView = get_schema_view(
+    API_INFO,
+    public=True,
+    permission_classes=(permissions.AllowAny,),
+)
+
+_documents = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def source_fingerprint():
+    """ Отпечаток исходного кода проекта и версии drf_yasg; считается один раз на процесс """
+    base_dir = Path(settings.BASE_DIR)
+    roots = {Path(__file__).parent} | {Path(app.path) for app in apps.get_app_configs()
+                                       if Path(app.path).is_relative_to(base_dir)}
+    digest = hashlib.sha256(drf_yasg.__version__.encode())
+    for path in sorted(file for root in roots for file in root.rglob('*.py')):
+        digest.update(str(path.relative_to(base_dir)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def build_documents():
+    """ Сгенерировать схему и отрисовать её во всех форматах: {формат: текст} """
+    generator = SchemaView.generator_class(API_INFO, version='')
+    schema = generator.get_schema(request=None, public=True)
+    return {renderer.format: renderer().render(schema).decode() for renderer in SPEC_RENDERERS}
+
+
+def write_documents(path=None):
+    """ Сохранить схему с отпечатком кода в файл; возвращает путь """
+    path = Path(path or settings.OPENAPI_SCHEMA_FILE)
+    path.write_text(json.dumps({'fingerprint': source_fingerprint(), 'documents': build_documents()}))
+    return path
+
+
+def _read_documents(path):
+    try:
+        data = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return None
+    return data['documents'] if data.get('fingerprint') == source_fingerprint() else None
+
+
+def get_documents():
+    """ Документы схемы для текущего кода: из памяти, из файла сборки или построенные заново """
+    fingerprint = source_fingerprint()
+    documents = _documents.get(fingerprint)
+    if documents is None:
+        with _lock:
+            documents = _documents.get(fingerprint)
+            if documents is None:
+                documents = _read_documents(settings.OPENAPI_SCHEMA_FILE) or build_documents()
+                _documents.clear()
+                _documents[fingerprint] = documents
+    return documents
+
+
+class CachedSchemaView(SchemaView):
+    """ Схема из get_documents() вместо генерации на каждый запрос; страницы swagger и redoc — как раньше """
+
+    def get(self, request, version='', format=None):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, _SpecRenderer):
+            return super().get(request, version, format)
+        etag = f'"{source_fingerprint()}-{renderer.format}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(get_documents()[renderer.format],
+                                    content_type=f'{renderer.media_type}; charset={renderer.charset}')
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=settings.OPENAPI_SCHEMA_MAX_AGE)
+        return response
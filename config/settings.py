@@ -52,11 +52,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.tracing.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'config.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -96,6 +98,21 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: POSTGRES_REPLICA_HOSTS=host1,host2 добавляет псевдонимы replica_1, replica_2
+# с остальными параметрами основной базы. В тестах реплики — зеркала тестовой основной базы
+DATABASE_REPLICAS = []
+for number, host in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica_{number}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['config.db_router.ReplicaRouter']
+
+# Приложения, модели которых безопасные запросы читают с реплик
+DATABASE_REPLICA_APPS = ['electronics_network']
+
+# Сколько секунд после записи пользователь читает с основной базы
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS') or 5)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -139,13 +156,63 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
 
+# Формат выбирается по Accept / Content-Type: JSON (orjson) или MessagePack
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'users.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'config.renderers.ORJSONRenderer',
+        'config.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'config.renderers.ORJSONParser',
+        'config.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
-}
\ No newline at end of file
+}
+
+# Кэш. Для нескольких воркеров нужен общий бэкенд (например, Redis),
+# иначе сброс закэшированного пользователя виден только в своём процессе
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND') or 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        'OPTIONS': {'MAX_ENTRIES': 10000} if not os.getenv('CACHE_BACKEND') else {},
+    }
+}
+
+# Время жизни пользователя в кэше JWT-аутентификации, секунд
+JWT_USER_CACHE_TIMEOUT = 300
+
+# Трассировка запросов по фазам (аутентификация, права, queryset, сериализация, рендеринг)
+TRACING = {
+    'ENABLED': os.getenv('TRACING_ENABLED') == '1',
+    'EXPORTER': 'config.tracing.JSONFileExporter',
+    'EXPORTER_OPTIONS': {'path': os.getenv('TRACING_FILE') or BASE_DIR / 'traces.jsonl'},
+    'SLOW_REQUEST_MS': int(os.getenv('TRACING_SLOW_REQUEST_MS') or 0),
+}
+
+# Единая таблица звеньев сети (NetworkNode): транзакции ссылаются на продавца и покупателя одной колонкой.
+# Перед включением заполнить таблицу: python manage.py sync_network_nodes
+NETWORK_NODES_UNIFIED = os.getenv('NETWORK_NODES_UNIFIED') == '1'
+
+# Схема OpenAPI: файл сборки (python manage.py build_openapi_schema) и время кэширования ответа клиентом, секунд
+OPENAPI_SCHEMA_FILE = os.getenv('OPENAPI_SCHEMA_FILE') or BASE_DIR / 'openapi.json'
+OPENAPI_SCHEMA_MAX_AGE = 3600
+
+# Время жизни счётчиков фасетов (<ресурс>/facets/ и фильтры админ-панели) в кэше, секунд
+FACETS_CACHE_SECONDS = int(os.getenv('FACETS_CACHE_SECONDS') or 60)
+
+# Снимок иерархии сети, который процессы сервера отображают в память; пересобирается после изменения звеньев
+HIERARCHY_SNAPSHOT_FILE = os.getenv('HIERARCHY_SNAPSHOT_FILE') or BASE_DIR / 'hierarchy.snapshot'
+
+# Число процессов команды debt_exposure_report; 0 — по числу ядер
+DEBT_EXPOSURE_WORKERS = int(os.getenv('DEBT_EXPOSURE_WORKERS') or 0)
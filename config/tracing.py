@@ -0,0 +1,204 @@
+""" Лёгкая трассировка запросов: вложенные спаны по фазам обработки """
+import json
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.module_loading import import_string
+from rest_framework.fields import empty
+from rest_framework.serializers import ListSerializer
+
+_current_span = ContextVar('current_span', default=None)
+
+
+class Span:
+    """ Спан: именованный интервал времени с вложенными спанами """
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.attributes = attributes
+        self.children = []
+        self.start = time.perf_counter()
+        self.end = None
+        if parent is not None:
+            parent.children.append(self)
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    @property
+    def duration_ms(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'start_offset_ms': round((self.start - self._root().start) * 1000, 3),
+            'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+    def _root(self):
+        span = self
+        while span.parent is not None:
+            span = span.parent
+        return span
+
+
+def current_span():
+    """ Активный спан текущего контекста или None """
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """ Открыть вложенный спан; без активной трассировки ничего не делает """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent=parent, **attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.finish()
+        _current_span.reset(token)
+
+
+class BaseExporter:
+    """ Базовый экспортёр завершённых трасс """
+
+    def export(self, root):
+        raise NotImplementedError
+
+
+class JSONFileExporter(BaseExporter):
+    """ Экспортёр трасс в локальный файл, по одной JSON-строке на запрос """
+
+    def __init__(self, path='traces.jsonl'):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, root):
+        line = json.dumps({'trace_id': root.trace_id, **root.to_dict()}, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(line + '\n')
+
+
+def get_tracing_settings():
+    return getattr(settings, 'TRACING', {})
+
+
+def get_exporter():
+    """ Экспортёр из настроек TRACING['EXPORTER'] """
+    config = get_tracing_settings()
+    exporter_class = import_string(config.get('EXPORTER', 'config.tracing.JSONFileExporter'))
+    return exporter_class(**config.get('EXPORTER_OPTIONS', {}))
+
+
+class TracingMiddleware:
+    """ Корневой спан запроса, спаны SQL-запросов и рендеринга ответа """
+
+    def __init__(self, get_response):
+        config = get_tracing_settings()
+        if not config.get('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.exporter = get_exporter()
+        # экспортируются только запросы медленнее порога, чтобы писать хвост распределения
+        self.slow_request_ms = config.get('SLOW_REQUEST_MS', 0)
+
+    def __call__(self, request):
+        root = Span('request', method=request.method, path=request.path)
+        token = _current_span.set(root)
+        try:
+            with _trace_queries():
+                response = self.get_response(request)
+            root.attributes['status_code'] = response.status_code
+            return response
+        finally:
+            root.finish()
+            _current_span.reset(token)
+            if root.duration_ms >= self.slow_request_ms:
+                self.exporter.export(root)
+
+    def process_template_response(self, request, response):
+        render = response.render
+
+        def traced_render():
+            with span('render', renderer=type(getattr(response, 'accepted_renderer', None)).__name__):
+                return render()
+
+        response.render = traced_render
+        return response
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    with span('db.query', sql=sql, many=many):
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def _trace_queries():
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(_query_wrapper))
+        yield
+
+
+class TracingViewMixin:
+    """ Спаны аутентификации, проверок прав и выборки queryset для GenericAPIView """
+
+    def perform_authentication(self, request):
+        authenticators = [type(authenticator).__name__ for authenticator in request.authenticators]
+        with span('authentication', authenticators=authenticators):
+            super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        with span('permissions', classes=[cls.__name__ for cls in self.permission_classes]):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with span('object_permissions', classes=[cls.__name__ for cls in self.permission_classes]):
+            super().check_object_permissions(request, obj)
+
+    def paginate_queryset(self, queryset):
+        with span('queryset', model=queryset.model.__name__):
+            return super().paginate_queryset(queryset)
+
+    def get_object(self):
+        with span('queryset', action=self.action):
+            return super().get_object()
+
+
+class TracingSerializerMixin:
+    """ Спаны to_representation и валидации для сериализатора верхнего уровня """
+
+    def to_representation(self, instance):
+        if self.parent is not None:
+            return super().to_representation(instance)
+        with span('serializer.to_representation', serializer=type(self).__name__):
+            return super().to_representation(instance)
+
+    def run_validation(self, data=empty):
+        with span('serializer.validate', serializer=type(self).__name__):
+            return super().run_validation(data)
+
+
+class TracedListSerializer(ListSerializer):
+    """ ListSerializer с одним спаном на всю страницу вместо спана на строку """
+
+    def to_representation(self, data):
+        with span('serializer.to_representation', serializer=type(self.child).__name__, many=True):
+            return super().to_representation(data)
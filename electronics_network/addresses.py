@@ -0,0 +1,47 @@
+""" Справочники стран и городов звеньев сети
+
+Страна и город производителя, розничной сети, ИП и NetworkNode — внешние ключи на Country и City.
+Название на входе приводится к каноническому виду (без лишних пробелов, с заглавной буквы),
+а запись справочника ищется по ключу без учёта регистра: «  санкт-петербург» и «Санкт-Петербург» — один город.
+"""
+from django.apps import apps
+from django.db import IntegrityError, transaction
+
+
+def canonical_name(value):
+    """ Название без лишних пробелов с заглавной первой буквой """
+    name = ' '.join(str(value).split())
+    return name[:1].upper() + name[1:]
+
+
+def name_key(value):
+    """ Ключ названия в справочнике: без лишних пробелов и без учёта регистра """
+    return ' '.join(str(value).split()).casefold()
+
+
+def _get_or_create(model, name, **lookup):
+    lookup['key'] = name_key(name)
+    try:
+        return model.objects.get(**lookup)
+    except model.DoesNotExist:
+        pass
+    try:
+        # одновременная вставка того же названия упирается в уникальный ключ: тогда читаем готовую запись
+        with transaction.atomic():
+            return model.objects.create(name=canonical_name(name), **lookup)
+    except IntegrityError:
+        return model.objects.get(**lookup)
+
+
+def get_country(name):
+    return _get_or_create(apps.get_model('electronics_network', 'Country'), name)
+
+
+def get_city(country, name):
+    return _get_or_create(apps.get_model('electronics_network', 'City'), name, country=country)
+
+
+def resolve_address(country_name, city_name):
+    """ Записи справочников для названий страны и города: {'country': Country, 'city': City} """
+    country = get_country(country_name)
+    return {'country': country, 'city': get_city(country, city_name)}
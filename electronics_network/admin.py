@@ -1,16 +1,52 @@
+from django import forms
 from django.contrib import admin
-from .models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction
+from .models import Country, City, Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction, Job
+from .jobs import enqueue
 from django.urls import reverse
 from django.utils.html import format_html
-from django.db.models import Sum
+from django.db.models import Sum, Prefetch
+from django.utils import timezone
+from .pagination import EstimatedCountPaginator
+from .admin_filters import AutocompleteFilter, AutocompleteFilterMixin, FacetFilter, PrefixAutocompleteMixin
+from .nodes import counterparty_filter
+
+
+class AddressAdminForm(forms.ModelForm):
+    """ Форма звена сети: выбранный город должен относиться к выбранной стране """
+
+    def clean(self):
+        cleaned_data = super().clean()
+        country, city = cleaned_data.get('country'), cleaned_data.get('city')
+        if country and city and city.country_id != country.pk:
+            self.add_error('city', f'Город {city} не относится к стране {country}.')
+        return cleaned_data
+
+
+@admin.register(Country)
+class CountryAdmin(PrefixAutocompleteMixin, admin.ModelAdmin):
+    """ Страна """
+    list_display = ('name', )
+    search_fields = ('name', )
+
+
+@admin.register(City)
+class CityAdmin(PrefixAutocompleteMixin, admin.ModelAdmin):
+    """ Город """
+    list_display = ('name', 'country')
+    search_fields = ('name', )
+    list_filter = (('country', AutocompleteFilter), )
+    list_select_related = ('country', )
 
 
 @admin.register(Manufacturer)
-class ManufacturerAdmin(admin.ModelAdmin):
+class ManufacturerAdmin(PrefixAutocompleteMixin, admin.ModelAdmin):
     """ Производитель """
     list_display = ('name', 'email', 'country', 'city', 'level')
-    search_fields = ('name', 'city')
-    list_filter = ('city', )
+    search_fields = ('name', 'city__name')
+    list_filter = (('country', FacetFilter), ('city', AutocompleteFilter), ('level', FacetFilter))
+    list_select_related = ('country', 'city')
+    autocomplete_fields = ('country', 'city')
+    form = AddressAdminForm
 
     def level(self, obj):
         return obj.level
@@ -20,7 +56,7 @@ class ManufacturerAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if not request.user.is_superuser:
-            qs = qs.filter(manufacturer_user=request.user)
+            qs = qs.filter(owner=request.user)
         return qs
 
     def save_model(self, request, obj, form, change):
@@ -29,11 +65,14 @@ class ManufacturerAdmin(admin.ModelAdmin):
 
 
 @admin.register(RetailNetwork)
-class RetailNetworkAdmin(admin.ModelAdmin):
+class RetailNetworkAdmin(PrefixAutocompleteMixin, admin.ModelAdmin):
     """ Розничная сеть """
     list_display = ('name', 'email', 'country', 'city', 'level', 'get_supplier_link', 'total_debt')
-    search_fields = ('name', 'city')
-    list_filter = ('city',)
+    search_fields = ('name', 'city__name')
+    list_filter = (('country', FacetFilter), ('city', AutocompleteFilter), ('level', FacetFilter))
+    list_select_related = ('country', 'city')
+    autocomplete_fields = ('country', 'city')
+    form = AddressAdminForm
 
     def level(self, obj):
         return obj.level
@@ -76,18 +115,22 @@ class RetailNetworkAdmin(admin.ModelAdmin):
     actions = ['clear_debt_for_selected_retailnetworks']
 
     def clear_debt_for_selected_retailnetworks(self, request, queryset):
-        transactions_to_clear = Transaction.objects.filter(buyer_retail_network__in=queryset)
-        transactions_to_clear.update(debt=0)
+        job = enqueue('clear_debt', {'buyer_field': 'buyer_retail_network',
+                                     'buyer_ids': list(queryset.values_list('pk', flat=True))}, owner=request.user)
+        self.message_user(request, f'Задача поставлена в очередь: {job}')
 
     clear_debt_for_selected_retailnetworks.short_description = "Обнулить задолжность перед поставщиком"
 
 
 @admin.register(IndividualEntrepreneur)
-class IndividualEntrepreneurAdmin(admin.ModelAdmin):
+class IndividualEntrepreneurAdmin(PrefixAutocompleteMixin, admin.ModelAdmin):
     """ Индивидуальный предприниматель """
     list_display = ('name', 'email', 'country', 'city', 'level', 'get_supplier_link', 'total_debt')
-    search_fields = ('name', 'city')
-    list_filter = ('city', )
+    search_fields = ('name', 'city__name')
+    list_filter = (('country', FacetFilter), ('city', AutocompleteFilter), ('level', FacetFilter))
+    list_select_related = ('country', 'city')
+    autocomplete_fields = ('country', 'city')
+    form = AddressAdminForm
 
     def level(self, obj):
         return obj.level
@@ -129,8 +172,9 @@ class IndividualEntrepreneurAdmin(admin.ModelAdmin):
     actions = ['clear_debt_for_selected_individualentrepreneur']
 
     def clear_debt_for_selected_individualentrepreneur(self, request, queryset):
-        transactions_to_clear = Transaction.objects.filter(buyer_individual_entrepreneur__in=queryset)
-        transactions_to_clear.update(debt=0)
+        job = enqueue('clear_debt', {'buyer_field': 'buyer_individual_entrepreneur',
+                                     'buyer_ids': list(queryset.values_list('pk', flat=True))}, owner=request.user)
+        self.message_user(request, f'Задача поставлена в очередь: {job}')
 
     clear_debt_for_selected_individualentrepreneur.short_description = "Обнулить задолжность перед поставщиком"
 
@@ -148,10 +192,13 @@ class ProductAdmin(admin.ModelAdmin):
     get_supplier_levels.short_description = 'Уровни поставщиков'
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
+        # уровни поставщиков всей страницы загружаются тремя запросами, а не отдельно для каждого продукта
+        qs = super().get_queryset(request).select_related('manufacturer').prefetch_related(
+            Prefetch('retailers', queryset=RetailNetwork.objects.only('id', 'level')),
+            Prefetch('entrepreneurs', queryset=IndividualEntrepreneur.objects.only('id', 'level')),
+        )
         if not request.user.is_superuser:
-            qs = qs.filter(manufacturer_user=request.user) | qs.filter(retailers_user=request.user) | qs.filter(
-                entrepreneurs_user=request.user)
+            qs = qs.filter(owner=request.user)
         return qs
 
     def save_model(self, request, obj, form, change):
@@ -160,13 +207,18 @@ class ProductAdmin(admin.ModelAdmin):
 
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     """ Транзакция """
-    list_display = ('product', 'get_seller', 'get_buyer', 'amount', 'debt', 'get_created_at')
+    list_display = ('product', 'get_seller', 'get_buyer', 'amount', 'debt', 'created_at')
     search_fields = ('product__name', 'seller_manufacturer__name', 'buyer_manufacturer__name')
-    list_filter = ('product__created_at', 'seller_manufacturer', 'seller_retail_network',
-                   'seller_individual_entrepreneur', 'buyer_manufacturer', 'buyer_retail_network',
-                   'buyer_individual_entrepreneur')
+    list_filter = ('created_at', ('seller_manufacturer', AutocompleteFilter),
+                   ('seller_retail_network', AutocompleteFilter), ('seller_individual_entrepreneur', AutocompleteFilter),
+                   ('buyer_manufacturer', AutocompleteFilter), ('buyer_retail_network', AutocompleteFilter),
+                   ('buyer_individual_entrepreneur', AutocompleteFilter))
+    list_select_related = ('product', 'seller_manufacturer', 'seller_retail_network', 'seller_individual_entrepreneur',
+                           'buyer_manufacturer', 'buyer_retail_network', 'buyer_individual_entrepreneur')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def save_model(self, request, obj, form, change):
         obj.owner = request.user
@@ -200,15 +252,45 @@ class TransactionAdmin(admin.ModelAdmin):
         else:
             return "Unknown Buyer"
 
-    def get_created_at(self, obj):
-        return obj.product.created_at
-
     get_seller.short_description = 'Продавец'
     get_buyer.short_description = 'Покупатель'
-    get_created_at.short_description = 'Дата создания'
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if not request.user.is_superuser:
-            qs = qs.filter(seller_user=request.user) | qs.filter(buyer_user=request.user)
+            qs = qs.filter(counterparty_filter(owner=request.user))
         return qs
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """ Фоновая задача """
+    list_display = ('name', 'status', 'get_progress', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('name', 'params', 'status', 'cursor', 'processed', 'total', 'attempts', 'cancel_requested',
+                       'error', 'run_after', 'locked_at', 'created_at', 'finished_at')
+    exclude = ('max_attempts',)
+
+    def get_progress(self, obj):
+        return f'{obj.get_progress()}% ({obj.processed} из {obj.total if obj.total is not None else "?"})'
+
+    get_progress.short_description = 'Прогресс'
+
+    def has_add_permission(self, request):
+        return False
+
+    actions = ['cancel_jobs', 'retry_jobs']
+
+    def cancel_jobs(self, request, queryset):
+        queryset.filter(status=Job.STATUS_PENDING).update(status=Job.STATUS_CANCELLED, finished_at=timezone.now())
+        queryset.filter(status=Job.STATUS_RUNNING).update(cancel_requested=True)
+
+    cancel_jobs.short_description = "Отменить выбранные задачи"
+
+    def retry_jobs(self, request, queryset):
+        queryset.filter(status__in=[Job.STATUS_FAILED, Job.STATUS_CANCELLED]).update(
+            status=Job.STATUS_PENDING, cancel_requested=False, attempts=0, run_after=timezone.now(),
+            finished_at=None)
+
+    retry_jobs.short_description = "Перезапустить выбранные задачи с места остановки"
+
@@ -0,0 +1,115 @@
+""" Фильтры админ-панели electronics_network с ленивой подгрузкой вариантов """
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.forms import Media
+from django.urls import reverse
+from django.utils.translation import gettext_lazy as _
+
+from electronics_network import facets
+
+AUTOCOMPLETE_LIMIT = 20
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """ Фильтр по внешнему ключу через autocomplete админки.
+
+    В отличие от RelatedFieldListFilter не выводит все связанные объекты: варианты подгружаются
+    при вводе через admin:autocomplete (префиксный поиск связанной админки), а на странице
+    загружается только выбранный объект.
+    """
+    template = 'admin/electronics_network/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = self.get_lookup_kwarg(field, field_path)
+        self.lookup_val = params.get(self.lookup_kwarg)
+        self.model_admin = model_admin
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def get_lookup_kwarg(self, field, field_path):
+        return f'{field_path}__{field.target_field.attname}__exact'
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        return {}
+
+    def get_autocomplete_url(self):
+        return reverse('admin:autocomplete', current_app=self.model_admin.admin_site.name)
+
+    def get_autocomplete_attrs(self):
+        opts = self.model_admin.model._meta
+        return {'app-label': opts.app_label, 'model-name': opts.model_name, 'field-name': self.field.name}
+
+    def get_selected_display(self, value):
+        return self.field.related_model._default_manager.filter(pk=value).first()
+
+    def choices(self, changelist):
+        value = self.lookup_val[-1] if self.lookup_val else None
+        selected = self.get_selected_display(value) if value else None
+        yield {
+            'selected': value is not None,
+            'value': value,
+            'display': str(selected) if selected is not None else value,
+            'lookup_kwarg': self.lookup_kwarg,
+            'base_query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'autocomplete_url': self.get_autocomplete_url(),
+            'autocomplete_attrs': self.get_autocomplete_attrs(),
+        }
+
+
+class FacetFilter(admin.FieldListFilter):
+    """ Фильтр по значениям фасета с числом объектов.
+
+    Варианты и счётчики берутся из кэша facets.get_facets — тех же, что отдаёт <ресурс>/facets/,
+    поэтому страница списка не выполняет групповых запросов по всей таблице.
+    """
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = (f'{field_path}__{field.target_field.attname}__exact' if field.is_relation
+                             else f'{field_path}__exact')
+        self.lookup_val = params.get(self.lookup_kwarg)
+        self.facet_values = facets.get_facets(model, facets.scope_for(request.user)).get(field_path, [])
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        return {}
+
+    def choices(self, changelist):
+        yield {
+            'selected': not self.lookup_val,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': _('All'),
+        }
+        for item in self.facet_values:
+            value = str(item['value'])
+            yield {
+                'selected': bool(self.lookup_val) and value in self.lookup_val,
+                'query_string': changelist.get_query_string({self.lookup_kwarg: value}),
+                'display': f"{item['label']} ({item['count']})",
+            }
+
+
+class AutocompleteFilterMixin:
+    """ Подключает select2 и скрипт фильтров AutocompleteFilter к странице списка """
+
+    @property
+    def media(self):
+        return (super().media + AutocompleteSelect(None, self.admin_site).media
+                + Media(js=['electronics_network/admin/autocomplete_filter.js']))
+
+
+class PrefixAutocompleteMixin(AutocompleteFilterMixin):
+    """ Префиксный поиск в autocomplete админки: по индексу вместо icontains по всей таблице """
+    autocomplete_search_field = 'name__istartswith'
+
+    def get_search_results(self, request, queryset, search_term):
+        match = request.resolver_match
+        if match is not None and match.url_name == 'autocomplete':
+            if search_term:
+                queryset = queryset.filter(**{self.autocomplete_search_field: search_term})
+            return queryset.order_by(self.autocomplete_search_field.split('__')[0], 'pk'), False
+        return super().get_search_results(request, queryset, search_term)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ElectronicsNetworkConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'electronics_network'
+
+    def ready(self):
+        import electronics_network.signals  # noqa: F401
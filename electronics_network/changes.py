@@ -0,0 +1,157 @@
+""" Журнал изменений и лента /changes/ для инкрементальной синхронизации
+
+Создание, изменение и удаление объекта сети пишет строку Change. Каскадное удаление через on_delete=CASCADE
+тоже оставляет надгробия: пока на модели есть получатели post_delete, Django удаляет связанные строки
+по одной и отправляет сигнал для каждой. Изменения через QuerySet.update() учитываются явным вызовом
+record_updates рядом с update(). Лента отдаёт изменения после курсора, поэтому стоимость чтения
+пропорциональна числу изменений, а не размеру таблиц.
+
+Порядок ленты — (txid, id). id выдаётся при вставке, а строка видна после фиксации транзакции, поэтому
+запись долгой транзакции может появиться позже записей с большим id. На PostgreSQL каждая запись хранит
+номер своей транзакции, а лента отдаёт только записи транзакций старше самой старой незавершённой (xmin
+снимка): записей с меньшим номером появиться уже не может. SQLite выполняет записывающие транзакции
+по одной, там txid = 0 и достаточно порядка id.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+
+from django.db import connection, connections, router
+from django.db.models import Exists, Max, OuterRef, Q
+from django.db.models.expressions import RawSQL
+
+from electronics_network.fastpath import serialize_rows
+from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction, \
+    Payment, Change
+from electronics_network.serializers import ManufacturerSerializer, RetailNetworkReadSerializer, \
+    IndividualEntrepreneurReadSerializer, ProductSerializer, TransactionReadSerializer, PaymentSerializer
+
+# ресурс ленты: модель и сериализатор, которым отдаётся текущее состояние объекта
+RESOURCES = {
+    'manufacturer': (Manufacturer, ManufacturerSerializer),
+    'retail_network': (RetailNetwork, RetailNetworkReadSerializer),
+    'individual_entrepreneur': (IndividualEntrepreneur, IndividualEntrepreneurReadSerializer),
+    'product': (Product, ProductSerializer),
+    'transaction': (Transaction, TransactionReadSerializer),
+    'payment': (Payment, PaymentSerializer),
+}
+RESOURCE_NAMES = {model: name for name, (model, _) in RESOURCES.items()}
+CURSOR_PREFIX = 'c1'
+
+
+def current_txid():
+    """ Номер текущей транзакции для вставки: выражение PostgreSQL, на других СУБД 0 """
+    if connection.vendor != 'postgresql':
+        return 0
+    return RawSQL('pg_current_xact_id()::text::bigint', [])
+
+
+def record(instance, action):
+    Change.objects.create(resource=RESOURCE_NAMES[type(instance)], object_id=instance.pk, action=action,
+                          owner_id=instance.owner_id, txid=current_txid())
+
+
+def record_updates(queryset):
+    """ Учесть изменение строк через QuerySet.update(), которое не отправляет post_save """
+    resource = RESOURCE_NAMES[queryset.model]
+    rows = list(queryset.order_by().values_list('pk', 'owner_id'))
+    if not rows:
+        return
+    txid = current_txid()
+    Change.objects.bulk_create([
+        Change(resource=resource, object_id=pk, action=Change.ACTION_UPDATED, owner_id=owner_id, txid=txid)
+        for pk, owner_id in rows
+    ])
+
+
+def _after(position):
+    """ Условие «запись не раньше позиции (txid, id)» """
+    txid, change_id = position
+    return Q(txid__gt=txid) | Q(txid=txid, id__gte=change_id)
+
+
+def compact():
+    """ Удалить записи, после которых в порядке ленты у объекта есть более новая запись.
+
+    Лента с любого курсора после сжатия отдаёт то же итоговое состояние: последняя запись объекта остаётся,
+    а текущее состояние объекта лента всё равно читает из его таблицы.
+    """
+    newer = Change.objects.filter(
+        Q(txid__gt=OuterRef('txid')) | Q(txid=OuterRef('txid'), id__gt=OuterRef('id')),
+        resource=OuterRef('resource'), object_id=OuterRef('object_id'),
+    )
+    deleted, _ = Change.objects.filter(Exists(newer)).delete()
+    return deleted
+
+
+def encode_cursor(position):
+    return urlsafe_b64encode(f'{CURSOR_PREFIX}:{position[0]}:{position[1]}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """ Позиция (txid, id) из непрозрачного курсора; ValueError для чужой строки """
+    if not cursor:
+        return 0, 0
+    try:
+        parts = urlsafe_b64decode(cursor.encode()).decode().split(':')
+    except (Base64Error, UnicodeError):
+        raise ValueError(cursor)
+    if len(parts) != 3 or parts[0] != CURSOR_PREFIX or not all(part.isdigit() for part in parts[1:]):
+        raise ValueError(cursor)
+    return int(parts[1]), int(parts[2])
+
+
+def visible_horizon(using=None):
+    """ Позиция, раньше которой новых записей уже не появится: все записывающие их транзакции завершены """
+    using = using or router.db_for_read(Change)
+    if connections[using].vendor == 'postgresql':
+        with connections[using].cursor() as cursor:
+            cursor.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')
+            return cursor.fetchone()[0], 0
+    return 0, (Change.objects.using(using).aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+def read_changes(user, position=(0, 0), resources=None, limit=100):
+    """ Изменения начиная с позиции: (элементы ленты, позиция продолжения, есть ли ещё).
+
+    Несколько изменений одного объекта сворачиваются в одно с его текущим состоянием.
+    Объект, который уже удалён или стал недоступен пользователю, отдаётся как удалённый.
+    """
+    # горизонт и записи читаются из одной базы: реплика может отставать от основной
+    using = router.db_for_read(Change)
+    horizon = visible_horizon(using)
+    queryset = Change.objects.using(using).filter(_after(position)).exclude(_after(horizon)).order_by('txid', 'id')
+    if resources:
+        queryset = queryset.filter(resource__in=resources)
+    if not user.is_superuser:
+        queryset = queryset.filter(owner=user)
+    entries = list(queryset.values_list('txid', 'id', 'resource', 'object_id', 'action')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    # без продолжения позиция сдвигается к горизонту: чужие и отфильтрованные записи не читаются повторно
+    next_position = (entries[-1][0], entries[-1][1] + 1) if has_more else max(position, horizon)
+
+    changed = {}
+    for _, _, resource, object_id, action in entries:
+        key = (resource, object_id)
+        created = action == Change.ACTION_CREATED or changed.get(key) == Change.ACTION_CREATED
+        changed.pop(key, None)
+        changed[key] = action if action == Change.ACTION_DELETED or not created else Change.ACTION_CREATED
+
+    current = {}
+    for resource, (model, serializer_class) in RESOURCES.items():
+        ids = [object_id for (name, object_id), action in changed.items()
+               if name == resource and action != Change.ACTION_DELETED]
+        if not ids:
+            continue
+        objects = model._default_manager.filter(pk__in=ids)
+        if not user.is_superuser:
+            objects = objects.filter(owner=user)
+        rows = serialize_rows(serializer_class(many=True), objects)
+        current.update({(resource, pk): data for pk, data in rows.items()})
+
+    results = []
+    for key, action in changed.items():
+        data = current.get(key)
+        results.append({'resource': key[0], 'id': key[1],
+                        'action': action if data is not None else Change.ACTION_DELETED, 'data': data})
+    return results, next_position, has_more
@@ -0,0 +1,138 @@
+""" Долг нижестоящих покупателей по производителям: отчёт по сети, посчитанный пулом процессов
+
+Для каждого производителя суммируется непогашенный долг (Transaction.debt) покупателей из его дерева:
+розничных сетей первого и второго уровня и ИП, в том числе подключённых через сеть (RetailNetwork.retail_network).
+Производители по возрастанию id делятся на части, каждая часть считается в процессе пула двумя групповыми
+запросами — по сетям и по ИП; производитель в корне дерева покупателя вычисляется в запросе по цепочке
+поставщиков (Coalesce). Результаты частей объединяются в порядке производителей.
+
+Процессы пула запускаются через spawn и открывают свои соединения с базой. На PostgreSQL родительский процесс
+экспортирует снимок своей транзакции (pg_export_snapshot), и процессы пула читают тот же снимок, поэтому
+отчёт согласован, хотя части считаются в разных соединениях. Внутри открытой транзакции (её изменения
+другим соединениям не видны), на базе SQLite в памяти и при workers=1 отчёт считается в текущем процессе.
+Представление API всегда передаёт workers=1, пул процессов запускает команда debt_exposure_report.
+
+Процессы пула импортируют модуль до django.setup(), поэтому модели получаются через apps.get_model.
+"""
+import csv
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import partial, reduce
+from operator import or_
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+# пути от покупателя до производителя: сеть первого уровня, сеть второго уровня, ИП у сети второго уровня
+ROOT_PATHS = {
+    'retail_network': ('manufacturer', 'retail_network__manufacturer'),
+    'individual_entrepreneur': ('manufacturer', 'retail_network__manufacturer',
+                                'retail_network__retail_network__manufacturer'),
+}
+COLUMNS = ('manufacturer', 'name', 'retail_networks_debt', 'entrepreneurs_debt', 'debt', 'debtors')
+# частей на процесс: процесс, которому достались крупные деревья, не задерживает весь отчёт
+PARTITIONS_PER_WORKER = 4
+
+
+@contextmanager
+def _snapshot_transaction(alias, snapshot=None):
+    """ Транзакция REPEATABLE READ на PostgreSQL с импортом снимка snapshot или экспортом своего; отдаёт id снимка """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql' or connection.in_atomic_block:
+        yield snapshot
+        return
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        if snapshot:
+            cursor.execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+        else:
+            cursor.execute('SELECT pg_export_snapshot()')
+            snapshot = cursor.fetchone()[0]
+        yield snapshot
+
+
+def partition_exposure(manufacturer_ids, alias, owner_id=None, snapshot=None):
+    """ Долг покупателей в деревьях производителей части: {id: [долг сетей, долг ИП, число должников]} """
+    transaction_model = apps.get_model('electronics_network', 'Transaction')
+    transactions = transaction_model.objects.using(alias).filter(debt__gt=0)
+    if owner_id is not None:
+        transactions = transactions.filter(owner_id=owner_id)
+    result = {pk: [Decimal('0.00'), Decimal('0.00'), 0] for pk in manufacturer_ids}
+    with _snapshot_transaction(alias, snapshot):
+        for position, (node, paths) in enumerate(ROOT_PATHS.items()):
+            buyer = f'buyer_{node}'
+            buyers = transaction_model._meta.get_field(buyer).related_model.objects.using(alias).filter(
+                reduce(or_, (Q(**{f'{path}__in': manufacturer_ids}) for path in paths)))
+            rows = (transactions.filter(**{f'{buyer}__in': buyers.values('pk')})
+                    .values(root=Coalesce(*(f'{buyer}__{path}' for path in paths)))
+                    .annotate(debt=Sum('debt'), debtors=Count(buyer, distinct=True)).order_by())
+            for row in rows:
+                if row['root'] in result:
+                    result[row['root']][position] += row['debt']
+                    result[row['root']][2] += row['debtors']
+    return result
+
+
+def _init_worker(alias, name):
+    django.setup()
+    # имя базы родительского процесса: в тестах это тестовая база
+    settings.DATABASES[alias]['NAME'] = name
+
+
+def _partitions(ids, count):
+    size = max(-(-len(ids) // count), 1)
+    return [ids[start:start + size] for start in range(0, len(ids), size)]
+
+
+def report(owner_id=None, workers=None):
+    """ Строки отчёта (COLUMNS) по производителям владельца (None — всей сети) в порядке id """
+    manufacturer_model = apps.get_model('electronics_network', 'Manufacturer')
+    alias = router.db_for_read(manufacturer_model)
+    connection = connections[alias]
+    workers = workers or settings.DEBT_EXPOSURE_WORKERS or os.cpu_count()
+    if connection.in_atomic_block or (connection.vendor == 'sqlite' and connection.is_in_memory_db()):
+        workers = 1
+
+    with _snapshot_transaction(alias) as snapshot:
+        manufacturers = manufacturer_model.objects.using(alias).order_by('pk')
+        if owner_id is not None:
+            manufacturers = manufacturers.filter(owner_id=owner_id)
+        names = dict(manufacturers.values_list('pk', 'name'))
+        count = 1 if workers == 1 else workers * PARTITIONS_PER_WORKER
+        partitions = _partitions(list(names), count)
+        if workers == 1 or len(partitions) < 2:
+            results = [partition_exposure(ids, alias, owner_id) for ids in partitions]
+        else:
+            with ProcessPoolExecutor(min(workers, len(partitions)), mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_init_worker,
+                                     initargs=(alias, connection.settings_dict['NAME'])) as executor:
+                results = list(executor.map(partial(partition_exposure, alias=alias, owner_id=owner_id,
+                                                    snapshot=snapshot), partitions))
+
+    exposure = {pk: values for result in results for pk, values in result.items()}
+    rows = []
+    for pk, name in names.items():
+        retail_networks_debt, entrepreneurs_debt, debtors = exposure[pk]
+        rows.append({'manufacturer': pk, 'name': name, 'retail_networks_debt': retail_networks_debt,
+                     'entrepreneurs_debt': entrepreneurs_debt, 'debt': retail_networks_debt + entrepreneurs_debt,
+                     'debtors': debtors})
+    return rows
+
+
+def write_csv(rows, file):
+    writer = csv.DictWriter(file, COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def write_json(rows, file):
+    json.dump(rows, file, cls=DjangoJSONEncoder, ensure_ascii=False, indent=2)
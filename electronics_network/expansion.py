@@ -0,0 +1,129 @@
+""" Раскрытие связей: ?expand=manufacturer,retail_network,product.retailers
+
+Связь из expandable_fields сериализатора выводится полным вложенным объектом вместо наименования или строки,
+через точку раскрываются связи вложенного объекта. JOIN'ы и prefetch_related строятся по дереву
+раскрытых сериализаторов, поэтому страница читается фиксированным числом запросов при любом числе строк.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField
+
+EXPAND_PARAM = 'expand'
+
+
+def parse_expand(value):
+    """ 'product.retailers,manufacturer' -> {'product': {'retailers': {}}, 'manufacturer': {}} """
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def get_expand_tree(request):
+    """ Дерево раскрываемых связей из параметра GET-запроса или None """
+    if request is None or request.method != 'GET':
+        return None
+    value = request.query_params.get(EXPAND_PARAM)
+    return parse_expand(value) if value is not None else None
+
+
+class ExpandableSerializerMixin:
+    """ Заменить поля из ?expand= полными сериализаторами из expandable_fields.
+
+    expandable_fields — {поле: класс сериализатора или его имя в модуле сериализатора}.
+    Вложенный сериализатор получает поддерево через аргумент expand.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if expand is None:
+            expand = get_expand_tree(self.context.get('request'))
+        if not expand:
+            return
+        unknown = set(expand) - set(self.expandable_fields)
+        if unknown:
+            raise serializers.ValidationError({EXPAND_PARAM: f"Нельзя раскрыть: {', '.join(sorted(unknown))}"})
+        for name, subtree in expand.items():
+            if name not in self.fields:
+                continue
+            many = isinstance(self.fields[name], (serializers.ListSerializer, ManyRelatedField))
+            self.fields[name] = self.get_expanded_class(name)(read_only=True, many=many, expand=subtree)
+
+    def get_expanded_class(self, name):
+        serializer_class = self.expandable_fields[name]
+        if isinstance(serializer_class, str):
+            if '.' not in serializer_class:
+                serializer_class = f'{type(self).__module__}.{serializer_class}'
+            serializer_class = import_string(serializer_class)
+        return serializer_class
+
+
+def _prefixed(prefix, lookup):
+    if isinstance(lookup, Prefetch):
+        return Prefetch(f'{prefix}__{lookup.prefetch_through}', queryset=lookup.queryset)
+    return f'{prefix}__{lookup}'
+
+
+def _apply(queryset, select_related, prefetch):
+    # Prefetch с queryset и строка с тем же путём несовместимы: строка уже покрыта объектом Prefetch
+    planned = {lookup.prefetch_to for lookup in prefetch if isinstance(lookup, Prefetch)}
+    prefetch = [lookup for lookup in prefetch if isinstance(lookup, Prefetch) or lookup not in planned]
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if select_related:
+        queryset = queryset.select_related(*dict.fromkeys(select_related))
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def plan_lookups(serializer, model):
+    """ select_related и prefetch_related, которые читает serializer: (список путей, список lookup'ов) """
+    select_related, prefetch = [], []
+    values_fields = getattr(serializer, 'values_fields', {})
+    for name, field in serializer.fields.items():
+        if name in values_fields:
+            # поле-метод: связи известны из описания для режима values
+            values_field = values_fields[name]
+            select_related.extend(column.rsplit('__', 1)[0] for column in values_field.columns if '__' in column)
+            prefetch.extend(values_field.many)
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation or isinstance(field, PrimaryKeyRelatedField):
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            child_select, child_prefetch = plan_lookups(field.child, model_field.related_model)
+            prefetch.append(Prefetch(field.source, queryset=_apply(
+                model_field.related_model._default_manager.all(), child_select, child_prefetch)))
+        elif isinstance(field, ManyRelatedField):
+            prefetch.append(field.source)
+        elif isinstance(field, (serializers.BaseSerializer, RelatedField)):
+            child_select, child_prefetch = plan_lookups(field, model_field.related_model) \
+                if isinstance(field, serializers.BaseSerializer) else ([], [])
+            select_related.append(field.source)
+            select_related.extend(f'{field.source}__{path}' for path in child_select)
+            prefetch.extend(_prefixed(field.source, lookup) for lookup in child_prefetch)
+    return select_related, prefetch
+
+
+def plan_queryset(queryset, serializer):
+    """ Заменить связи queryset на те, что читает serializer с раскрытыми полями """
+    return _apply(queryset, *plan_lookups(serializer, queryset.model))
+
+
+class ExpandViewMixin:
+    """ ?expand= для GenericAPIView: сериализатор — ExpandableSerializerMixin, связи queryset — по его полям """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not get_expand_tree(self.request):
+            return queryset
+        return plan_queryset(queryset, self.get_serializer())
@@ -0,0 +1,143 @@
+""" Счётчики фасетов для панелей фильтров: число звеньев сети и продуктов по стране, городу, уровню и поставщику
+
+GET <ресурс>/facets/ отдаёт {фасет: [{"value", "label", "count"}]} по объектам владельца (у суперпользователя —
+по всей сети); те же счётчики выводят фильтры админ-панели. Каждый фасет считается одним групповым запросом,
+результат кэшируется на FACETS_CACHE_SECONDS. Ключ кэша содержит поколение владельца: сохранение и удаление
+объекта сети сдвигают поколение его владельца и поколение всей сети, поэтому после записи счётчики
+строятся заново. Изменения через QuerySet.update() и переименования в справочниках стран и городов
+видны после истечения срока кэша.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Value, When
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, NetworkNode
+
+ALL = 'all'
+NO_SUPPLIER = 'none'
+SUPPLIER_TYPES = {**dict(NetworkNode.KIND_CHOICES), NO_SUPPLIER: 'без поставщика'}
+
+
+class Facet:
+    """ Фасет по колонке: value — значение группировки, label — колонка подписи (по умолчанию само значение) """
+
+    def __init__(self, value, label=None, labels=None):
+        self.value = F(value) if isinstance(value, str) else value
+        self.label = F(label) if label else None
+        self.labels = labels or {}
+
+    def counts(self, queryset):
+        columns = {'value': self.value, **({'label': self.label} if self.label is not None else {})}
+        rows = queryset.order_by().values(**columns).annotate(count=Count('pk'))
+        return [{'value': row['value'], 'label': row.get('label', self.labels.get(row['value'], row['value'])),
+                 'count': row['count']} for row in rows if row['value'] is not None]
+
+
+class FlagsFacet(Facet):
+    """ Фасет, в котором объект может попасть в несколько значений: {значение: условие}, один агрегирующий запрос """
+
+    def __init__(self, conditions, labels=None):
+        super().__init__(None, labels=labels)
+        self.conditions = conditions
+
+    def counts(self, queryset):
+        totals = queryset.order_by().aggregate(**{f'f{index}': Count('pk', filter=condition)
+                                                  for index, condition in enumerate(self.conditions.values())})
+        return [{'value': value, 'label': self.labels.get(value, value), 'count': totals[f'f{index}']}
+                for index, value in enumerate(self.conditions) if totals[f'f{index}']]
+
+
+def _supplier_type():
+    return Case(When(manufacturer__isnull=False, then=Value(NetworkNode.KIND_MANUFACTURER)),
+                When(retail_network__isnull=False, then=Value(NetworkNode.KIND_RETAIL_NETWORK)),
+                default=Value(NO_SUPPLIER))
+
+
+def _supplied(relation, **lookup):
+    """ У продукта есть поставщик через M2M-связь relation с условием lookup """
+    through = Product._meta.get_field(relation).remote_field.through
+    target = Product._meta.get_field(relation).m2m_reverse_field_name()
+    return Q(Exists(through.objects.filter(product=OuterRef('pk'),
+                                           **{f'{target}__{key}': value for key, value in lookup.items()})))
+
+
+def _node_facets(supplier_type=True):
+    facets = {
+        'country': Facet('country', 'country__name'),
+        'city': Facet('city', 'city__name'),
+        'level': Facet('level'),
+    }
+    if supplier_type:
+        facets['supplier_type'] = Facet(_supplier_type(), labels=SUPPLIER_TYPES)
+    return facets
+
+
+FACETS = {
+    Manufacturer: _node_facets(supplier_type=False),
+    RetailNetwork: _node_facets(),
+    IndividualEntrepreneur: _node_facets(),
+    # продукт учитывается в каждом уровне и типе своих поставщиков
+    Product: {
+        'country': Facet('manufacturer__country', 'manufacturer__country__name'),
+        'city': Facet('manufacturer__city', 'manufacturer__city__name'),
+        'level': FlagsFacet({level: Q(manufacturer__isnull=False) if level == 0
+                             else _supplied('retailers', level=level) | _supplied('entrepreneurs', level=level)
+                             for level in (0, 1, 2)}),
+        'supplier_type': FlagsFacet({
+            NetworkNode.KIND_MANUFACTURER: Q(manufacturer__isnull=False),
+            NetworkNode.KIND_RETAIL_NETWORK: _supplied('retailers'),
+            NetworkNode.KIND_INDIVIDUAL_ENTREPRENEUR: _supplied('entrepreneurs'),
+        }, labels=SUPPLIER_TYPES),
+    },
+}
+
+
+def scope_for(user):
+    """ Область счётчиков пользователя: вся сеть для суперпользователя, иначе его объекты """
+    return ALL if user.is_superuser else user.pk
+
+
+def _generation_key(scope):
+    return f'facets_generation:{scope}'
+
+
+def invalidate(owner_id):
+    """ Сбросить счётчики владельца и всей сети после записи """
+    for scope in (owner_id, ALL):
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def build_facets(model, scope):
+    """ Счётчики всех фасетов модели по области, по запросу на фасет """
+    queryset = model._default_manager.all()
+    if scope != ALL:
+        queryset = queryset.filter(owner_id=scope)
+    result = {}
+    for name, facet in FACETS[model].items():
+        result[name] = sorted(facet.counts(queryset), key=lambda item: (-item['count'], str(item['label'])))
+    return result
+
+
+def get_facets(model, scope):
+    """ Счётчики фасетов модели из кэша; при смене поколения области строятся заново """
+    generation = cache.get(_generation_key(scope), 0)
+    key = f'facets:{model._meta.label_lower}:{scope}:{generation}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = build_facets(model, scope)
+        cache.set(key, facets, settings.FACETS_CACHE_SECONDS)
+    return facets
+
+
+class FacetsViewMixin:
+    """ Действие facets для GenericViewSet """
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request, *args, **kwargs):
+        return Response(get_facets(self.get_queryset().model, scope_for(request.user)))
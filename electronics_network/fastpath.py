@@ -0,0 +1,232 @@
+""" Режим values для списков: ответ строится из словарей QuerySet.values() без экземпляров моделей
+
+По полям сериализатора один раз составляется план: какие колонки выбрать через values(), какие связи
+догрузить отдельными запросами по id и какой функцией превратить значение в представление.
+Представления значений дают те же функции to_representation полей DRF, поэтому ответ совпадает
+с обычным ModelSerializer байт в байт. Если поле не сводится к колонкам (метод модели без описания
+в values_fields сериализатора, source='*', SerializerMethodField), план не строится и список
+сериализуется как обычно.
+"""
+from collections import defaultdict
+from functools import partial
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField, StringRelatedField
+from rest_framework.response import Response
+
+from config.tracing import TracedListSerializer, span
+from electronics_network.pagination import CountedPaginator
+
+
+class ValuesField:
+    """ Описание поля для режима values, которое читает не колонку модели, а метод.
+
+    columns — колонки строки, many — {M2M-связь: колонки связанных строк},
+    build(row, many) — значение поля до to_representation.
+    """
+
+    def __init__(self, build, columns=(), many=None):
+        self.build = build
+        self.columns = tuple(columns)
+        self.many = many or {}
+
+
+class UnsupportedField(Exception):
+    """ Поле нельзя вывести из values() """
+
+
+def _identity(value):
+    return value
+
+
+def _value_mapper(field):
+    """ Функция представления значения без None; для строк и чисел из базы — без преобразований """
+    if isinstance(field, (serializers.CharField, serializers.IntegerField)) and not isinstance(
+            field, serializers.ChoiceField):
+        return _identity
+    if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+        return _identity
+    if isinstance(field, serializers.ListField):
+        child = _value_mapper(field.child)
+        return lambda values: [child(value) if value is not None else None for value in values]
+    return field.to_representation
+
+
+class RowPlan:
+    """ План построения представления из строки values() для одной модели """
+
+    def __init__(self, serializer, model, prefix=''):
+        self.model = model
+        self.prefix = prefix
+        self.columns = []
+        # (имя поля, функция строки -> представление)
+        self.mappers = []
+        # связь -> набор колонок связанных строк (M2M)
+        self.many = defaultdict(set)
+        # FK со строковым представлением: колонка -> модель
+        self.strings = {}
+        values_fields = getattr(serializer, 'values_fields', {})
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if name in values_fields:
+                self._add_values_field(name, field, values_fields[name])
+            else:
+                self._add_field(name, field)
+
+    def column(self, name):
+        column = f'{self.prefix}{name}'
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+    def _model_field(self, source):
+        if source == '*' or '.' in source:
+            raise UnsupportedField(source)
+        try:
+            return self.model._meta.get_field(source)
+        except FieldDoesNotExist:
+            raise UnsupportedField(source)
+
+    def _add_values_field(self, name, field, values_field):
+        if self.prefix and values_field.many:
+            raise UnsupportedField(name)
+        columns = {column: self.column(column) for column in values_field.columns}
+        for relation, relation_columns in values_field.many.items():
+            self._many_relation(relation)
+            self.many[relation].update(relation_columns)
+        represent = _value_mapper(field)
+
+        def mapper(row, related, build=values_field.build):
+            many = {relation: related[relation].get(row[self.pk_column], []) for relation in values_field.many}
+            value = build({column: row[key] for column, key in columns.items()}, many)
+            return represent(value) if value is not None else None
+
+        self.mappers.append((name, mapper))
+
+    def _many_relation(self, name):
+        model_field = self._model_field(name)
+        if not model_field.many_to_many or model_field.auto_created or self.prefix:
+            raise UnsupportedField(name)
+        self.pk_column = self.column('pk')
+        return model_field
+
+    def _add_field(self, name, field):
+        if isinstance(field, serializers.ListSerializer):
+            self._add_many_nested(name, field)
+            return
+        model_field = self._model_field(field.source)
+        if model_field.many_to_many or model_field.one_to_many:
+            raise UnsupportedField(name)
+        column = self.column(field.source)
+
+        if isinstance(field, serializers.BaseSerializer):
+            nested = RowPlan(field, model_field.related_model, prefix=f'{column}__')
+            if nested.many or nested.strings:
+                raise UnsupportedField(name)
+            self.columns.extend(c for c in nested.columns if c not in self.columns)
+            self.mappers.append((name, lambda row, related: nested.represent(row, related)
+                                 if row[column] is not None else None))
+        elif isinstance(field, StringRelatedField):
+            if self.prefix:
+                raise UnsupportedField(name)
+            self.strings[column] = model_field.related_model
+            self.mappers.append((name, lambda row, related: related[column].get(row[column])
+                                 if row[column] is not None else None))
+        elif model_field.is_relation and not isinstance(field, PrimaryKeyRelatedField):
+            raise UnsupportedField(name)
+        else:
+            represent = _value_mapper(field)
+            self.mappers.append((name, lambda row, related: represent(row[column])
+                                 if row[column] is not None else None))
+
+    def _add_many_nested(self, name, field):
+        model_field = self._many_relation(field.source)
+        child = RowPlan(field.child, model_field.related_model)
+        if child.many or child.strings:
+            raise UnsupportedField(name)
+        self.many[field.source].update(child.columns)
+        relation = field.source
+
+        def mapper(row, related):
+            return [child.represent(item, related) for item in related[relation].get(row[self.pk_column], [])]
+
+        self.mappers.append((name, mapper))
+
+    def represent(self, row, related):
+        return {name: mapper(row, related) for name, mapper in self.mappers}
+
+    def load_related(self, rows):
+        """ Догрузить строковые представления FK и строки M2M для страницы: по запросу на связь """
+        related = {}
+        for column, model in self.strings.items():
+            ids = {row[column] for row in rows if row[column] is not None}
+            related[column] = {pk: str(obj) for pk, obj in model._default_manager.in_bulk(ids).items()} \
+                if ids else {}
+        for relation, columns in self.many.items():
+            model_field = self.model._meta.get_field(relation)
+            query_name = model_field.related_query_name()
+            grouped = defaultdict(list)
+            ids = [row[self.pk_column] for row in rows]
+            if ids:
+                items = model_field.related_model._default_manager.filter(**{f'{query_name}__in': ids})
+                for item in items.values(query_name, *sorted(columns)):
+                    grouped[item[query_name]].append(item)
+            related[relation] = grouped
+        return related
+
+
+class ValuesListSerializer(TracedListSerializer):
+    """ ListSerializer, который сериализует страницу словарей values() по плану RowPlan """
+
+    @property
+    def values_plan(self):
+        if not hasattr(self, '_values_plan'):
+            try:
+                self._values_plan = RowPlan(self.child, self.child.Meta.model)
+            except UnsupportedField:
+                self._values_plan = None
+        return self._values_plan
+
+    def values_queryset(self, queryset):
+        queryset = queryset.select_related(None).prefetch_related(None)
+        columns = self.values_plan.columns
+        # pk нужен вызывающему коду (например, batch) даже если поле id не выводится
+        return queryset.values(*columns, *(() if 'pk' in columns else ('pk', )))
+
+    def to_representation(self, data):
+        if not isinstance(data, list) or not data or not isinstance(data[0], dict):
+            return super().to_representation(data)
+        with span('serializer.to_representation', serializer=type(self.child).__name__, many=True, values=True):
+            related = self.values_plan.load_related(data)
+            return [self.values_plan.represent(row, related) for row in data]
+
+
+def serialize_rows(serializer, queryset):
+    """ Представления объектов queryset сериализатором списка: {pk: данные}; через values(), если план строится """
+    if isinstance(serializer, ValuesListSerializer) and serializer.values_plan is not None:
+        queryset = serializer.values_queryset(queryset)
+    serializer.instance = list(queryset)
+    pks = [row['pk'] if isinstance(row, dict) else row.pk for row in serializer.instance]
+    return dict(zip(pks, serializer.data))
+
+
+class ValuesListViewMixin:
+    """ list() для ModelViewSet: при поддержке сериализатором страница читается через values() """
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer(many=True)
+        if not isinstance(serializer, ValuesListSerializer) or serializer.values_plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is not None:
+            # колонки связей из values() добавили бы JOIN'ы и в COUNT(*); строк столько же, сколько в выборке
+            self.paginator.django_paginator_class = partial(CountedPaginator, count_queryset=queryset)
+        queryset = serializer.values_queryset(queryset)
+        page = self.paginate_queryset(queryset)
+        serializer.instance = list(page if page is not None else queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
@@ -0,0 +1,122 @@
+""" Разреженные наборы полей: ?fields=id,name,level и ?exclude=email,street для эндпоинтов чтения
+
+Сериализатор отдаёт только запрошенные поля, а queryset выбирает только их колонки и связи:
+колонки ограничиваются через only(), ненужные select_related и prefetch_related убираются,
+а связи, которые выводятся вложенным сериализатором или строкой, подтягиваются одним JOIN.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+
+def get_sparse_params(request):
+    """ Запрошенные и исключённые поля из параметров GET-запроса: (set или None, set или None) """
+    if request is None or request.method != 'GET':
+        return None, None
+    requested, excluded = (request.query_params.get(param) for param in (FIELDS_PARAM, EXCLUDE_PARAM))
+    return (
+        {name for name in requested.split(',') if name} if requested is not None else None,
+        {name for name in excluded.split(',') if name} if excluded is not None else None,
+    )
+
+
+class SparseFieldsSerializerMixin:
+    """ Оставить в сериализаторе верхнего уровня только поля из ?fields= без полей из ?exclude= """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested, excluded = get_sparse_params(self.context.get('request'))
+        if requested is None and excluded is None:
+            return
+        unknown = ((requested or set()) | (excluded or set())) - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({FIELDS_PARAM: f"Неизвестные поля: {', '.join(sorted(unknown))}"})
+        for name in list(self.fields):
+            if (requested is not None and name not in requested) or (excluded and name in excluded):
+                self.fields.pop(name)
+
+
+def _nested_columns(relation, serializer_field):
+    """ Колонки связанной модели, которые читает вложенный сериализатор, или None — нужна вся строка """
+    if not isinstance(serializer_field, serializers.ModelSerializer):
+        return None
+    related_model = serializer_field.Meta.model
+    columns = []
+    values_fields = getattr(serializer_field, 'values_fields', {})
+    for name, field in serializer_field.fields.items():
+        if name in values_fields and not values_fields[name].many:
+            columns.extend(f'{relation}__{column}' for column in values_fields[name].columns)
+            continue
+        try:
+            related_model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        columns.append(f'{relation}__{field.source}')
+    return columns
+
+
+def trim_queryset(queryset, serializer):
+    """ Ограничить queryset колонками и связями полей сериализатора.
+
+    Если поле читает не поле модели (метод, source='*'), queryset не меняется: его зависимости неизвестны.
+    """
+    model = queryset.model
+    columns = [model._meta.pk.name]
+    select_related = []
+    many_relations = set()
+    values_fields = getattr(serializer, 'values_fields', {})
+    for field_name, field in serializer.fields.items():
+        if field_name in values_fields:
+            # колонки и связи поля известны из описания для режима values
+            values_field = values_fields[field_name]
+            columns.extend(values_field.columns)
+            many_relations.update(values_field.many)
+            continue
+        name = field.source.split('.')[0]
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return queryset
+        if model_field.many_to_many or model_field.one_to_many:
+            many_relations.add(name)
+            continue
+        if not model_field.is_relation:
+            columns.append(name)
+            continue
+        if isinstance(field, PrimaryKeyRelatedField):
+            columns.append(name)
+            continue
+        # связь выводится вложенным сериализатором или строкой: тянем её JOIN'ом вместе с нужными колонками
+        select_related.append(name)
+        columns.extend(_nested_columns(name, field) or [name])
+
+    prefetch = [lookup for lookup in queryset._prefetch_related_lookups
+                if (lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup).split('__')[0]
+                in many_relations]
+    prefetched = {(lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup).split('__')[0]
+                  for lookup in prefetch}
+    prefetch.extend(sorted(many_relations - prefetched))
+
+    # колонки связанных моделей (manufacturer__country__name) читаются JOIN'ом по всему пути
+    select_related.extend(column.rsplit('__', 1)[0] for column in columns if '__' in column)
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if select_related:
+        queryset = queryset.select_related(*dict.fromkeys(select_related))
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.only(*columns)
+
+
+class SparseFieldsViewMixin:
+    """ ?fields= и ?exclude= для GenericAPIView: сериализатор — SparseFieldsSerializerMixin, queryset — по его полям """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        requested, excluded = get_sparse_params(self.request)
+        if requested is None and excluded is None:
+            return queryset
+        return trim_queryset(queryset, self.get_serializer())
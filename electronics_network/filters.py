@@ -1,10 +1,22 @@
 import django_filters
-from electronics_network.models import Manufacturer, Product
+from django_filters.constants import EMPTY_VALUES
+
+from electronics_network.addresses import name_key
+from electronics_network.models import Country, Manufacturer, Product, Transaction, Stock
+
+
+class CountryFilter(django_filters.CharFilter):
+    """ Фильтр по названию страны без учёта регистра: сравнение id по внешнему ключу со строкой справочника """
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        return qs.filter(**{f'{self.field_name}__in': Country.objects.filter(key=name_key(value))})
 
 
 class ManufacturerFilter(django_filters.FilterSet):
     """ Фильтр производителя """
-    country = django_filters.CharFilter(field_name='country', lookup_expr='iexact')
+    country = CountryFilter(field_name='country')
 
     class Meta:
         model = Manufacturer
@@ -12,8 +24,30 @@ class ManufacturerFilter(django_filters.FilterSet):
 
 class ProductFilter(django_filters.FilterSet):
     """ Фильтр продукта """
-    country = django_filters.CharFilter(field_name='manufacturer__country', lookup_expr='iexact')
+    country = CountryFilter(field_name='manufacturer__country')
 
     class Meta:
         model = Product
-        fields = ['country']
\ No newline at end of file
+        fields = ['country']
+
+
+class TransactionFilter(django_filters.FilterSet):
+    """ Фильтр транзакции: период по дате создания отсекает лишние секции таблицы """
+    created_after = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+
+    class Meta:
+        model = Transaction
+        fields = ['created_after', 'created_before']
+
+
+class StockFilter(django_filters.FilterSet):
+    """ Фильтр остатков: продукт, звено сети и только ненулевые остатки """
+    nonzero = django_filters.BooleanFilter(method='filter_nonzero')
+
+    class Meta:
+        model = Stock
+        fields = ['product', 'manufacturer', 'retail_network', 'individual_entrepreneur', 'nonzero']
+
+    def filter_nonzero(self, queryset, name, value):
+        return queryset.exclude(quantity=0) if value else queryset
@@ -0,0 +1,241 @@
+""" Снимок иерархии сети в файле, общий для всех процессов сервера
+
+Звенья сети (производители, розничные сети, ИП) записываются в HIERARCHY_SNAPSHOT_FILE массивами
+фиксированной ширины: ключ звена (тип и id, по возрастанию), индекс поставщика, размер поддерева и уровень.
+Каждый процесс отображает файл в память (mmap) и читает массивы через memoryview без копирования,
+поэтому путь до производителя и размер поддерева вычисляются в процессе за микросекунды без запросов к базе.
+
+Когда звено создано, удалено или у него сменились поставщик или уровень, после фиксации транзакции
+в очередь ставится фоновая задача rebuild_hierarchy (jobs.py). Она пишет новый файл рядом и атомарно
+подменяет старый (os.replace). В заголовке файла — время начала сборки: подмена выполняется под блокировкой
+файла и только если текущий файл начали собирать раньше, поэтому медленная старая сборка другого процесса
+не затирает более новый снимок. Процессы замечают подмену по stat файла при следующем обращении
+и отображают новый файл; уже выданный снимок продолжает читать старое отображение.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, NetworkNode
+from electronics_network.nodes import KINDS as MODEL_KINDS
+
+MAGIC = b'ENHIER01'
+# магия, время начала сборки (нс), число звеньев
+HEADER = struct.Struct('<8sqq')
+KINDS = (NetworkNode.KIND_MANUFACTURER, NetworkNode.KIND_RETAIL_NETWORK, NetworkNode.KIND_INDIVIDUAL_ENTREPRENEUR)
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+# ключ звена: код типа в старших битах, id — в младших
+KEY_SHIFT = 48
+NO_PARENT = -1
+# поля звена, которые попадают в снимок: поставщик и уровень
+STRUCTURE_COLUMNS = ('manufacturer_id', 'retail_network_id', 'level')
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def node_key(kind, node_id):
+    return (KIND_CODES[kind] << KEY_SHIFT) | node_id
+
+
+def is_used():
+    """ Снимок уже собран: пока файла нет, пересобирать нечего, его соберёт первое обращение """
+    return Path(settings.HIERARCHY_SNAPSHOT_FILE).exists()
+
+
+def structure_columns(model):
+    attnames = {field.attname for field in model._meta.concrete_fields}
+    return [column for column in STRUCTURE_COLUMNS if column in attnames]
+
+
+def get_structure(instance):
+    """ Поставщик и уровень звена в порядке structure_columns """
+    return tuple(getattr(instance, column) for column in structure_columns(type(instance)))
+
+
+def get_stored_structure(instance):
+    """ Поставщик и уровень звена в базе до сохранения или None для нового звена """
+    if instance.pk is None:
+        return None
+    columns = structure_columns(type(instance))
+    return type(instance)._default_manager.filter(pk=instance.pk).values_list(*columns).first()
+
+
+def _read_nodes():
+    """ Звенья сети: {ключ: (ключ поставщика или None, уровень)} """
+    nodes = {}
+    sources = ((Manufacturer, NetworkNode.KIND_MANUFACTURER, ()),
+               (RetailNetwork, NetworkNode.KIND_RETAIL_NETWORK, ('manufacturer_id', 'retail_network_id')),
+               (IndividualEntrepreneur, NetworkNode.KIND_INDIVIDUAL_ENTREPRENEUR,
+                ('manufacturer_id', 'retail_network_id')))
+    for model, kind, supplier_columns in sources:
+        for row in model.objects.order_by().values_list('id', 'level', *supplier_columns).iterator(chunk_size=5000):
+            node_id, level, *suppliers = row
+            parent = None
+            if suppliers and suppliers[0] is not None:
+                parent = node_key(NetworkNode.KIND_MANUFACTURER, suppliers[0])
+            elif suppliers and suppliers[1] is not None:
+                parent = node_key(NetworkNode.KIND_RETAIL_NETWORK, suppliers[1])
+            nodes[node_key(kind, node_id)] = (parent, level)
+    return nodes
+
+
+def build_arrays(nodes):
+    """ Массивы снимка по {ключ: (ключ поставщика, уровень)}: ключи, поставщики, размеры поддеревьев, уровни """
+    keys = array('q', sorted(nodes))
+    index = {key: position for position, key in enumerate(keys)}
+    parents = array('i', (index.get(nodes[key][0], NO_PARENT) for key in keys))
+    levels = array('b', (nodes[key][1] for key in keys))
+
+    # глубина каждого звена; цикл поставщиков (ошибочные данные) обрывается на повторе
+    depths = [None] * len(keys)
+    for position in range(len(keys)):
+        chain, current = [], position
+        while current != NO_PARENT and depths[current] is None and current not in chain:
+            chain.append(current)
+            current = parents[current]
+        depth = depths[current] if current != NO_PARENT and depths[current] is not None else -1
+        for node in reversed(chain):
+            depth += 1
+            depths[node] = depth
+    # размеры поддеревьев: от глубоких звеньев к корню
+    sizes = array('i', [1]) * len(keys)
+    for position in sorted(range(len(keys)), key=depths.__getitem__, reverse=True):
+        parent = parents[position]
+        if parent != NO_PARENT and depths[parent] < depths[position]:
+            sizes[parent] += sizes[position]
+    return keys, parents, sizes, levels
+
+
+def _built_at(path):
+    """ Время начала сборки файла снимка; -1, если файла нет или это не снимок """
+    try:
+        with open(path, 'rb') as file:
+            magic, built_at, _ = HEADER.unpack(file.read(HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return -1
+    return built_at if magic == MAGIC else -1
+
+
+def write_snapshot(path=None):
+    """ Собрать снимок по базе и атомарно заменить файл, если его не собрали позже; возвращает путь """
+    path = Path(path or settings.HIERARCHY_SNAPSHOT_FILE)
+    # до чтения базы: сборка, начатая позже, видит все изменения, зафиксированные до этой
+    started_at = time.time_ns()
+    keys, parents, sizes, levels = build_arrays(_read_nodes())
+    descriptor, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, started_at, len(keys)))
+            for values in (keys, parents, sizes, levels):
+                values.tofile(file)
+        with open(path.with_name(f'.{path.name}.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if _built_at(path) < started_at:
+                os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+    return path
+
+
+class Snapshot:
+    """ Отображённый в память снимок иерархии; массивы — memoryview над mmap без копирования """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.stat = os.fstat(file.fileno())
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.buffer)
+        magic, self.built_at, count = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f'{path}: не снимок иерархии')
+        offset = HEADER.size
+        self.keys = view[offset:offset + 8 * count].cast('q')
+        offset += 8 * count
+        self.parents = view[offset:offset + 4 * count].cast('i')
+        offset += 4 * count
+        self.sizes = view[offset:offset + 4 * count].cast('i')
+        offset += 4 * count
+        self.levels = view[offset:offset + count].cast('b')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def index(self, kind, node_id):
+        """ Позиция звена в массивах или None, если звена нет в снимке """
+        key = node_key(kind, node_id)
+        position = bisect_left(self.keys, key)
+        return position if position < len(self.keys) and self.keys[position] == key else None
+
+    def node(self, position):
+        key = self.keys[position]
+        return {'type': KINDS[key >> KEY_SHIFT], 'id': key & ((1 << KEY_SHIFT) - 1), 'level': self.levels[position]}
+
+    def path_to_root(self, kind, node_id):
+        """ Звено и его поставщики до производителя: [звено, поставщик, ..., корень] или None """
+        position = self.index(kind, node_id)
+        if position is None:
+            return None
+        path, seen = [], set()
+        while position != NO_PARENT and position not in seen:
+            seen.add(position)
+            path.append(self.node(position))
+            position = self.parents[position]
+        return path
+
+    def subtree_size(self, kind, node_id):
+        """ Число звеньев в поддереве звена вместе с ним самим или None """
+        position = self.index(kind, node_id)
+        return self.sizes[position] if position is not None else None
+
+
+def _is_current(snapshot, path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size) == \
+        (snapshot.stat.st_ino, snapshot.stat.st_mtime_ns, snapshot.stat.st_size)
+
+
+def get_snapshot(rebuild=False):
+    """ Текущий снимок процесса; после подмены файла отображается новый, без файла — собирается """
+    global _snapshot
+    path = Path(settings.HIERARCHY_SNAPSHOT_FILE)
+    snapshot = _snapshot
+    if snapshot is not None and not rebuild and _is_current(snapshot, path):
+        return snapshot
+    with _lock:
+        if rebuild or not path.exists():
+            write_snapshot(path)
+        if _snapshot is None or not _is_current(_snapshot, path):
+            # подмена ссылки атомарна: потоки с прежним снимком дочитывают его отображение
+            _snapshot = Snapshot(path)
+        return _snapshot
+
+
+class HierarchyViewMixin:
+    """ Действие hierarchy для представлений звеньев сети: путь до производителя и размер поддерева """
+
+    @action(detail=True, methods=['get'])
+    def hierarchy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        kind = MODEL_KINDS[type(instance)]
+        snapshot = get_snapshot()
+        if snapshot.index(kind, instance.pk) is None:
+            # звено создано, а сборка снимка после фиксации ещё не выполнена
+            snapshot = get_snapshot(rebuild=True)
+        return Response({'path': snapshot.path_to_root(kind, instance.pk),
+                         'subtree_size': snapshot.subtree_size(kind, instance.pk)})
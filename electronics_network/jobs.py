@@ -0,0 +1,159 @@
+""" Фоновые задачи electronics_network: очередь в базе данных с выполнением по частям """
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from electronics_network import changes, hierarchy, rollups
+from electronics_network.models import Job, Transaction
+
+_registry = {}
+
+# задача, которая не обновлялась дольше этого времени, считается брошенной упавшим воркером
+STALE_AFTER = timedelta(minutes=10)
+RETRY_DELAY = timedelta(seconds=30)
+
+
+def register(task_class):
+    """ Декоратор регистрации задачи по её имени """
+    _registry[task_class.name] = task_class
+    return task_class
+
+
+def get_task(name):
+    return _registry[name]()
+
+
+def enqueue(name, params=None, owner=None, max_attempts=3):
+    """ Поставить задачу в очередь """
+    if name not in _registry:
+        raise KeyError(f'Неизвестная задача: {name}')
+    return Job.objects.create(name=name, params=params or {}, owner=owner, max_attempts=max_attempts)
+
+
+def enqueue_once(name, params=None, owner=None, max_attempts=3):
+    """ Поставить задачу в очередь, если такая же ещё не ждёт запуска.
+
+    Выполняемая задача не в счёт: она могла прочитать базу до изменений, ради которых её ставят снова.
+    """
+    pending = Job.objects.filter(name=name, params=params or {}, owner=owner, status=Job.STATUS_PENDING).first()
+    return pending or enqueue(name, params, owner, max_attempts)
+
+
+class ChunkedTask:
+    """ Задача, которая обрабатывает выборку частями по возрастанию pk.
+
+    Каждая часть выполняется в отдельной транзакции вместе с сохранением позиции (последнего pk),
+    поэтому после падения воркера задача продолжается с первой необработанной части.
+    """
+    name = None
+    chunk_size = 1000
+
+    def get_queryset(self, params):
+        raise NotImplementedError
+
+    def process_chunk(self, queryset, params):
+        raise NotImplementedError
+
+    def run(self, job):
+        queryset = self.get_queryset(job.params)
+        if job.total is None:
+            job.total = queryset.count()
+            Job.objects.filter(pk=job.pk).update(total=job.total)
+
+        while True:
+            if Job.objects.filter(pk=job.pk, cancel_requested=True).exists():
+                return False
+            last_pk = job.cursor or 0
+            ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:self.chunk_size])
+            if not ids:
+                return True
+            with transaction.atomic():
+                self.process_chunk(queryset.model._default_manager.filter(pk__in=ids), job.params)
+                job.cursor = ids[-1]
+                job.processed += len(ids)
+                Job.objects.filter(pk=job.pk).update(cursor=job.cursor, processed=job.processed,
+                                                     locked_at=timezone.now())
+
+
+@register
+class ClearDebtTask(ChunkedTask):
+    """ Обнулить задолженность перед поставщиком у выбранных покупателей """
+    name = 'clear_debt'
+    buyer_fields = ('buyer_manufacturer', 'buyer_retail_network', 'buyer_individual_entrepreneur')
+
+    def get_queryset(self, params):
+        if params['buyer_field'] not in self.buyer_fields:
+            raise ValueError(f"Недопустимое поле покупателя: {params['buyer_field']}")
+        return Transaction.objects.filter(**{f"{params['buyer_field']}__in": params['buyer_ids']})
+
+    def process_chunk(self, queryset, params):
+        rollups.record_debt_cleared(queryset)
+        changes.record_updates(queryset)
+        queryset.update(debt=0)
+
+
+@register
+class RebuildHierarchyTask:
+    """ Пересобрать снимок иерархии сети после изменения звеньев """
+    name = 'rebuild_hierarchy'
+
+    def run(self, job):
+        hierarchy.write_snapshot()
+        return True
+
+
+def claim_next_job():
+    """ Взять в работу следующую задачу из очереди или брошенную упавшим воркером """
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.STATUS_PENDING, run_after__lte=now)
+            .order_by('run_after', 'pk')
+            .first()
+        )
+        if job is None:
+            job = (
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(status=Job.STATUS_RUNNING, locked_at__lt=now - STALE_AFTER)
+                .order_by('locked_at', 'pk')
+                .first()
+            )
+        if job is None:
+            return None
+        job.status = Job.STATUS_RUNNING
+        job.locked_at = now
+        job.attempts += 1
+        job.save(update_fields=['status', 'locked_at', 'attempts'])
+    return job
+
+
+def run_job(job):
+    """ Выполнить задачу с учётом отмены и повторов при ошибке """
+    try:
+        completed = get_task(job.name).run(job)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.STATUS_PENDING
+            job.run_after = timezone.now() + RETRY_DELAY * job.attempts
+        else:
+            job.status = Job.STATUS_FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.STATUS_DONE if completed else Job.STATUS_CANCELLED
+        job.finished_at = timezone.now()
+    job.locked_at = None
+    job.save(update_fields=['status', 'error', 'run_after', 'finished_at', 'locked_at'])
+    return job
+
+
+def run_pending_jobs():
+    """ Выполнить все готовые к запуску задачи, вернуть их количество """
+    count = 0
+    while (job := claim_next_job()) is not None:
+        run_job(job)
+        count += 1
+    return count
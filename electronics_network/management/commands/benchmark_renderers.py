@@ -0,0 +1,95 @@
+""" Сравнение рендереров на страницах сериализаторов чтения """
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from config.renderers import ORJSONRenderer, MessagePackRenderer
+from electronics_network.addresses import resolve_address
+from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction
+from electronics_network.serializers import ManufacturerSerializer, RetailNetworkReadSerializer, \
+    IndividualEntrepreneurReadSerializer, ProductSerializer, TransactionReadSerializer
+from users.models import User
+
+ADDRESS = {'email': 'node@example.com', 'street': 'ул Кржижановского', 'house_number': '54'}
+
+
+def seed(rows):
+    """ Страница данных каждого ресурса: rows звеньев, продуктов и транзакций """
+    owner = User.objects.create(username='benchmark_renderers')
+    address = {**ADDRESS, **resolve_address('Россия', 'Санкт-Петербург')}
+    manufacturers = Manufacturer.objects.bulk_create([
+        Manufacturer(owner=owner, name=f'Завод {i}', level=0, **address) for i in range(rows)
+    ])
+    networks = RetailNetwork.objects.bulk_create([
+        RetailNetwork(owner=owner, manufacturer=manufacturer, name=f'Сеть {i}', level=1, **address)
+        for i, manufacturer in enumerate(manufacturers)
+    ])
+    entrepreneurs = IndividualEntrepreneur.objects.bulk_create([
+        IndividualEntrepreneur(owner=owner, retail_network=network, name=f'ИП {i}', level=2, **address)
+        for i, network in enumerate(networks)
+    ])
+    products = Product.objects.bulk_create([
+        Product(owner=owner, manufacturer=manufacturer, name=f'Продукт {i}', model='Модель',
+                release_date=date(2024, 1, 1))
+        for i, manufacturer in enumerate(manufacturers)
+    ])
+    Product.retailers.through.objects.bulk_create([
+        Product.retailers.through(product_id=product.pk, retailnetwork_id=network.pk)
+        for product, network in zip(products, networks)
+    ])
+    Product.entrepreneurs.through.objects.bulk_create([
+        Product.entrepreneurs.through(product_id=product.pk, individualentrepreneur_id=entrepreneur.pk)
+        for product, entrepreneur in zip(products, entrepreneurs)
+    ])
+    Transaction.objects.bulk_create([
+        Transaction(owner=owner, product=product, seller_manufacturer=product.manufacturer,
+                    buyer_retail_network=network, amount=i + 1, debt=f'{i * 100}.50')
+        for i, (product, network) in enumerate(zip(products, networks))
+    ])
+    return {
+        ManufacturerSerializer: Manufacturer.objects.filter(owner=owner),
+        RetailNetworkReadSerializer: RetailNetwork.objects.filter(owner=owner).select_related('manufacturer'),
+        IndividualEntrepreneurReadSerializer:
+            IndividualEntrepreneur.objects.filter(owner=owner).select_related('retail_network'),
+        ProductSerializer: Product.objects.filter(owner=owner).select_related('manufacturer')
+        .prefetch_related('retailers', 'entrepreneurs'),
+        TransactionReadSerializer: Transaction.objects.filter(owner=owner).select_related(
+            'product', 'seller_manufacturer', 'buyer_retail_network'),
+    }
+
+
+def best_time_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время рендеринга и размер ответа JSON (DRF), JSON (orjson) и MessagePack ' \
+           'на страницах сериализаторов чтения. Данные создаются в транзакции и откатываются'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50, help='Строк на странице')
+        parser.add_argument('--repeat', type=int, default=200, help='Повторов рендеринга, берётся лучшее время')
+
+    def handle(self, *args, **options):
+        renderers = {'json (drf)': JSONRenderer(), 'json (orjson)': ORJSONRenderer(),
+                     'msgpack': MessagePackRenderer()}
+        self.stdout.write(f"{'сериализатор':<38}{'рендерер':<15}{'мс/страница':>12}{'байт':>10}{'ускорение':>11}")
+        with transaction.atomic():
+            pages = seed(options['rows'])
+            for serializer_class, queryset in pages.items():
+                data = serializer_class(queryset, many=True).data
+                baseline = None
+                for name, renderer in renderers.items():
+                    elapsed = best_time_ms(lambda: renderer.render(data), options['repeat'])
+                    baseline = baseline or elapsed
+                    self.stdout.write(f'{serializer_class.__name__:<38}{name:<15}{elapsed:>12.3f}'
+                                      f'{len(renderer.render(data)):>10}{baseline / elapsed:>10.1f}x')
+            transaction.set_rollback(True)
@@ -0,0 +1,15 @@
+""" Сборка снимка иерархии сети """
+from django.core.management.base import BaseCommand
+
+from electronics_network import hierarchy
+
+
+class Command(BaseCommand):
+    help = 'Собирает снимок иерархии сети (HIERARCHY_SNAPSHOT_FILE) для отображения в память процессами сервера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Путь к файлу снимка вместо HIERARCHY_SNAPSHOT_FILE')
+
+    def handle(self, *args, **options):
+        path = hierarchy.write_snapshot(options['output'])
+        self.stdout.write(f'Снимок иерархии: {path}, звеньев: {len(hierarchy.Snapshot(path))}')
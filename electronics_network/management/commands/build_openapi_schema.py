@@ -0,0 +1,14 @@
+""" Сборка схемы OpenAPI """
+from django.core.management.base import BaseCommand
+
+from config.schema import write_documents
+
+
+class Command(BaseCommand):
+    help = 'Строит схему OpenAPI для /swagger/ и /redoc/ и сохраняет её в OPENAPI_SCHEMA_FILE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Файл схемы вместо OPENAPI_SCHEMA_FILE')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Схема сохранена: {write_documents(options['output'])}")
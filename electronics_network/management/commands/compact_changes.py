@@ -0,0 +1,11 @@
+""" Сжатие журнала изменений """
+from django.core.management.base import BaseCommand
+
+from electronics_network import changes
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из журнала изменений записи, после которых у объекта есть более новая запись'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Удалено записей журнала: {changes.compact()}')
@@ -0,0 +1,27 @@
+""" Отчёт о долге нижестоящих покупателей по производителям """
+import io
+
+from django.core.management.base import BaseCommand
+
+from electronics_network import debt_exposure
+
+
+class Command(BaseCommand):
+    help = 'Считает пулом процессов долг покупателей в дереве каждого производителя и выводит отчёт в CSV или JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=('csv', 'json'), default='csv', help='Формат отчёта')
+        parser.add_argument('--output', help='Путь к файлу отчёта вместо стандартного вывода')
+        parser.add_argument('--workers', type=int, help='Число процессов вместо DEBT_EXPOSURE_WORKERS')
+
+    def handle(self, *args, **options):
+        rows = debt_exposure.report(workers=options['workers'])
+        write = debt_exposure.write_json if options['format'] == 'json' else debt_exposure.write_csv
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+                write(rows, file)
+            self.stdout.write(f"Производителей в отчёте: {len(rows)}, файл: {options['output']}")
+        else:
+            buffer = io.StringIO()
+            write(rows, buffer)
+            self.stdout.write(buffer.getvalue())
@@ -0,0 +1,13 @@
+""" Пересчёт агрегатов продаж """
+from django.core.management.base import BaseCommand
+
+from electronics_network import rollups
+from electronics_network.models import SalesRollup
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает агрегаты продаж (SalesRollup) по всем транзакциям'
+
+    def handle(self, *args, **options):
+        rollups.rebuild()
+        self.stdout.write(f'Агрегатов продаж: {SalesRollup.objects.count()}')
@@ -0,0 +1,13 @@
+""" Пересчёт остатков продуктов """
+from django.core.management.base import BaseCommand
+
+from electronics_network import stock
+from electronics_network.models import Stock
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает остатки продуктов у звеньев сети (Stock) по всем транзакциям'
+
+    def handle(self, *args, **options):
+        stock.rebuild()
+        self.stdout.write(f'Строк остатков: {Stock.objects.count()}')
@@ -0,0 +1,23 @@
+""" Воркер фоновых задач """
+import time
+
+from django.core.management.base import BaseCommand
+
+from electronics_network.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди (electronics_network.Job)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и завершиться')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Пауза между опросами очереди, секунд')
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_pending_jobs()
+            if count:
+                self.stdout.write(f'Выполнено задач: {count}')
+            if options['once']:
+                return
+            time.sleep(options['sleep'])
@@ -0,0 +1,16 @@
+""" Заполнение единой таблицы звеньев сети """
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from electronics_network import nodes
+from electronics_network.models import NetworkNode
+
+
+class Command(BaseCommand):
+    help = 'Заполняет NetworkNode по таблицам звеньев и проставляет продавца и покупателя транзакциям ' \
+           '(перед включением NETWORK_NODES_UNIFIED)'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            nodes.rebuild()
+        self.stdout.write(f'Звеньев сети: {NetworkNode.objects.count()}')
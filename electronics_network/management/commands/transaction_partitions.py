@@ -0,0 +1,52 @@
+""" Управление помесячными секциями таблицы транзакций """
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from electronics_network import partitions
+
+
+def parse_month(value):
+    try:
+        return timezone.make_aware(datetime.strptime(value, '%Y-%m'))
+    except ValueError:
+        raise CommandError(f'Месяц указывается в формате ГГГГ-ММ: {value}')
+
+
+class Command(BaseCommand):
+    help = 'Показывает, создаёт и отсоединяет помесячные секции таблицы транзакций (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+        subparsers.add_parser('list', help='Список секций')
+        create = subparsers.add_parser('create', help='Создать секции текущего и следующих месяцев или одного месяца')
+        create.add_argument('--ahead', type=int, default=3, help='Сколько месяцев вперёд создать')
+        create.add_argument('--month', type=parse_month, help='Создать секцию одного месяца, ГГГГ-ММ')
+        detach = subparsers.add_parser('detach', help='Отсоединить секцию месяца')
+        detach.add_argument('month', type=parse_month, help='Месяц, ГГГГ-ММ')
+        detach.add_argument('--drop', action='store_true', help='Удалить отсоединённую секцию')
+
+    def handle(self, *args, **options):
+        try:
+            getattr(self, f"handle_{options['action']}")(options)
+        except partitions.PartitioningNotSupported as error:
+            raise CommandError(str(error))
+
+    def handle_list(self, options):
+        for name, bounds in partitions.list_partitions():
+            self.stdout.write(f'{name}: {bounds}')
+
+    def handle_create(self, options):
+        if options['month']:
+            created = [partitions.partition_name(options['month'])] \
+                if partitions.create_partition(options['month']) else []
+        else:
+            created = partitions.ensure_partitions(ahead=options['ahead'])
+        self.stdout.write(f"Создано секций: {len(created)}" + ''.join(f'\n  {name}' for name in created))
+
+    def handle_detach(self, options):
+        name = partitions.partition_name(options['month'])
+        if not partitions.detach_partition(options['month'], drop=options['drop']):
+            raise CommandError(f'Секция {name} не найдена')
+        self.stdout.write(f"Секция {name} {'удалена' if options['drop'] else 'отсоединена'}")
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:21
+
+from django.db import migrations, models
+
+NODE_TABLES = (
+    'electronics_network_manufacturer',
+    'electronics_network_retailnetwork',
+    'electronics_network_individualentrepreneur',
+)
+PREFIX_COLUMNS = ('name', 'city')
+
+
+def create_prefix_indexes(apps, schema_editor):
+    """ Индексы для istartswith (UPPER(col) LIKE 'X%') в PostgreSQL """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in NODE_TABLES:
+        for column in PREFIX_COLUMNS:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_{column}_prefix '
+                f'ON {table} (UPPER({column}::text) text_pattern_ops)'
+            )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in NODE_TABLES:
+        for column in PREFIX_COLUMNS:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_prefix')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0006_alter_product_owner_alter_transaction_owner'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='individualentrepreneur',
+            name='city',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='город'),
+        ),
+        migrations.AlterField(
+            model_name='manufacturer',
+            name='city',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='город'),
+        ),
+        migrations.AlterField(
+            model_name='retailnetwork',
+            name='city',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='город'),
+        ),
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0007_city_index_and_prefix_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='задача')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='параметры')),
+                ('status', models.CharField(choices=[('pending', 'в очереди'), ('running', 'выполняется'), ('done', 'выполнена'), ('failed', 'ошибка'), ('cancelled', 'отменена')], db_index=True, default='pending', max_length=20, verbose_name='статус')),
+                ('cursor', models.JSONField(blank=True, null=True, verbose_name='позиция продолжения')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='обработано')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='всего')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='попытки')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name='максимум попыток')),
+                ('cancel_requested', models.BooleanField(default=False, verbose_name='запрошена отмена')),
+                ('error', models.TextField(blank=True, verbose_name='ошибка')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='запустить после')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='взята в работу')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='дата создания')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='дата завершения')),
+                ('owner', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'фоновая задача',
+                'verbose_name_plural': 'фоновые задачи',
+                'indexes': [models.Index(fields=['status', 'run_after'], name='electronics_status_6d393c_idx')],
+            },
+        ),
+    ]
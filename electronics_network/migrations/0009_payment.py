@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:28
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0008_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))], verbose_name='сумма')),
+                ('applied_amount', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='зачтено в счёт долга')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='дата создания')),
+                ('buyer_individual_entrepreneur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payments_individual_entrepreneur', to='electronics_network.individualentrepreneur', verbose_name='покупатель-индивидуальный предприниматель')),
+                ('buyer_manufacturer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payments_manufacturer', to='electronics_network.manufacturer', verbose_name='покупатель-производитель')),
+                ('buyer_retail_network', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payments_retail_network', to='electronics_network.retailnetwork', verbose_name='покупатель-розничная сеть')),
+                ('owner', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'оплата',
+                'verbose_name_plural': 'оплаты',
+            },
+        ),
+    ]
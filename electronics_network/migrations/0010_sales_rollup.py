@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0009_payment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateField(blank=True, null=True, verbose_name='день')),
+                ('country', models.CharField(blank=True, default='', max_length=255, verbose_name='страна производителя')),
+                ('seller_level', models.IntegerField(default=-1, verbose_name='уровень продавца')),
+                ('transactions_count', models.IntegerField(default=0, verbose_name='количество транзакций')),
+                ('amount', models.BigIntegerField(default=0, verbose_name='объём продаж')),
+                ('debt', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='долг')),
+                ('owner', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='electronics_network.product', verbose_name='продукт')),
+            ],
+            options={
+                'verbose_name': 'агрегат продаж',
+                'verbose_name_plural': 'агрегаты продаж',
+                'constraints': [models.UniqueConstraint(fields=('owner', 'bucket', 'product', 'country', 'seller_level'), name='unique_sales_rollup_dimensions')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:36
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_created_at(apps, schema_editor):
+    """ Существующим транзакциям — дату продукта, которую раньше показывала админка """
+    Transaction = apps.get_model('electronics_network', 'Transaction')
+    Product = apps.get_model('electronics_network', 'Product')
+    Transaction.objects.filter(product__isnull=False).update(
+        created_at=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('created_at')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0010_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False, verbose_name='дата создания'),
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+from datetime import datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+TABLE = 'electronics_network_transaction'
+LEGACY_TABLE = f'{TABLE}_legacy'
+# секции создаются заранее на столько месяцев вперёд, дальше — python manage.py transaction_partitions create
+MONTHS_AHEAD = 3
+
+
+def _month(year, month):
+    return timezone.make_aware(datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1))
+
+
+def _table_definitions(cursor, table):
+    """ Индексы (кроме первичного ключа) и внешние ключи таблицы, чтобы создать их заново """
+    cursor.execute(
+        'SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s', [table, f'{table}_pkey']
+    )
+    # индексы секционированной таблицы описаны как ON ONLY, для пересоздания нужна обычная форма
+    indexes = [row[0].replace(' ON ONLY ', ' ON ') for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def _rebuild_table(schema_editor, partitioned):
+    """ Пересоздать таблицу транзакций секционированной (или обычной) с переносом строк, индексов и ключей """
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = _table_definitions(cursor, TABLE)
+        cursor.execute(f'SELECT MIN(created_at) FROM {TABLE}')
+        first = timezone.localtime(cursor.fetchone()[0] or timezone.now())
+
+    schema_editor.execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}')
+    partition_by = ' PARTITION BY RANGE (created_at)' if partitioned else ''
+    schema_editor.execute(
+        f'CREATE TABLE {TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS)'
+        f'{partition_by}'
+    )
+    if partitioned:
+        now = timezone.localtime()
+        months = (now.year - first.year) * 12 + now.month - first.month + MONTHS_AHEAD
+        for offset in range(months + 1):
+            start = _month(first.year, first.month + offset)
+            end = _month(first.year, first.month + offset + 1)
+            schema_editor.execute(
+                f'CREATE TABLE {TABLE}_p{start:%Y_%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                [start, end],
+            )
+        schema_editor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+    schema_editor.execute(f'INSERT INTO {TABLE} SELECT * FROM {LEGACY_TABLE}')
+    schema_editor.execute(f'DROP TABLE {LEGACY_TABLE} CASCADE')
+    # в секционированной таблице ключ секционирования обязан входить в первичный ключ
+    primary_key = 'id, created_at' if partitioned else 'id'
+    schema_editor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({primary_key})')
+    schema_editor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) "
+        f"FROM {TABLE}"
+    )
+    for index in indexes:
+        schema_editor.execute(index)
+    for name, definition in foreign_keys:
+        schema_editor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+
+
+def partition_transactions(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    _rebuild_table(schema_editor, partitioned=True)
+
+
+def unpartition_transactions(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    _rebuild_table(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0011_transaction_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_transactions, unpartition_transactions),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+NODE_MODELS = {
+    'manufacturer': 'Manufacturer',
+    'retail_network': 'RetailNetwork',
+    'individual_entrepreneur': 'IndividualEntrepreneur',
+}
+ADDRESS_FIELDS = ('owner_id', 'name', 'email', 'country', 'city', 'street', 'house_number', 'created_at', 'level')
+
+
+def fill_network_nodes(apps, schema_editor):
+    """ Заполнить NetworkNode по таблицам звеньев и проставить seller и buyer транзакциям """
+    node_model = apps.get_model('electronics_network', 'NetworkNode')
+    transaction_model = apps.get_model('electronics_network', 'Transaction')
+    for kind, model_name in NODE_MODELS.items():
+        model = apps.get_model('electronics_network', model_name)
+        node_model.objects.bulk_create([
+            node_model(kind=kind, source_id=row.pop('id'), **row)
+            for row in model.objects.values('id', *ADDRESS_FIELDS).iterator()
+        ], batch_size=1000)
+
+    for kind, model_name in NODE_MODELS.items():
+        if kind == 'manufacturer':
+            continue
+        source = apps.get_model('electronics_network', model_name).objects.filter(pk=OuterRef(OuterRef('source_id')))
+        for supplier_kind, supplier_field in (('manufacturer', 'manufacturer_id'),
+                                              ('retail_network', 'retail_network_id')):
+            node_model.objects.filter(kind=kind, supplier__isnull=True).update(supplier=Subquery(
+                node_model.objects.filter(kind=supplier_kind,
+                                          source_id=Subquery(source.values(supplier_field)[:1])).values('pk')[:1]
+            ))
+
+    for role in ('seller', 'buyer'):
+        for kind in NODE_MODELS:
+            field = f'{role}_{kind}'
+            transaction_model.objects.filter(**{f'{field}__isnull': False}).update(**{role: Subquery(
+                node_model.objects.filter(kind=kind, source_id=OuterRef(f'{field}_id')).values('pk')[:1]
+            )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0012_partition_transactions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NetworkNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('manufacturer', 'производитель'), ('retail_network', 'розничная сеть'), ('individual_entrepreneur', 'индивидуальный предприниматель')], max_length=30, verbose_name='тип звена')),
+                ('source_id', models.BigIntegerField(verbose_name='id в таблице типа')),
+                ('name', models.CharField(max_length=255, verbose_name='название')),
+                ('email', models.EmailField(max_length=254, verbose_name='электронная почта')),
+                ('country', models.CharField(max_length=255, verbose_name='страна')),
+                ('city', models.CharField(db_index=True, max_length=255, verbose_name='город')),
+                ('street', models.CharField(max_length=255, verbose_name='улица')),
+                ('house_number', models.CharField(max_length=20, verbose_name='номер дома')),
+                ('created_at', models.DateTimeField(verbose_name='дата создания')),
+                ('level', models.IntegerField(verbose_name='уровень в иерархии')),
+                ('owner', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('supplier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='customers', to='electronics_network.networknode', verbose_name='поставщик')),
+            ],
+            options={
+                'verbose_name': 'звено сети',
+                'verbose_name_plural': 'звенья сети',
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='buyer',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchases', to='electronics_network.networknode', verbose_name='покупатель'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='seller',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='electronics_network.networknode', verbose_name='продавец'),
+        ),
+        migrations.AddConstraint(
+            model_name='networknode',
+            constraint=models.UniqueConstraint(fields=('kind', 'source_id'), name='unique_network_node_source'),
+        ),
+        migrations.RunPython(fill_network_nodes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+RESOURCES = {
+    'manufacturer': 'Manufacturer',
+    'retail_network': 'RetailNetwork',
+    'individual_entrepreneur': 'IndividualEntrepreneur',
+    'product': 'Product',
+    'transaction': 'Transaction',
+    'payment': 'Payment',
+}
+
+
+def seed_changes(apps, schema_editor):
+    """ Записать «создан» для всех существующих объектов, чтобы лента с начала отдавала всю сеть """
+    change_model = apps.get_model('electronics_network', 'Change')
+    for resource, model in RESOURCES.items():
+        rows = apps.get_model('electronics_network', model).objects.order_by('pk').values_list('pk', 'owner_id')
+        change_model.objects.bulk_create((
+            change_model(resource=resource, object_id=pk, action='created', owner_id=owner_id)
+            for pk, owner_id in rows.iterator(chunk_size=1000)
+        ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0013_network_node'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('resource', models.CharField(max_length=32, verbose_name='ресурс')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='id объекта')),
+                ('action', models.CharField(choices=[('created', 'создан'), ('updated', 'изменён'), ('deleted', 'удалён')], max_length=8, verbose_name='действие')),
+                ('txid', models.BigIntegerField(default=0, editable=False, verbose_name='транзакция')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='дата изменения')),
+                ('owner', models.ForeignKey(blank=True, db_constraint=False, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'изменение',
+                'verbose_name_plural': 'журнал изменений',
+                'indexes': [models.Index(fields=['txid', 'id'], name='electronics_txid_eb2b31_idx'), models.Index(fields=['owner', 'txid', 'id'], name='electronics_owner_i_4cc850_idx'), models.Index(fields=['resource', 'object_id', 'txid', 'id'], name='electronics_resourc_d287a0_idx')],
+            },
+        ),
+        migrations.RunPython(seed_changes, migrations.RunPython.noop),
+    ]
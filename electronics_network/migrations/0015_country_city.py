@@ -0,0 +1,278 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+NODE_MODELS = ('Manufacturer', 'RetailNetwork', 'IndividualEntrepreneur', 'NetworkNode')
+
+
+def name_key(value):
+    return ' '.join(str(value).split()).casefold()
+
+
+def canonical_name(value):
+    name = ' '.join(str(value).split())
+    return name[:1].upper() + name[1:]
+
+
+def fill_addresses(apps, schema_editor):
+    """ Ссылки на справочники по текстовым колонкам всех звеньев сети: один UPDATE на пару (страна, город) """
+    country_model = apps.get_model('electronics_network', 'Country')
+    city_model = apps.get_model('electronics_network', 'City')
+    countries, cities = {}, {}
+    for model_name in NODE_MODELS:
+        model = apps.get_model('electronics_network', model_name)
+        pairs = model.objects.order_by().values_list('country', 'city').distinct()
+        for country_name, city_name in pairs:
+            country_key = name_key(country_name)
+            if country_key not in countries:
+                countries[country_key], _ = country_model.objects.get_or_create(
+                    key=country_key, defaults={'name': canonical_name(country_name)})
+            country = countries[country_key]
+            city_key = (country.pk, name_key(city_name))
+            if city_key not in cities:
+                cities[city_key], _ = city_model.objects.get_or_create(
+                    country=country, key=city_key[1], defaults={'name': canonical_name(city_name)})
+            model.objects.filter(country=country_name, city=city_name).update(
+                country_ref=country, city_ref=cities[city_key])
+
+
+def restore_addresses(apps, schema_editor):
+    for model_name in NODE_MODELS:
+        model = apps.get_model('electronics_network', model_name)
+        for row in model.objects.values('pk', 'country_ref__name', 'city_ref__name').iterator():
+            model.objects.filter(pk=row['pk']).update(country=row['country_ref__name'], city=row['city_ref__name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0014_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Country',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='название')),
+                ('key', models.CharField(editable=False, max_length=255, unique=True, verbose_name='ключ')),
+            ],
+            options={
+                'verbose_name': 'страна',
+                'verbose_name_plural': 'страны',
+            },
+        ),
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=255, verbose_name='название')),
+                ('key', models.CharField(editable=False, max_length=255, verbose_name='ключ')),
+                ('country', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='cities', to='electronics_network.country', verbose_name='страна')),
+            ],
+            options={
+                'verbose_name': 'город',
+                'verbose_name_plural': 'города',
+                'constraints': [models.UniqueConstraint(fields=('country', 'key'), name='unique_city_country_key')],
+            },
+        ),
+        migrations.AddField(
+            model_name='individualentrepreneur',
+            name='country_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.country'),
+        ),
+        migrations.AddField(
+            model_name='individualentrepreneur',
+            name='city_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.city'),
+        ),
+        migrations.AddField(
+            model_name='manufacturer',
+            name='country_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.country'),
+        ),
+        migrations.AddField(
+            model_name='manufacturer',
+            name='city_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.city'),
+        ),
+        migrations.AddField(
+            model_name='networknode',
+            name='country_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.country'),
+        ),
+        migrations.AddField(
+            model_name='networknode',
+            name='city_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.city'),
+        ),
+        migrations.AddField(
+            model_name='retailnetwork',
+            name='country_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.country'),
+        ),
+        migrations.AddField(
+            model_name='retailnetwork',
+            name='city_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.city'),
+        ),
+        migrations.RunPython(fill_addresses, restore_addresses),
+        # default нужен обратной миграции: текстовые колонки возвращаются в заполненные таблицы
+        migrations.AlterField(
+            model_name='individualentrepreneur',
+            name='country',
+            field=models.CharField(default='', max_length=255, verbose_name='страна'),
+        ),
+        migrations.AlterField(
+            model_name='individualentrepreneur',
+            name='city',
+            field=models.CharField(db_index=True, default='', max_length=255, verbose_name='город'),
+        ),
+        migrations.RemoveField(
+            model_name='individualentrepreneur',
+            name='country',
+        ),
+        migrations.RemoveField(
+            model_name='individualentrepreneur',
+            name='city',
+        ),
+        migrations.RenameField(
+            model_name='individualentrepreneur',
+            old_name='country_ref',
+            new_name='country',
+        ),
+        migrations.RenameField(
+            model_name='individualentrepreneur',
+            old_name='city_ref',
+            new_name='city',
+        ),
+        migrations.AlterField(
+            model_name='individualentrepreneur',
+            name='country',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.country', verbose_name='страна'),
+        ),
+        migrations.AlterField(
+            model_name='individualentrepreneur',
+            name='city',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.city', verbose_name='город'),
+        ),
+        # default нужен обратной миграции: текстовые колонки возвращаются в заполненные таблицы
+        migrations.AlterField(
+            model_name='manufacturer',
+            name='country',
+            field=models.CharField(default='', max_length=255, verbose_name='страна'),
+        ),
+        migrations.AlterField(
+            model_name='manufacturer',
+            name='city',
+            field=models.CharField(db_index=True, default='', max_length=255, verbose_name='город'),
+        ),
+        migrations.RemoveField(
+            model_name='manufacturer',
+            name='country',
+        ),
+        migrations.RemoveField(
+            model_name='manufacturer',
+            name='city',
+        ),
+        migrations.RenameField(
+            model_name='manufacturer',
+            old_name='country_ref',
+            new_name='country',
+        ),
+        migrations.RenameField(
+            model_name='manufacturer',
+            old_name='city_ref',
+            new_name='city',
+        ),
+        migrations.AlterField(
+            model_name='manufacturer',
+            name='country',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.country', verbose_name='страна'),
+        ),
+        migrations.AlterField(
+            model_name='manufacturer',
+            name='city',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.city', verbose_name='город'),
+        ),
+        # default нужен обратной миграции: текстовые колонки возвращаются в заполненные таблицы
+        migrations.AlterField(
+            model_name='networknode',
+            name='country',
+            field=models.CharField(default='', max_length=255, verbose_name='страна'),
+        ),
+        migrations.AlterField(
+            model_name='networknode',
+            name='city',
+            field=models.CharField(db_index=True, default='', max_length=255, verbose_name='город'),
+        ),
+        migrations.RemoveField(
+            model_name='networknode',
+            name='country',
+        ),
+        migrations.RemoveField(
+            model_name='networknode',
+            name='city',
+        ),
+        migrations.RenameField(
+            model_name='networknode',
+            old_name='country_ref',
+            new_name='country',
+        ),
+        migrations.RenameField(
+            model_name='networknode',
+            old_name='city_ref',
+            new_name='city',
+        ),
+        migrations.AlterField(
+            model_name='networknode',
+            name='country',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.country', verbose_name='страна'),
+        ),
+        migrations.AlterField(
+            model_name='networknode',
+            name='city',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.city', verbose_name='город'),
+        ),
+        # default нужен обратной миграции: текстовые колонки возвращаются в заполненные таблицы
+        migrations.AlterField(
+            model_name='retailnetwork',
+            name='country',
+            field=models.CharField(default='', max_length=255, verbose_name='страна'),
+        ),
+        migrations.AlterField(
+            model_name='retailnetwork',
+            name='city',
+            field=models.CharField(db_index=True, default='', max_length=255, verbose_name='город'),
+        ),
+        migrations.RemoveField(
+            model_name='retailnetwork',
+            name='country',
+        ),
+        migrations.RemoveField(
+            model_name='retailnetwork',
+            name='city',
+        ),
+        migrations.RenameField(
+            model_name='retailnetwork',
+            old_name='country_ref',
+            new_name='country',
+        ),
+        migrations.RenameField(
+            model_name='retailnetwork',
+            old_name='city_ref',
+            new_name='city',
+        ),
+        migrations.AlterField(
+            model_name='retailnetwork',
+            name='country',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.country', verbose_name='страна'),
+        ),
+        migrations.AlterField(
+            model_name='retailnetwork',
+            name='city',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='electronics_network.city', verbose_name='город'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+NODE_FIELDS = ('manufacturer', 'retail_network', 'individual_entrepreneur')
+SIDES = (('buyer', 1), ('seller', -1))
+
+
+def fill_stock(apps, schema_editor):
+    """ Остатки по всем транзакциям: групповой запрос на сторону и тип звена """
+    stock_model = apps.get_model('electronics_network', 'Stock')
+    transactions = apps.get_model('electronics_network', 'Transaction').objects.filter(product__isnull=False)
+    quantities = {}
+    for side, direction in SIDES:
+        for node in NODE_FIELDS:
+            column = f'{side}_{node}'
+            rows = (transactions.filter(**{f'{column}__isnull': False})
+                    .values('owner', 'product', column).annotate(total=models.Sum('amount')).order_by())
+            for row in rows.iterator():
+                key = (row['owner'], row['product'], node, row[column])
+                quantities[key] = quantities.get(key, 0) + direction * row['total']
+    stock_model.objects.bulk_create((
+        stock_model(owner_id=owner_id, product_id=product_id, quantity=quantity, **{f'{node}_id': node_id})
+        for (owner_id, product_id, node, node_id), quantity in quantities.items()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0015_country_city'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.BigIntegerField(default=0, verbose_name='количество')),
+                ('individual_entrepreneur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='electronics_network.individualentrepreneur', verbose_name='индивидуальный предприниматель')),
+                ('manufacturer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='electronics_network.manufacturer', verbose_name='производитель')),
+                ('owner', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='electronics_network.product', verbose_name='продукт')),
+                ('retail_network', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='electronics_network.retailnetwork', verbose_name='розничная сеть')),
+            ],
+            options={
+                'verbose_name': 'остаток',
+                'verbose_name_plural': 'остатки',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('manufacturer__isnull', False)), fields=('owner', 'product', 'manufacturer'), name='unique_stock_manufacturer'), models.UniqueConstraint(condition=models.Q(('retail_network__isnull', False)), fields=('owner', 'product', 'retail_network'), name='unique_stock_retail_network'), models.UniqueConstraint(condition=models.Q(('individual_entrepreneur__isnull', False)), fields=('owner', 'product', 'individual_entrepreneur'), name='unique_stock_individual_entrepreneur')],
+            },
+        ),
+        migrations.RunPython(fill_stock, migrations.RunPython.noop),
+    ]
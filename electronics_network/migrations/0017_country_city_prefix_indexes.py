@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:40
+
+from django.db import migrations
+
+DICTIONARY_TABLES = (
+    'electronics_network_country',
+    'electronics_network_city',
+)
+
+
+def create_prefix_indexes(apps, schema_editor):
+    """ Индексы для istartswith (UPPER(name) LIKE 'X%') автодополнения справочников в PostgreSQL """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in DICTIONARY_TABLES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_name_prefix '
+            f'ON {table} (UPPER(name::text) text_pattern_ops)'
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in DICTIONARY_TABLES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_name_prefix')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0016_stock'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
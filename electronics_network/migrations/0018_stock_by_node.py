@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:20
+
+from django.db import migrations, models
+
+
+NODE_FIELDS = ('manufacturer', 'retail_network', 'individual_entrepreneur')
+SIDES = (('buyer', 1), ('seller', -1))
+
+
+def clear_stock(apps, schema_editor):
+    """ Строки остатков по владельцам транзакций не сливаются в новый ключ — остатки считаются заново """
+    apps.get_model('electronics_network', 'Stock').objects.all().delete()
+
+
+def fill_stock(apps, schema_editor):
+    """ Остатки по всем транзакциям: групповой запрос на сторону и тип звена """
+    stock_model = apps.get_model('electronics_network', 'Stock')
+    transactions = apps.get_model('electronics_network', 'Transaction').objects.filter(product__isnull=False)
+    quantities = {}
+    for side, direction in SIDES:
+        for node in NODE_FIELDS:
+            column = f'{side}_{node}'
+            rows = (transactions.filter(**{f'{column}__isnull': False})
+                    .values('product', column).annotate(total=models.Sum('amount')).order_by())
+            for row in rows.iterator():
+                key = (row['product'], node, row[column])
+                quantities[key] = quantities.get(key, 0) + direction * row['total']
+    stock_model.objects.bulk_create((
+        stock_model(product_id=product_id, quantity=quantity, **{f'{node}_id': node_id})
+        for (product_id, node, node_id), quantity in quantities.items()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electronics_network', '0017_country_city_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='stock',
+            name='unique_stock_manufacturer',
+        ),
+        migrations.RemoveConstraint(
+            model_name='stock',
+            name='unique_stock_retail_network',
+        ),
+        migrations.RemoveConstraint(
+            model_name='stock',
+            name='unique_stock_individual_entrepreneur',
+        ),
+        migrations.RunPython(clear_stock, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='stock',
+            name='owner',
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(condition=models.Q(('manufacturer__isnull', False)), fields=('product', 'manufacturer'), name='unique_stock_manufacturer'),
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(condition=models.Q(('retail_network__isnull', False)), fields=('product', 'retail_network'), name='unique_stock_retail_network'),
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(condition=models.Q(('individual_entrepreneur__isnull', False)), fields=('product', 'individual_entrepreneur'), name='unique_stock_individual_entrepreneur'),
+        ),
+        migrations.RunPython(fill_stock, clear_stock),
+    ]
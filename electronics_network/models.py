@@ -1,7 +1,64 @@
+from decimal import Decimal
+
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.conf import settings
+from django.utils import timezone
+
+from electronics_network.addresses import canonical_name, name_key
+
+
+class Country(models.Model):
+    """ Страна """
+    name = models.CharField(max_length=255, verbose_name='название')
+    # название без учёта регистра и лишних пробелов: по нему справочник не даёт дублей
+    key = models.CharField(max_length=255, unique=True, editable=False, verbose_name='ключ')
+
+    def clean(self):
+        self.name, self.key = canonical_name(self.name), name_key(self.name)
+        if Country.objects.filter(key=self.key).exclude(pk=self.pk).exists():
+            raise ValidationError({'name': 'Такая страна уже есть в справочнике.'})
+
+    def save(self, *args, **kwargs):
+        # название и ключ — как у записей, созданных через addresses.get_country
+        self.name, self.key = canonical_name(self.name), name_key(self.name)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.name}"
+
+    class Meta:
+        """ Мета-данные """
+        verbose_name = 'страна'
+        verbose_name_plural = 'страны'
+
+
+class City(models.Model):
+    """ Город """
+    country = models.ForeignKey(Country, on_delete=models.PROTECT, related_name='cities', verbose_name='страна')
+    name = models.CharField(max_length=255, db_index=True, verbose_name='название')
+    key = models.CharField(max_length=255, editable=False, verbose_name='ключ')
+
+    def clean(self):
+        self.name, self.key = canonical_name(self.name), name_key(self.name)
+        if self.country_id and City.objects.filter(country_id=self.country_id, key=self.key).exclude(
+                pk=self.pk).exists():
+            raise ValidationError({'name': 'Такой город этой страны уже есть в справочнике.'})
+
+    def save(self, *args, **kwargs):
+        # название и ключ — как у записей, созданных через addresses.get_city
+        self.name, self.key = canonical_name(self.name), name_key(self.name)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.name}"
+
+    class Meta:
+        """ Мета-данные """
+        verbose_name = 'город'
+        verbose_name_plural = 'города'
+        constraints = [models.UniqueConstraint(fields=['country', 'key'], name='unique_city_country_key')]
 
 
 class Manufacturer(models.Model):
@@ -9,8 +66,8 @@ class Manufacturer(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, editable=False)
     name = models.CharField(max_length=255, verbose_name='название')
     email = models.EmailField(verbose_name='электронная почта')
-    country = models.CharField(max_length=255, verbose_name='страна')
-    city = models.CharField(max_length=255, verbose_name='город')
+    country = models.ForeignKey(Country, on_delete=models.PROTECT, related_name='+', verbose_name='страна')
+    city = models.ForeignKey(City, on_delete=models.PROTECT, related_name='+', verbose_name='город')
     street = models.CharField(max_length=255, verbose_name='улица')
     house_number = models.CharField(max_length=20, verbose_name='номер дома')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='дата создания')
@@ -35,8 +92,8 @@ class RetailNetwork(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, editable=False)
     name = models.CharField(max_length=255, verbose_name='название')
     email = models.EmailField(verbose_name='электронная почта')
-    country = models.CharField(max_length=255, verbose_name='страна')
-    city = models.CharField(max_length=255, verbose_name='город')
+    country = models.ForeignKey(Country, on_delete=models.PROTECT, related_name='+', verbose_name='страна')
+    city = models.ForeignKey(City, on_delete=models.PROTECT, related_name='+', verbose_name='город')
     street = models.CharField(max_length=255, verbose_name='улица')
     house_number = models.CharField(max_length=20, verbose_name='номер дома')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='дата создания')
@@ -74,8 +131,8 @@ class IndividualEntrepreneur(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, editable=False)
     name = models.CharField(max_length=255, verbose_name='имя')
     email = models.EmailField(verbose_name='электронная почта')
-    country = models.CharField(max_length=255, verbose_name='страна')
-    city = models.CharField(max_length=255, verbose_name='город')
+    country = models.ForeignKey(Country, on_delete=models.PROTECT, related_name='+', verbose_name='страна')
+    city = models.ForeignKey(City, on_delete=models.PROTECT, related_name='+', verbose_name='город')
     street = models.CharField(max_length=255, verbose_name='улица')
     house_number = models.CharField(max_length=20, verbose_name='номер дома')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='дата создания')
@@ -116,6 +173,41 @@ class IndividualEntrepreneur(models.Model):
         verbose_name_plural = 'индивидуальные предприниматели'
 
 
+class NetworkNode(models.Model):
+    """ Звено сети в единой таблице: производитель, розничная сеть или ИП с одним полем поставщика """
+    KIND_MANUFACTURER = 'manufacturer'
+    KIND_RETAIL_NETWORK = 'retail_network'
+    KIND_INDIVIDUAL_ENTREPRENEUR = 'individual_entrepreneur'
+    KIND_CHOICES = (
+        (KIND_MANUFACTURER, 'производитель'),
+        (KIND_RETAIL_NETWORK, 'розничная сеть'),
+        (KIND_INDIVIDUAL_ENTREPRENEUR, 'индивидуальный предприниматель'),
+    )
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, verbose_name='тип звена')
+    source_id = models.BigIntegerField(verbose_name='id в таблице типа')
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, editable=False)
+    name = models.CharField(max_length=255, verbose_name='название')
+    email = models.EmailField(verbose_name='электронная почта')
+    country = models.ForeignKey(Country, on_delete=models.PROTECT, related_name='+', verbose_name='страна')
+    city = models.ForeignKey(City, on_delete=models.PROTECT, related_name='+', verbose_name='город')
+    street = models.CharField(max_length=255, verbose_name='улица')
+    house_number = models.CharField(max_length=20, verbose_name='номер дома')
+    created_at = models.DateTimeField(verbose_name='дата создания')
+    level = models.IntegerField(verbose_name='уровень в иерархии')
+    supplier = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='customers',
+                                 verbose_name='поставщик')
+
+    def __str__(self):
+        return f"{self.name}"
+
+    class Meta:
+        """ Мета-данные """
+        verbose_name = 'звено сети'
+        verbose_name_plural = 'звенья сети'
+        constraints = [models.UniqueConstraint(fields=['kind', 'source_id'], name='unique_network_node_source')]
+
+
 class Product(models.Model):
     """ Продукт """
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, editable=False)
@@ -180,8 +272,17 @@ class Transaction(models.Model):
                                                       related_name='purchases_individual_entrepreneur',
                                                       verbose_name='покупатель-индивидуальный предприниматель')
 
+    # продавец и покупатель одной колонкой в режиме NETWORK_NODES_UNIFIED, заполняются по полям выше
+    seller = models.ForeignKey(NetworkNode, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                               related_name='sales', verbose_name='продавец')
+    buyer = models.ForeignKey(NetworkNode, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                              related_name='purchases', verbose_name='покупатель')
+
     amount = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)], verbose_name='количество')
     debt = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='долг')
+    # ключ помесячного секционирования в PostgreSQL; default вместо auto_now_add, чтобы задавать дату при загрузке
+    created_at = models.DateTimeField(default=timezone.now, editable=False, db_index=True,
+                                      verbose_name='дата создания')
 
     def clean(self):
         seller_fields = [
@@ -222,3 +323,173 @@ class Transaction(models.Model):
         """ Мета-данные """
         verbose_name = 'транзакция'
         verbose_name_plural = 'транзакции'
+
+
+class Payment(models.Model):
+    """ Оплата задолженности покупателя """
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, editable=False)
+    buyer_manufacturer = models.ForeignKey(Manufacturer, on_delete=models.CASCADE, null=True, blank=True,
+                                           related_name='payments_manufacturer',
+                                           verbose_name='покупатель-производитель')
+    buyer_retail_network = models.ForeignKey(RetailNetwork, on_delete=models.CASCADE, null=True, blank=True,
+                                             related_name='payments_retail_network',
+                                             verbose_name='покупатель-розничная сеть')
+    buyer_individual_entrepreneur = models.ForeignKey(IndividualEntrepreneur, on_delete=models.CASCADE,
+                                                      null=True, blank=True,
+                                                      related_name='payments_individual_entrepreneur',
+                                                      verbose_name='покупатель-индивидуальный предприниматель')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))],
+                                 verbose_name='сумма')
+    applied_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False,
+                                         verbose_name='зачтено в счёт долга')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='дата создания')
+
+    def __str__(self):
+        return f"Оплата: {self.amount} - Зачтено: {self.applied_amount}"
+
+    class Meta:
+        """ Мета-данные """
+        verbose_name = 'оплата'
+        verbose_name_plural = 'оплаты'
+
+
+class SalesRollup(models.Model):
+    """ Агрегат продаж и долга по продукту, стране производителя, уровню продавца и дню """
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, editable=False)
+    bucket = models.DateField(null=True, blank=True, verbose_name='день')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name='sales_rollups',
+                                verbose_name='продукт')
+    country = models.CharField(max_length=255, blank=True, default='', verbose_name='страна производителя')
+    seller_level = models.IntegerField(default=-1, verbose_name='уровень продавца')
+    transactions_count = models.IntegerField(default=0, verbose_name='количество транзакций')
+    amount = models.BigIntegerField(default=0, verbose_name='объём продаж')
+    debt = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name='долг')
+
+    def __str__(self):
+        return f"{self.bucket} - {self.product_id} - {self.country} - {self.seller_level}"
+
+    class Meta:
+        """ Мета-данные """
+        verbose_name = 'агрегат продаж'
+        verbose_name_plural = 'агрегаты продаж'
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'bucket', 'product', 'country', 'seller_level'],
+                                    name='unique_sales_rollup_dimensions'),
+        ]
+
+
+class Stock(models.Model):
+    """ Остаток продукта у звена сети: закупки минус продажи по транзакциям; звено — одно из трёх полей """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock', verbose_name='продукт')
+    manufacturer = models.ForeignKey(Manufacturer, on_delete=models.CASCADE, null=True, blank=True,
+                                     related_name='stock', verbose_name='производитель')
+    retail_network = models.ForeignKey(RetailNetwork, on_delete=models.CASCADE, null=True, blank=True,
+                                       related_name='stock', verbose_name='розничная сеть')
+    individual_entrepreneur = models.ForeignKey(IndividualEntrepreneur, on_delete=models.CASCADE, null=True,
+                                                blank=True, related_name='stock',
+                                                verbose_name='индивидуальный предприниматель')
+    quantity = models.BigIntegerField(default=0, verbose_name='количество')
+
+    def __str__(self):
+        node_id = self.manufacturer_id or self.retail_network_id or self.individual_entrepreneur_id
+        return f"{self.product_id} - {node_id} - {self.quantity}"
+
+    @property
+    def owner(self):
+        """ Владелец звена, для проверки прав на строку остатка """
+        node = self.manufacturer or self.retail_network or self.individual_entrepreneur
+        return node.owner
+
+    class Meta:
+        """ Мета-данные """
+        verbose_name = 'остаток'
+        verbose_name_plural = 'остатки'
+        constraints = [
+            models.UniqueConstraint(fields=['product', node], condition=models.Q(**{f'{node}__isnull': False}),
+                                    name=f'unique_stock_{node}')
+            for node in ('manufacturer', 'retail_network', 'individual_entrepreneur')
+        ]
+
+
+class Job(models.Model):
+    """ Фоновая задача """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'в очереди'),
+        (STATUS_RUNNING, 'выполняется'),
+        (STATUS_DONE, 'выполнена'),
+        (STATUS_FAILED, 'ошибка'),
+        (STATUS_CANCELLED, 'отменена'),
+    )
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                              editable=False)
+    name = models.CharField(max_length=255, verbose_name='задача')
+    params = models.JSONField(default=dict, blank=True, verbose_name='параметры')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True,
+                              verbose_name='статус')
+    cursor = models.JSONField(null=True, blank=True, verbose_name='позиция продолжения')
+    processed = models.PositiveIntegerField(default=0, verbose_name='обработано')
+    total = models.PositiveIntegerField(null=True, blank=True, verbose_name='всего')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='попытки')
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name='максимум попыток')
+    cancel_requested = models.BooleanField(default=False, verbose_name='запрошена отмена')
+    error = models.TextField(blank=True, verbose_name='ошибка')
+    run_after = models.DateTimeField(default=timezone.now, verbose_name='запустить после')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='взята в работу')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='дата создания')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='дата завершения')
+
+    def get_progress(self):
+        if not self.total:
+            return 100 if self.status == self.STATUS_DONE else 0
+        return min(100, self.processed * 100 // self.total)
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
+
+    class Meta:
+        """ Мета-данные """
+        verbose_name = 'фоновая задача'
+        verbose_name_plural = 'фоновые задачи'
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+
+class Change(models.Model):
+    """ Запись журнала изменений для ленты /changes/; порядок ленты — (txid, id) """
+    ACTION_CREATED = 'created'
+    ACTION_UPDATED = 'updated'
+    ACTION_DELETED = 'deleted'
+    ACTION_CHOICES = (
+        (ACTION_CREATED, 'создан'),
+        (ACTION_UPDATED, 'изменён'),
+        (ACTION_DELETED, 'удалён'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    # без внешнего ключа: надгробия каскадно удалённых объектов пишутся, пока удаляется и сам владелец
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False,
+                              null=True, blank=True, editable=False, related_name='+')
+    resource = models.CharField(max_length=32, verbose_name='ресурс')
+    object_id = models.PositiveBigIntegerField(verbose_name='id объекта')
+    action = models.CharField(max_length=8, choices=ACTION_CHOICES, verbose_name='действие')
+    # номер транзакции PostgreSQL, записавшей изменение; на других СУБД 0
+    txid = models.BigIntegerField(default=0, editable=False, verbose_name='транзакция')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='дата изменения')
+
+    def __str__(self):
+        return f"{self.resource} #{self.object_id} {self.action} ({self.pk})"
+
+    class Meta:
+        """ Мета-данные """
+        verbose_name = 'изменение'
+        verbose_name_plural = 'журнал изменений'
+        indexes = [
+            models.Index(fields=['txid', 'id']),
+            models.Index(fields=['owner', 'txid', 'id']),
+            models.Index(fields=['resource', 'object_id', 'txid', 'id']),
+        ]
@@ -0,0 +1,56 @@
+""" Получение многих объектов по id одним запросом
+
+GET <ресурс>/?ids=1,2,3, GET <ресурс>/batch/?ids=1,2,3 или POST <ресурс>/batch/ с телом {"ids": [1, 2, 3]}.
+
+Объекты выбираются одним запросом из queryset представления, поэтому права владельца и фильтры
+действуют как для списка. Отсутствующие и чужие id не ломают пакет, а возвращаются в not_found,
+значения, не являющиеся id, — в invalid.
+"""
+from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from electronics_network.fastpath import serialize_rows
+
+IDS_PARAM = 'ids'
+
+
+class MultiGetViewMixin:
+    """ Действие batch и параметр ids списка для GenericViewSet; в базовых классах стоит перед list() """
+    batch_max_size = 500
+
+    def get_batch_ids(self, request):
+        """ Запрошенные id без повторов и значения, не являющиеся id """
+        if request.method == 'GET':
+            value = request.query_params.get(IDS_PARAM, '')
+            data = [item for item in value.split(',') if item]
+        else:
+            data = request.data.get(IDS_PARAM) if isinstance(request.data, dict) else request.data
+        field = serializers.ListField(allow_empty=False, max_length=self.batch_max_size)
+        try:
+            data = field.run_validation(data)
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({IDS_PARAM: exc.detail})
+
+        id_field = serializers.IntegerField(min_value=1)
+        ids, invalid = {}, {}
+        for item in data:
+            try:
+                ids[id_field.run_validation(item)] = None
+            except serializers.ValidationError:
+                invalid[str(item)] = None
+        return list(ids), list(invalid)
+
+    def list(self, request, *args, **kwargs):
+        if IDS_PARAM in request.query_params:
+            return self.batch(request, *args, **kwargs)
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['get', 'post'])
+    def batch(self, request, *args, **kwargs):
+        ids, invalid = self.get_batch_ids(request)
+        queryset = self.filter_queryset(self.get_queryset()).filter(pk__in=ids)
+        rows = serialize_rows(self.get_serializer(many=True), queryset)
+        # порядок ответа — порядок запрошенных id
+        return Response({'results': [rows[pk] for pk in ids if pk in rows],
+                         'not_found': [pk for pk in ids if pk not in rows], 'invalid': invalid})
@@ -0,0 +1,140 @@
+""" Единая таблица звеньев сети (NetworkNode) — зеркало таблиц звеньев
+
+Производители, розничные сети и ИП по-прежнему хранятся в своих таблицах: они остаются источником данных,
+и API работает с ними. В режиме NETWORK_NODES_UNIFIED каждое звено дополнительно зеркалируется в NetworkNode
+с типом и одним полем поставщика, а у транзакции заполняются колонки seller и buyer. Поиск сделок контрагента
+(counterparty_filter, список транзакций в админке) тогда читает по одной индексированной колонке на роль вместо
+OR по трём внешним ключам с JOIN'ами; ценой зеркала каждая запись звена и транзакции пишет ещё строку NetworkNode
+или две колонки. Без режима зеркало не обновляется.
+"""
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, NetworkNode, Transaction
+
+KINDS = {Manufacturer: NetworkNode.KIND_MANUFACTURER, RetailNetwork: NetworkNode.KIND_RETAIL_NETWORK,
+         IndividualEntrepreneur: NetworkNode.KIND_INDIVIDUAL_ENTREPRENEUR}
+# поля транзакции с продавцом и покупателем каждого типа
+ROLE_FIELDS = {
+    'seller': {NetworkNode.KIND_MANUFACTURER: 'seller_manufacturer',
+               NetworkNode.KIND_RETAIL_NETWORK: 'seller_retail_network',
+               NetworkNode.KIND_INDIVIDUAL_ENTREPRENEUR: 'seller_individual_entrepreneur'},
+    'buyer': {NetworkNode.KIND_MANUFACTURER: 'buyer_manufacturer',
+              NetworkNode.KIND_RETAIL_NETWORK: 'buyer_retail_network',
+              NetworkNode.KIND_INDIVIDUAL_ENTREPRENEUR: 'buyer_individual_entrepreneur'},
+}
+ADDRESS_FIELDS = ('owner', 'name', 'email', 'country', 'city', 'street', 'house_number', 'created_at', 'level')
+
+
+def address_columns(model):
+    """ Колонки ADDRESS_FIELDS модели: для внешних ключей — id, как в исторических моделях миграций """
+    return [model._meta.get_field(field).attname for field in ADDRESS_FIELDS]
+
+
+def is_unified():
+    return settings.NETWORK_NODES_UNIFIED
+
+
+def _supplier(instance):
+    """ Поставщик звена: завод или розничная сеть, в зависимости от заполненного поля """
+    if isinstance(instance, Manufacturer):
+        return None
+    return instance.manufacturer or instance.retail_network
+
+
+def sync_node(instance):
+    """ Создать или обновить запись NetworkNode для производителя, розничной сети или ИП """
+    supplier = _supplier(instance)
+    defaults = {column: getattr(instance, column) for column in address_columns(type(instance))}
+    defaults['supplier'] = get_node(supplier) if supplier is not None else None
+    node, _ = NetworkNode.objects.update_or_create(kind=KINDS[type(instance)], source_id=instance.pk,
+                                                   defaults=defaults)
+    return node
+
+
+def get_node(instance):
+    """ NetworkNode звена; создаётся, если звено ещё не зеркалировано """
+    node = NetworkNode.objects.filter(kind=KINDS[type(instance)], source_id=instance.pk).first()
+    return node or sync_node(instance)
+
+
+def delete_node(instance):
+    NetworkNode.objects.filter(kind=KINDS[type(instance)], source_id=instance.pk).delete()
+
+
+def assign_transaction_nodes(transaction):
+    """ Заполнить seller и buyer транзакции по полям продавца и покупателя конкретного типа """
+    for role, fields in ROLE_FIELDS.items():
+        instance = next((getattr(transaction, field) for field in fields.values()
+                         if getattr(transaction, f'{field}_id') is not None), None)
+        setattr(transaction, role, get_node(instance) if instance is not None else None)
+
+
+def counterparty_filter(owner=None, role=None, node=None):
+    """ Условие на транзакции, где продавцом или покупателем (role: seller, buyer, None — любой)
+    выступает звено node или любое звено владельца owner.
+
+    В режиме NETWORK_NODES_UNIFIED на каждую роль — одно условие по индексированной колонке seller или buyer
+    с подзапросом к NetworkNode, без JOIN'ов; иначе — OR по полям всех типов.
+    """
+    roles = [role] if role else list(ROLE_FIELDS)
+    if is_unified():
+        if node is not None:
+            network_nodes = NetworkNode.objects.filter(kind=KINDS[type(node)], source_id=node.pk)
+        else:
+            network_nodes = NetworkNode.objects.filter(owner=owner)
+        network_nodes = network_nodes.values('pk')
+        return reduce(or_, (Q(**{f'{current_role}__in': network_nodes}) for current_role in roles))
+
+    condition = Q()
+    for current_role in roles:
+        for kind, field in ROLE_FIELDS[current_role].items():
+            if node is not None:
+                if KINDS[type(node)] == kind:
+                    condition |= Q(**{field: node})
+            else:
+                condition |= Q(**{f'{field}__owner': owner})
+    return condition
+
+
+def rebuild():
+    """ Привести NetworkNode к таблицам звеньев и проставить seller и buyer всем транзакциям.
+
+    Записи существующих звеньев обновляются на месте, поэтому их id и ссылки на них не меняются;
+    для новых звеньев записи создаются, записи удалённых звеньев удаляются. Используется командой sync_network_nodes.
+    """
+    for model, kind in KINDS.items():
+        existing = dict(NetworkNode.objects.filter(kind=kind).values_list('source_id', 'pk'))
+        updated, created = [], []
+        for row in model.objects.values('id', *address_columns(model)).iterator(chunk_size=1000):
+            node = NetworkNode(kind=kind, source_id=row.pop('id'), **row)
+            node.pk = existing.pop(node.source_id, None)
+            (updated if node.pk else created).append(node)
+        NetworkNode.objects.bulk_update(updated, ADDRESS_FIELDS, batch_size=1000)
+        NetworkNode.objects.bulk_create(created, batch_size=1000)
+        NetworkNode.objects.filter(pk__in=existing.values()).delete()
+
+    # поставщик: розничная сеть или ИП ссылаются на завод либо на розничную сеть
+    for model, kind in KINDS.items():
+        if kind == NetworkNode.KIND_MANUFACTURER:
+            continue
+        # source_id обновляемой строки — два уровня подзапросов вверх
+        source = model.objects.filter(pk=OuterRef(OuterRef('source_id')))
+        NetworkNode.objects.filter(kind=kind).update(supplier=Coalesce(*(
+            Subquery(NetworkNode.objects.filter(kind=supplier_kind, source_id=Subquery(
+                source.values(supplier_field)[:1])).values('pk')[:1])
+            for supplier_kind, supplier_field in ((NetworkNode.KIND_MANUFACTURER, 'manufacturer_id'),
+                                                  (NetworkNode.KIND_RETAIL_NETWORK, 'retail_network_id'))
+        )))
+
+    for role, fields in ROLE_FIELDS.items():
+        Transaction.objects.filter(**{f'{field}__isnull': True for field in fields.values()}) \
+            .exclude(**{f'{role}__isnull': True}).update(**{role: None})
+        for kind, field in fields.items():
+            Transaction.objects.filter(**{f'{field}__isnull': False}).update(**{role: Subquery(
+                NetworkNode.objects.filter(kind=kind, source_id=OuterRef(f'{field}_id')).values('pk')[:1]
+            )})
@@ -1,4 +1,7 @@
 """ Пагинаторы приложения electronics_network """
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from rest_framework.pagination import PageNumberPagination
 
 
@@ -35,3 +38,57 @@ class TransactionPagination(PageNumberPagination):
     page_size = 5
     page_size_query_param = 'page_size'
     max_page_size = 50
+
+
+class PaymentPagination(PageNumberPagination):
+    """ Пагинатор для вывода оплат """
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+
+class StockPagination(PageNumberPagination):
+    """ Пагинатор для вывода остатков """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class CountedPaginator(Paginator):
+    """ Пагинатор, который считает строки не по самой выборке, а по count_queryset с тем же числом строк """
+
+    def __init__(self, object_list, per_page, *args, count_queryset, **kwargs):
+        super().__init__(object_list, per_page, *args, **kwargs)
+        self.count_queryset = count_queryset
+
+    @cached_property
+    def count(self):
+        return self.count_queryset.count()
+
+
+class EstimatedCountPaginator(Paginator):
+    """ Пагинатор админки без точного COUNT(*) по всей таблице.
+
+    Считает строки не дальше count_cap. Если их больше, для нефильтрованной выборки в PostgreSQL
+    берётся оценка планировщика из pg_class.reltuples, иначе количество ограничивается count_cap.
+    """
+    count_cap = 10000
+
+    @cached_property
+    def count(self):
+        capped = self.object_list[:self.count_cap + 1].count()
+        if capped <= self.count_cap:
+            return capped
+        return max(self._estimated_count() or 0, self.count_cap)
+
+    def _estimated_count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql' or query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [self.object_list.model._meta.db_table])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
@@ -0,0 +1,114 @@
+""" Помесячное секционирование таблицы транзакций в PostgreSQL
+
+Таблица транзакций секционирована по RANGE (created_at): одна секция на календарный месяц
+(границы месяца в часовом поясе TIME_ZONE) и секция по умолчанию для строк вне созданных секций.
+Запросы с условием на created_at читают только нужные секции, а старые месяцы отсоединяются
+целиком без DELETE и последующего VACUUM. В остальных СУБД таблица обычная.
+"""
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from electronics_network.models import Transaction
+
+TABLE = Transaction._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+class PartitioningNotSupported(Exception):
+    """ Таблица транзакций не секционирована (СУБД не PostgreSQL) """
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def _check_partitioned():
+    if not is_partitioned():
+        raise PartitioningNotSupported('Секционирование транзакций поддерживается только в PostgreSQL')
+
+
+def month_start(value):
+    """ Начало месяца, в который попадает момент value, в текущем часовом поясе """
+    value = timezone.localtime(value)
+    return timezone.make_aware(datetime(value.year, value.month, 1))
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1))
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def list_partitions():
+    """ Секции таблицы транзакций: [(имя, границы)] по возрастанию имени """
+    _check_partitioned()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) '
+            'FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = %s::regclass ORDER BY child.relname',
+            [TABLE],
+        )
+        return cursor.fetchall()
+
+
+@transaction.atomic
+def create_partition(month):
+    """ Создать секцию месяца, если её нет; строки этого месяца переносятся в неё из секции по умолчанию.
+
+    Секция по умолчанию на время переноса отсоединяется: PostgreSQL не создаёт секцию,
+    пока подходящие ей строки лежат в секции по умолчанию.
+    """
+    _check_partitioned()
+    month = month_start(month)
+    name = partition_name(month)
+    if name in dict(list_partitions()):
+        return False
+    bounds = [month, add_months(month, 1)]
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+        cursor.execute(f'CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)', bounds)
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s '
+            f'RETURNING *) INSERT INTO {name} SELECT * FROM moved',
+            bounds,
+        )
+        cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+    return True
+
+
+def ensure_partitions(ahead=3, now=None):
+    """ Создать секции текущего месяца и ahead следующих, вернуть имена созданных """
+    current = month_start(now or timezone.now())
+    created = []
+    for offset in range(ahead + 1):
+        month = add_months(current, offset)
+        if create_partition(month):
+            created.append(partition_name(month))
+    return created
+
+
+@transaction.atomic
+def detach_partition(month, drop=False):
+    """ Отсоединить секцию месяца от таблицы транзакций (для архивации) или удалить её.
+
+    Агрегаты продаж не пересчитываются: отсоединённые месяцы остаются в аналитике.
+    """
+    _check_partitioned()
+    name = partition_name(month_start(month))
+    if name not in dict(list_partitions()):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+        if drop:
+            cursor.execute(f'DROP TABLE {name}')
+    return True
@@ -0,0 +1,86 @@
+""" Зачёт оплат в счёт задолженности по транзакциям """
+from django.db import transaction
+from django.db.models import Case, F, When, Value, DecimalField
+
+from electronics_network import changes, rollups
+from electronics_network.models import Payment, Transaction
+
+BUYER_FIELDS = ('buyer_manufacturer', 'buyer_retail_network', 'buyer_individual_entrepreneur')
+
+# сколько строк-кандидатов читается за шаг; блокируются только те, что покрывают остаток оплаты
+BATCH_SIZE = 50
+# сколько проходов пропускают занятые строки; последний проход ждёт их освобождения
+MAX_PASSES = 3
+OLDEST_FIRST = ('created_at', 'pk')
+
+
+def get_payment_buyer_filter(payment):
+    return {f'{field}_id': getattr(payment, f'{field}_id') for field in BUYER_FIELDS
+            if getattr(payment, f'{field}_id') is not None}
+
+
+def _covering(rows, remaining):
+    """ Первые строки (pk, долг), долга которых хватает на остаток оплаты """
+    needed = []
+    for pk, debt in rows:
+        needed.append(pk)
+        remaining -= debt
+        if remaining <= 0:
+            break
+    return needed
+
+
+def apply_payment(payment, transactions):
+    """ Зачесть оплату в счёт долга по транзакциям покупателя, начиная с самых старых.
+
+    На каждом шаге без блокировки читаются самые старые транзакции с долгом, и блокируются
+    (SELECT ... FOR UPDATE SKIP LOCKED) только те из них, долга которых хватает на остаток оплаты.
+    Параллельные оплаты одного покупателя забирают разные строки и не ждут друг друга; занятые строки
+    пропускаются, и лишь если после нескольких проходов долг остался только в них, последний проход ждёт
+    их блокировки. Строки блокируются в одном порядке (created_at, pk), поэтому взаимоблокировок не возникает.
+
+    Долг уменьшается арифметикой в самой базе (debt = debt - x), а applied_amount оплаты растёт
+    в той же транзакции, что и блокировка строк. Поэтому после сбоя зачтённая сумма совпадает с уменьшением
+    долга, а повторный вызов зачитывает только незачтённый остаток. Возвращает зачтённую сумму.
+    """
+    transactions = transactions.filter(**get_payment_buyer_filter(payment))
+    payment.refresh_from_db(fields=['applied_amount'])
+    remaining = payment.amount - payment.applied_amount
+    for attempt in range(MAX_PASSES):
+        skip_locked = attempt < MAX_PASSES - 1
+        skipped = set()
+        while remaining > 0:
+            candidates = (transactions.filter(debt__gt=0).exclude(pk__in=skipped).order_by(*OLDEST_FIRST)
+                          .values_list('pk', 'debt')[:BATCH_SIZE])
+            needed = _covering(candidates, remaining)
+            if not needed:
+                break
+            with transaction.atomic():
+                rows = list(
+                    transactions.select_for_update(skip_locked=skip_locked)
+                    .filter(pk__in=needed, debt__gt=0)
+                    .order_by(*OLDEST_FIRST)
+                    .values_list('pk', 'debt')
+                )
+                skipped.update(set(needed) - {pk for pk, _ in rows})
+                payments = {}
+                for pk, debt in rows:
+                    if remaining <= 0:
+                        break
+                    payments[pk] = min(debt, remaining)
+                    remaining -= payments[pk]
+                if not payments:
+                    continue
+                Transaction.objects.filter(pk__in=payments).update(debt=F('debt') - Case(
+                    *[When(pk=pk, then=Value(value)) for pk, value in payments.items()],
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                ))
+                rollups.record_debt_changes({pk: -value for pk, value in payments.items()})
+                changes.record_updates(Transaction.objects.filter(pk__in=payments))
+                Payment.objects.filter(pk=payment.pk).update(
+                    applied_amount=F('applied_amount') + sum(payments.values()))
+        if remaining <= 0 or not transactions.filter(debt__gt=0).exists():
+            break
+
+    payment.refresh_from_db(fields=['applied_amount'])
+    return payment.applied_amount
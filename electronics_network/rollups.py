@@ -0,0 +1,95 @@
+""" Инкрементальные агрегаты продаж (SalesRollup) по транзакциям """
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+from electronics_network.models import SalesRollup, Transaction
+
+# измерения агрегата в терминах запроса к транзакциям
+DIMENSIONS = {
+    'bucket': TruncDate('created_at'),
+    'country': Coalesce('product__manufacturer__country__name', Value('')),
+    'seller_level': Coalesce('seller_manufacturer__level', 'seller_retail_network__level',
+                             'seller_individual_entrepreneur__level', Value(-1)),
+}
+DIMENSION_FIELDS = ('owner', 'product')
+
+
+def get_dimensions(queryset):
+    """ Измерения и показатели каждой транзакции выборки одним запросом """
+    return queryset.values('pk', 'amount', 'debt', *DIMENSION_FIELDS, **DIMENSIONS)
+
+
+def _key(row):
+    return (row['owner'], row['bucket'], row['product'], row['country'], row['seller_level'])
+
+
+def apply_deltas(deltas):
+    """ Прибавить к агрегатам {ключ: [транзакции, количество, долг]} арифметикой в базе """
+    for (owner_id, bucket, product_id, country, seller_level), (count, amount, debt) in deltas.items():
+        if not (count or amount or debt):
+            continue
+        lookup = {'owner_id': owner_id, 'bucket': bucket, 'product_id': product_id, 'country': country,
+                  'seller_level': seller_level}
+        changes = {'transactions_count': F('transactions_count') + count, 'amount': F('amount') + amount,
+                   'debt': F('debt') + debt}
+        if SalesRollup.objects.filter(**lookup).update(**changes):
+            continue
+        if count <= 0:
+            # строки агрегата нет только после каскадного удаления продукта или владельца вместе с транзакциями
+            continue
+        try:
+            with transaction.atomic():
+                SalesRollup.objects.create(transactions_count=count, amount=amount, debt=debt, **lookup)
+        except IntegrityError:
+            # строку агрегата параллельно создала другая транзакция
+            SalesRollup.objects.filter(**lookup).update(**changes)
+
+
+def add_rows(deltas, rows, sign):
+    for row in rows:
+        delta = deltas[_key(row)]
+        delta[0] += sign
+        delta[1] += sign * row['amount']
+        delta[2] += sign * row['debt']
+
+
+def new_deltas():
+    return defaultdict(lambda: [0, 0, Decimal('0')])
+
+
+def record_debt_changes(changes):
+    """ Учесть изменение долга {pk транзакции: прирост долга}, сделанное через QuerySet.update() """
+    deltas = new_deltas()
+    for row in get_dimensions(Transaction.objects.filter(pk__in=changes)):
+        deltas[_key(row)][2] += changes[row['pk']]
+    apply_deltas(deltas)
+
+
+def record_debt_cleared(queryset):
+    """ Учесть обнуление долга по выборке транзакций до вызова update(debt=0) """
+    deltas = new_deltas()
+    for row in get_dimensions(queryset):
+        deltas[_key(row)][2] -= row['debt']
+    apply_deltas(deltas)
+
+
+@transaction.atomic
+def rebuild():
+    """ Пересчитать все агрегаты одним групповым запросом по транзакциям """
+    SalesRollup.objects.all().delete()
+    rows = (
+        Transaction.objects
+        .values(*DIMENSION_FIELDS, **DIMENSIONS)
+        .annotate(transactions_count=Count('pk'), amount_sum=Sum('amount'), debt_sum=Sum('debt'))
+        .order_by()
+    )
+    SalesRollup.objects.bulk_create([
+        SalesRollup(owner_id=row['owner'], bucket=row['bucket'], product_id=row['product'], country=row['country'],
+                    seller_level=row['seller_level'], transactions_count=row['transactions_count'],
+                    amount=row['amount_sum'], debt=row['debt_sum'])
+        for row in rows.iterator()
+    ], batch_size=1000)
@@ -1,5 +1,11 @@
 from rest_framework import serializers
-from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction
+from config.tracing import TracingSerializerMixin, TracedListSerializer
+from electronics_network.addresses import resolve_address
+from electronics_network.expansion import ExpandableSerializerMixin
+from electronics_network.fastpath import ValuesField, ValuesListSerializer
+from electronics_network.fieldsets import SparseFieldsSerializerMixin
+from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction, \
+    Payment, Stock
 
 
 class ManufacturerOnlyNameSerializer(serializers.ModelSerializer):
@@ -24,19 +30,52 @@ class IndividualEntrepreneurOnlyNameSerializer(serializers.ModelSerializer):
         fields = ['name']
 
 
-class ManufacturerSerializer(serializers.ModelSerializer):
+class AddressSerializerMixin:
+    """ Страна и город звена сети строками: на входе названия приводятся к записям справочников Country и City """
+    address_fields = ('country', 'city')
+
+    # в режиме values название читается JOIN'ом со справочником
+    values_fields = {
+        'country': ValuesField(lambda row, many: row['country__name'], columns=('country__name', )),
+        'city': ValuesField(lambda row, many: row['city__name'], columns=('city__name', )),
+    }
+
+    def build_relational_field(self, field_name, relation_info):
+        if field_name in self.address_fields:
+            return serializers.CharField, {'max_length': 255, 'label': relation_info.model_field.verbose_name}
+        return super().build_relational_field(field_name, relation_info)
+
+    def resolve_address(self, validated_data, instance=None):
+        if 'country' in validated_data or 'city' in validated_data:
+            validated_data.update(resolve_address(
+                validated_data.get('country') or instance.country.name,
+                validated_data.get('city') or instance.city.name,
+            ))
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self.resolve_address(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self.resolve_address(validated_data, instance))
+
+
+class ManufacturerSerializer(TracingSerializerMixin, SparseFieldsSerializerMixin, ExpandableSerializerMixin,
+                             AddressSerializerMixin, serializers.ModelSerializer):
     """ Производитель """
 
     class Meta:
         model = Manufacturer
-        fields = '__all__'
+        fields = ['id', 'name', 'email', 'country', 'city', 'street', 'house_number', 'created_at', 'level', 'owner']
+        list_serializer_class = ValuesListSerializer
 
-class RetailNetworkWriteSerializer(serializers.ModelSerializer):
+class RetailNetworkWriteSerializer(TracingSerializerMixin, AddressSerializerMixin, serializers.ModelSerializer):
     """ Розничная сеть для записи """
 
     class Meta:
         model = RetailNetwork
-        fields = '__all__'
+        fields = ['id', 'name', 'email', 'country', 'city', 'street', 'house_number', 'created_at', 'level', 'owner',
+                  'manufacturer', 'retail_network']
         extra_kwargs = {
             'manufacturer': {'required': False},
             'retail_network': {'required': False},
@@ -58,23 +97,30 @@ class RetailNetworkWriteSerializer(serializers.ModelSerializer):
         return data
 
 
-class RetailNetworkReadSerializer(serializers.ModelSerializer):
+class RetailNetworkReadSerializer(TracingSerializerMixin, SparseFieldsSerializerMixin, ExpandableSerializerMixin,
+                                  AddressSerializerMixin, serializers.ModelSerializer):
     """ Розничная сеть для чтения """
 
     retail_network = RetailNetworkOnlyNameSerializer(read_only=True)
     manufacturer = ManufacturerOnlyNameSerializer(read_only=True)
 
+    expandable_fields = {'manufacturer': 'ManufacturerSerializer', 'retail_network': 'RetailNetworkReadSerializer'}
+
     class Meta:
         model = RetailNetwork
-        fields = '__all__'
+        fields = ['id', 'retail_network', 'manufacturer', 'name', 'email', 'country', 'city', 'street', 'house_number',
+                  'created_at', 'level', 'owner']
+        list_serializer_class = ValuesListSerializer
 
 
-class IndividualEntrepreneurWriteSerializer(serializers.ModelSerializer):
+class IndividualEntrepreneurWriteSerializer(TracingSerializerMixin, AddressSerializerMixin,
+                                            serializers.ModelSerializer):
     """ Индивидуальный предприниматель для записи """
 
     class Meta:
         model = IndividualEntrepreneur
-        fields = '__all__'
+        fields = ['id', 'name', 'email', 'country', 'city', 'street', 'house_number', 'created_at', 'level', 'owner',
+                  'manufacturer', 'retail_network']
         extra_kwargs = {
             'manufacturer': {'required': False},
             'retail_network': {'required': False},
@@ -96,30 +142,78 @@ class IndividualEntrepreneurWriteSerializer(serializers.ModelSerializer):
         return data
 
 
-class IndividualEntrepreneurReadSerializer(serializers.ModelSerializer):
+class IndividualEntrepreneurReadSerializer(TracingSerializerMixin, SparseFieldsSerializerMixin,
+                                           ExpandableSerializerMixin, AddressSerializerMixin,
+                                           serializers.ModelSerializer):
     """ Индивидуальный предприниматель для чтения """
 
     retail_network = RetailNetworkOnlyNameSerializer(read_only=True)
     manufacturer = ManufacturerOnlyNameSerializer(read_only=True)
 
+    expandable_fields = {'manufacturer': 'ManufacturerSerializer', 'retail_network': 'RetailNetworkReadSerializer'}
+
     class Meta:
         model = IndividualEntrepreneur
-        fields = '__all__'
+        fields = ['id', 'retail_network', 'manufacturer', 'name', 'email', 'country', 'city', 'street', 'house_number',
+                  'created_at', 'level', 'owner']
+        list_serializer_class = ValuesListSerializer
 
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TracingSerializerMixin, SparseFieldsSerializerMixin, ExpandableSerializerMixin,
+                        serializers.ModelSerializer):
     """ Продукт """
     retailers = RetailNetworkOnlyNameSerializer(many=True, read_only=True)
     entrepreneurs = IndividualEntrepreneurOnlyNameSerializer(many=True, read_only=True)
     manufacturer = ManufacturerOnlyNameSerializer(read_only=True)
+    supplier_levels = serializers.ListField(source='get_supplier_levels', child=serializers.IntegerField(),
+                                            read_only=True)
+
+    expandable_fields = {'manufacturer': 'ManufacturerSerializer', 'retailers': 'RetailNetworkReadSerializer',
+                         'entrepreneurs': 'IndividualEntrepreneurReadSerializer'}
+
+    # get_supplier_levels для режима values: уровень производителя, затем розничных сетей и ИП
+    values_fields = {
+        'supplier_levels': ValuesField(
+            lambda row, many: ([row['manufacturer__level']] if row['manufacturer'] is not None else [])
+            + [retailer['level'] for retailer in many['retailers']]
+            + [entrepreneur['level'] for entrepreneur in many['entrepreneurs']],
+            columns=('manufacturer', 'manufacturer__level'),
+            many={'retailers': ('level', ), 'entrepreneurs': ('level', )},
+        ),
+    }
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'model', 'release_date', 'created_at', 'owner', 'manufacturer', 'retailers', 'entrepreneurs']
+        fields = ['id', 'name', 'model', 'release_date', 'created_at', 'owner', 'manufacturer', 'retailers',
+                  'entrepreneurs', 'supplier_levels']
+        list_serializer_class = ValuesListSerializer
+
+
+class ProductSuppliersSerializer(serializers.Serializer):
+    """ Продукты и поставщики для массового добавления и удаления связей """
+    MAX_IDS = 1000
+    MAX_LINKS = 200000
 
+    products = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                     max_length=MAX_IDS)
+    retailers = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                      max_length=MAX_IDS)
+    entrepreneurs = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                          max_length=MAX_IDS)
 
-class TransactionReadSerializer(serializers.ModelSerializer):
+    def validate(self, data):
+        data = {name: list(dict.fromkeys(ids)) for name, ids in data.items()}
+        suppliers = len(data.get('retailers', [])) + len(data.get('entrepreneurs', []))
+        if not suppliers:
+            raise serializers.ValidationError("Укажите розничные сети или предпринимателей.")
+        if len(data['products']) * suppliers > self.MAX_LINKS:
+            raise serializers.ValidationError(f"За один запрос можно изменить не больше {self.MAX_LINKS} связей.")
+        return data
+
+
+class TransactionReadSerializer(TracingSerializerMixin, SparseFieldsSerializerMixin, ExpandableSerializerMixin,
+                                serializers.ModelSerializer):
     """ Транзакция для чтения """
     product = serializers.StringRelatedField()
     seller_manufacturer = serializers.StringRelatedField()
@@ -129,16 +223,29 @@ class TransactionReadSerializer(serializers.ModelSerializer):
     buyer_retail_network = serializers.StringRelatedField()
     buyer_individual_entrepreneur = serializers.StringRelatedField()
 
+    expandable_fields = {
+        'product': 'ProductSerializer',
+        'seller_manufacturer': 'ManufacturerSerializer',
+        'seller_retail_network': 'RetailNetworkReadSerializer',
+        'seller_individual_entrepreneur': 'IndividualEntrepreneurReadSerializer',
+        'buyer_manufacturer': 'ManufacturerSerializer',
+        'buyer_retail_network': 'RetailNetworkReadSerializer',
+        'buyer_individual_entrepreneur': 'IndividualEntrepreneurReadSerializer',
+    }
+
     class Meta:
         model = Transaction
-        fields = '__all__'
+        # seller и buyer — внутренние колонки режима NETWORK_NODES_UNIFIED, формат API прежний
+        exclude = ('seller', 'buyer')
+        list_serializer_class = ValuesListSerializer
 
 
-class TransactionWriteSerializer(serializers.ModelSerializer):
+class TransactionWriteSerializer(TracingSerializerMixin, serializers.ModelSerializer):
     """ Транзакция для записи """
     class Meta:
         model = Transaction
-        fields = '__all__'
+        # seller и buyer — внутренние колонки режима NETWORK_NODES_UNIFIED, формат API прежний
+        exclude = ('seller', 'buyer')
         extra_kwargs = {
             'product': {'required': True},
             'seller_manufacturer': {'required': True},
@@ -181,4 +288,34 @@ class TransactionWriteSerializer(serializers.ModelSerializer):
         if seller not in product_suppliers:
             raise serializers.ValidationError("Продавец не совпадает с поставщиком транзакции.")
 
-        return data
\ No newline at end of file
+        return data
+
+
+class PaymentSerializer(TracingSerializerMixin, serializers.ModelSerializer):
+    """ Оплата задолженности """
+
+    class Meta:
+        model = Payment
+        fields = '__all__'
+        list_serializer_class = TracedListSerializer
+
+    def validate(self, data):
+        buyer_fields = [
+            data.get('buyer_manufacturer'),
+            data.get('buyer_retail_network'),
+            data.get('buyer_individual_entrepreneur'),
+        ]
+
+        if sum(bool(field) for field in buyer_fields) != 1:
+            raise serializers.ValidationError("Выберите только одно поле покупателя.")
+
+        return data
+
+
+class StockSerializer(TracingSerializerMixin, serializers.ModelSerializer):
+    """ Остаток продукта у звена сети """
+
+    class Meta:
+        model = Stock
+        fields = ['id', 'product', 'manufacturer', 'retail_network', 'individual_entrepreneur', 'quantity']
+        list_serializer_class = ValuesListSerializer
@@ -0,0 +1,179 @@
+""" Сигналы для electronics_network """
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from electronics_network import changes, facets, hierarchy, jobs, nodes, rollups, stock
+from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction, \
+    Payment, Change
+
+
+def _own_row(instance):
+    # условие на created_at оставляет в плане одну секцию таблицы транзакций
+    return Transaction.objects.filter(pk=instance.pk, created_at=instance.created_at)
+
+
+@receiver(pre_save, sender=Transaction)
+@receiver(pre_delete, sender=Transaction)
+def remember_transaction_rollup(sender, instance, **kwargs):
+    """ Запомнить измерения транзакции до изменения, чтобы вычесть их из агрегатов """
+    instance._rollup_old = list(rollups.get_dimensions(_own_row(instance))) if instance.pk else []
+
+
+@receiver(post_save, sender=Transaction)
+def update_rollup_on_save(sender, instance, **kwargs):
+    deltas = rollups.new_deltas()
+    rollups.add_rows(deltas, getattr(instance, '_rollup_old', []), -1)
+    rollups.add_rows(deltas, rollups.get_dimensions(_own_row(instance)), 1)
+    rollups.apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=Transaction)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    deltas = rollups.new_deltas()
+    rollups.add_rows(deltas, getattr(instance, '_rollup_old', []), -1)
+    rollups.apply_deltas(deltas)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_transaction_stock(sender, instance, **kwargs):
+    """ Запомнить движение транзакции до изменения, чтобы вернуть его в остатки """
+    instance._stock_old = list(stock.get_movements(_own_row(instance))) if instance.pk else []
+
+
+@receiver(post_save, sender=Transaction)
+def update_stock_on_save(sender, instance, **kwargs):
+    deltas = stock.new_deltas()
+    stock.add_rows(deltas, getattr(instance, '_stock_old', []), -1)
+    stock.add_rows(deltas, [stock.instance_movement(instance)], 1)
+    stock.apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=Transaction)
+def update_stock_on_delete(sender, instance, **kwargs):
+    # движение удаляемой транзакции возвращается по полям экземпляра, без запроса к базе
+    deltas = stock.new_deltas()
+    stock.add_rows(deltas, [stock.instance_movement(instance)], -1)
+    stock.apply_deltas(deltas, create=False)
+
+
+@receiver(pre_save, sender=Transaction)
+def assign_transaction_nodes(sender, instance, **kwargs):
+    """ Продавец и покупатель одной колонкой в режиме единой таблицы звеньев """
+    if nodes.is_unified():
+        nodes.assign_transaction_nodes(instance)
+
+
+@receiver(post_save, sender=Manufacturer)
+@receiver(post_save, sender=RetailNetwork)
+@receiver(post_save, sender=IndividualEntrepreneur)
+def sync_network_node(sender, instance, **kwargs):
+    if nodes.is_unified():
+        nodes.sync_node(instance)
+
+
+@receiver(post_delete, sender=Manufacturer)
+@receiver(post_delete, sender=RetailNetwork)
+@receiver(post_delete, sender=IndividualEntrepreneur)
+def delete_network_node(sender, instance, **kwargs):
+    if nodes.is_unified():
+        nodes.delete_node(instance)
+
+
+def schedule_hierarchy_rebuild():
+    """ Пересобрать снимок иерархии фоновой задачей после фиксации транзакции """
+    if hierarchy.is_used():
+        transaction.on_commit(partial(jobs.enqueue_once, jobs.RebuildHierarchyTask.name))
+
+
+@receiver(pre_save, sender=Manufacturer)
+@receiver(pre_save, sender=RetailNetwork)
+@receiver(pre_save, sender=IndividualEntrepreneur)
+def remember_hierarchy_structure(sender, instance, **kwargs):
+    """ Запомнить поставщика и уровень звена до изменения: снимок зависит только от них """
+    instance._hierarchy_old = hierarchy.get_stored_structure(instance) if hierarchy.is_used() else None
+
+
+@receiver(post_save, sender=Manufacturer)
+@receiver(post_save, sender=RetailNetwork)
+@receiver(post_save, sender=IndividualEntrepreneur)
+def rebuild_hierarchy_on_save(sender, instance, created, **kwargs):
+    if created or getattr(instance, '_hierarchy_old', None) != hierarchy.get_structure(instance):
+        schedule_hierarchy_rebuild()
+
+
+@receiver(post_delete, sender=Manufacturer)
+@receiver(post_delete, sender=RetailNetwork)
+@receiver(post_delete, sender=IndividualEntrepreneur)
+def rebuild_hierarchy_on_delete(sender, instance, **kwargs):
+    schedule_hierarchy_rebuild()
+
+
+@receiver(post_save, sender=Manufacturer)
+@receiver(post_save, sender=RetailNetwork)
+@receiver(post_save, sender=IndividualEntrepreneur)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Payment)
+def record_saved_change(sender, instance, created, **kwargs):
+    changes.record(instance, Change.ACTION_CREATED if created else Change.ACTION_UPDATED)
+
+
+@receiver(post_delete, sender=Manufacturer)
+@receiver(post_delete, sender=RetailNetwork)
+@receiver(post_delete, sender=IndividualEntrepreneur)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Payment)
+def record_deleted_change(sender, instance, **kwargs):
+    changes.record(instance, Change.ACTION_DELETED)
+
+
+@receiver(post_save, sender=Manufacturer)
+@receiver(post_save, sender=RetailNetwork)
+@receiver(post_save, sender=IndividualEntrepreneur)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Manufacturer)
+@receiver(post_delete, sender=RetailNetwork)
+@receiver(post_delete, sender=IndividualEntrepreneur)
+@receiver(post_delete, sender=Product)
+def invalidate_facets(sender, instance, **kwargs):
+    facets.invalidate(instance.owner_id)
+
+
+@receiver(m2m_changed, sender=Product.retailers.through)
+@receiver(m2m_changed, sender=Product.entrepreneurs.through)
+def invalidate_product_facets(sender, instance, action, **kwargs):
+    """ Поставщики продукта входят в его фасеты уровня и типа поставщика """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        facets.invalidate(instance.owner_id)
+
+
+@receiver(pre_delete, sender=RetailNetwork)
+@receiver(pre_delete, sender=IndividualEntrepreneur)
+def remember_supplied_products(sender, instance, **kwargs):
+    """ Продукты поставщика: после удаления его строки связи M2M уже удалены без m2m_changed """
+    instance._changes_products = list(instance.product_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=RetailNetwork)
+@receiver(post_delete, sender=IndividualEntrepreneur)
+def record_supplied_products_change(sender, instance, **kwargs):
+    changes.record_updates(Product.objects.filter(pk__in=getattr(instance, '_changes_products', [])))
+
+
+@receiver(m2m_changed, sender=Product.retailers.through)
+@receiver(m2m_changed, sender=Product.entrepreneurs.through)
+def record_product_suppliers_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Изменение розничных сетей или ИП продукта — изменение продукта в ленте """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            changes.record(instance, Change.ACTION_UPDATED)
+        return
+    if action == 'pre_clear':
+        instance._changes_products = list(instance.product_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        product_ids = pk_set if action != 'post_clear' else getattr(instance, '_changes_products', [])
+        changes.record_updates(Product.objects.filter(pk__in=product_ids))
@@ -0,0 +1,18 @@
+'use strict';
+{
+    const $ = django.jQuery;
+
+    // Переход на страницу списка с выбранным значением фильтра AutocompleteFilter
+    $(function() {
+        $('.admin-autocomplete-filter').on('change', function() {
+            const base = this.dataset.baseQueryString;
+            const value = $(this).val();
+            if (!value) {
+                window.location.search = base;
+                return;
+            }
+            const separator = base.length > 1 ? '&' : '';
+            window.location.search = `${base}${separator}${this.dataset.lookupKwarg}=${encodeURIComponent(value)}`;
+        });
+    });
+}
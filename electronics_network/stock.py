@@ -0,0 +1,86 @@
+""" Остатки продуктов у звеньев сети (Stock) по транзакциям
+
+Транзакция перемещает amount единиц продукта от продавца к покупателю: остаток покупателя растёт,
+остаток продавца уменьшается. Производство в сети не учитывается, поэтому остаток производителя —
+минус отгруженное количество. Сохранение и удаление транзакции меняют строки остатков арифметикой
+в базе (quantity = quantity + delta) в той же транзакции базы, что и запись транзакции.
+Строка остатка одна на продукт и звено: транзакции разных пользователей с одним звеном меняют одну строку,
+а видит её владелец звена. Пакетные вставки без сигналов и ручные правки таблицы восстанавливаются
+командой rebuild_stock.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from electronics_network.models import Stock, Transaction
+
+NODE_FIELDS = ('manufacturer', 'retail_network', 'individual_entrepreneur')
+# сторона транзакции и знак движения для её звена
+SIDES = (('buyer', 1), ('seller', -1))
+MOVEMENT_FIELDS = ('product', 'amount', *(f'{side}_{node}' for side, _ in SIDES for node in NODE_FIELDS))
+
+
+def get_movements(queryset):
+    """ Продукт, количество, продавец и покупатель каждой транзакции выборки одним запросом """
+    return queryset.values(*MOVEMENT_FIELDS)
+
+
+def instance_movement(instance):
+    """ Движение несохранённого состояния транзакции в формате get_movements """
+    return {field: getattr(instance, instance._meta.get_field(field).attname) for field in MOVEMENT_FIELDS}
+
+
+def new_deltas():
+    return defaultdict(int)
+
+
+def add_rows(deltas, rows, sign):
+    """ Прибавить к {(продукт, поле звена, id звена): изменение остатка} движения строк со знаком sign """
+    for row in rows:
+        if row['product'] is None:
+            continue
+        for side, direction in SIDES:
+            node = next((node for node in NODE_FIELDS if row[f'{side}_{node}'] is not None), None)
+            if node is not None:
+                deltas[(row['product'], node, row[f'{side}_{node}'])] += sign * direction * row['amount']
+
+
+def apply_deltas(deltas, create=True):
+    """ Прибавить изменения к строкам остатков; create=False — только к существующим строкам.
+
+    При удалении транзакции строка её звена есть всегда, кроме каскадного удаления самого звена или продукта:
+    тогда строка остатка уже удалена и создавать её заново нельзя. Строки блокируются в порядке ключа, а не
+    в порядке покупатель — продавец: встречные транзакции A→B и B→A не ждут друг друга по кругу.
+    """
+    for (product_id, node, node_id), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        lookup = {'product_id': product_id, f'{node}_id': node_id}
+        if Stock.objects.filter(**lookup).update(quantity=F('quantity') + delta) or not create:
+            continue
+        try:
+            with transaction.atomic():
+                Stock.objects.create(quantity=delta, **lookup)
+        except IntegrityError:
+            # строку остатка параллельно создала другая транзакция
+            Stock.objects.filter(**lookup).update(quantity=F('quantity') + delta)
+
+
+@transaction.atomic
+def rebuild():
+    """ Пересчитать все остатки групповыми запросами по транзакциям: запрос на сторону и тип звена """
+    transactions = Transaction.objects.filter(product__isnull=False)
+    deltas = new_deltas()
+    for side, direction in SIDES:
+        for node in NODE_FIELDS:
+            column = f'{side}_{node}'
+            rows = (transactions.filter(**{f'{column}__isnull': False})
+                    .values('product', column).annotate(total=Sum('amount')).order_by())
+            for row in rows.iterator():
+                deltas[(row['product'], node, row[column])] += direction * row['total']
+    Stock.objects.all().delete()
+    Stock.objects.bulk_create((
+        Stock(product_id=product_id, quantity=quantity, **{f'{node}_id': node_id})
+        for (product_id, node, node_id), quantity in deltas.items()
+    ), batch_size=1000)
@@ -0,0 +1,135 @@
+""" Массовое назначение поставщиков продуктам
+
+POST products/suppliers/add/ и POST products/suppliers/remove/ с телом
+{"products": [1, 2], "retailers": [3, 4], "entrepreneurs": [5]} добавляют или удаляют связь каждого
+продукта с каждым поставщиком. Связи пишутся в промежуточные таблицы M2M пакетными INSERT ... ON CONFLICT
+DO NOTHING, уже существующие пропускаются, а в ответе считаются только действительно вставленные строки;
+удаление — один DELETE на связь. Продукты и поставщики выбираются из объектов пользователя,
+чужие и несуществующие id отклоняют весь запрос.
+
+Пакетные операции не отправляют m2m_changed, поэтому изменения продуктов для ленты /changes/ и сброс
+счётчиков фасетов записываются здесь явно.
+"""
+from itertools import islice
+
+from django.db import connections, router, transaction
+from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from electronics_network import changes, facets
+from electronics_network.models import Product, RetailNetwork, IndividualEntrepreneur
+from electronics_network.serializers import ProductSuppliersSerializer
+
+# связь продукта -> модель поставщика
+RELATIONS = {'retailers': RetailNetwork, 'entrepreneurs': IndividualEntrepreneur}
+BATCH_SIZE = 5000
+
+
+def _through(relation):
+    """ Промежуточная модель связи и колонки продукта и поставщика в ней """
+    field = Product._meta.get_field(relation)
+    return field.remote_field.through, f'{field.m2m_field_name()}_id', f'{field.m2m_reverse_field_name()}_id'
+
+
+def _links(relation, product_ids, supplier_ids):
+    through, product_column, supplier_column = _through(relation)
+    return through.objects.filter(**{f'{product_column}__in': product_ids, f'{supplier_column}__in': supplier_ids})
+
+
+def _batches(items, size=BATCH_SIZE):
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def _insert_links(through, columns, rows):
+    """ INSERT ... ON CONFLICT DO NOTHING частями по числу параметров запроса СУБД: число вставленных строк """
+    connection = connections[router.db_for_write(through)]
+    table = connection.ops.quote_name(through._meta.db_table)
+    names = ', '.join(connection.ops.quote_name(column) for column in columns)
+    inserted = 0
+    with connection.cursor() as cursor:
+        for part in _batches(rows, connection.ops.bulk_batch_size(columns, rows)):
+            values = ', '.join(['(%s, %s)'] * len(part))
+            cursor.execute(f'INSERT INTO {table} ({names}) VALUES {values} ON CONFLICT DO NOTHING',
+                           [value for row in part for value in row])
+            inserted += cursor.rowcount
+    return inserted
+
+
+def add_links(relation, product_ids, supplier_ids):
+    """ Добавить связи продуктов с поставщиками, пропуская существующие: (число вставленных, id продуктов) """
+    through, product_column, supplier_column = _through(relation)
+    existing = set(_links(relation, product_ids, supplier_ids).values_list(product_column, supplier_column))
+    new_links = ((product_id, supplier_id) for product_id in product_ids for supplier_id in supplier_ids
+                 if (product_id, supplier_id) not in existing)
+    added, changed = 0, set()
+    for batch in _batches(new_links):
+        # ON CONFLICT DO NOTHING: ту же связь могла параллельно добавить другая транзакция, её не считаем
+        added += _insert_links(through, (product_column, supplier_column), batch)
+        changed.update(product_id for product_id, _ in batch)
+    return added, changed
+
+
+def remove_links(relation, product_ids, supplier_ids):
+    """ Удалить связи продуктов с поставщиками: (число связей, id изменённых продуктов) """
+    links = _links(relation, product_ids, supplier_ids)
+    _, product_column, _ = _through(relation)
+    changed = set(links.order_by().values_list(product_column, flat=True).distinct())
+    removed = links.delete()[0] if changed else 0
+    return removed, changed
+
+
+def _record(product_ids):
+    products = Product.objects.filter(pk__in=product_ids)
+    changes.record_updates(products)
+    for owner_id in set(products.order_by().values_list('owner_id', flat=True)):
+        facets.invalidate(owner_id)
+
+
+@transaction.atomic
+def assign(operation, product_ids, suppliers):
+    """ Применить add_links или remove_links к связям {связь: id поставщиков}; {связь: число связей} """
+    changed, result = set(), {}
+    for relation, supplier_ids in suppliers.items():
+        result[relation], products = operation(relation, product_ids, supplier_ids)
+        changed |= products
+    if changed:
+        _record(changed)
+    return result
+
+
+class ProductSuppliersViewMixin:
+    """ Действия suppliers/add и suppliers/remove для ProductViewSet """
+
+    def get_owned(self, queryset):
+        user = self.request.user
+        return queryset if user.is_superuser else queryset.filter(owner=user)
+
+    def get_supplier_links(self, request):
+        serializer = ProductSuppliersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        querysets = {'products': self.get_owned(Product.objects.all()),
+                     **{relation: self.get_owned(model.objects.all()) for relation, model in RELATIONS.items()}}
+        errors = {}
+        for name, queryset in querysets.items():
+            ids = data.get(name, [])
+            found = set(queryset.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+            missing = [pk for pk in ids if pk not in found]
+            if missing:
+                errors[name] = [f"Объекты не найдены: {', '.join(map(str, missing))}"]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return data['products'], {relation: data[relation] for relation in RELATIONS if data.get(relation)}
+
+    @action(detail=False, methods=['post'], url_path='suppliers/add')
+    def add_suppliers(self, request, *args, **kwargs):
+        products, suppliers = self.get_supplier_links(request)
+        return Response({'added': assign(add_links, products, suppliers)})
+
+    @action(detail=False, methods=['post'], url_path='suppliers/remove')
+    def remove_suppliers(self, request, *args, **kwargs):
+        products, suppliers = self.get_supplier_links(request)
+        return Response({'removed': assign(remove_links, products, suppliers)})
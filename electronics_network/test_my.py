@@ -1,11 +1,41 @@
 """ Тесты для electronics_network """
 import json
-
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+import re
+
+import msgpack
 import pytest
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, router
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.timezone import localtime, make_aware
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import AccessToken
 
-from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction
+from config import schema
+from config.db_router import ReplicaRoutingMiddleware, pin_cache_key
+from config.renderers import ORJSONRenderer
+from electronics_network import changes, debt_exposure, hierarchy, jobs, nodes, partitions, payments, rollups, stock, \
+    suppliers
+from electronics_network.addresses import resolve_address
+from electronics_network.fastpath import RowPlan, ValuesListViewMixin
+from electronics_network.jobs import run_pending_jobs
+from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction, \
+    Change, City, Country, Job, NetworkNode, Payment, SalesRollup, Stock
+from electronics_network.pagination import EstimatedCountPaginator
+from electronics_network.serializers import ProductSerializer
 from users.models import User
 
 
@@ -55,8 +85,7 @@ def first_manufacturer(user_first):
     return Manufacturer.objects.create(
         name="Гамма",
         email="gamma@yandex.ru",
-        country="Россия",
-        city="Санкт-Петербург",
+        **resolve_address("Россия", "Санкт-Петербург"),
         street="Римского-Корсакова",
         house_number="54",
         level=0,
@@ -71,8 +100,7 @@ def first_retail_network(user_first, first_manufacturer):
         retail_network=None,
         name="Серебро",
         email="serebro@yandex.ru",
-        country="Россия",
-        city="Санкт-Петербург",
+        **resolve_address("Россия", "Санкт-Петербург"),
         street="ул Кржижановского",
         house_number="54",
         level=1,
@@ -87,8 +115,7 @@ def second_retail_network(user_first, first_retail_network):
         retail_network=first_retail_network,
         name="Золото",
         email="gold@yandex.ru",
-        country="Россия",
-        city="Санкт-Петербург",
+        **resolve_address("Россия", "Санкт-Петербург"),
         street="ул Кржижановского",
         house_number="22",
         level=2,
@@ -101,8 +128,7 @@ def first_individual_entrepreneur(user_first, first_manufacturer):
     return IndividualEntrepreneur.objects.create(
         name="Крис Кэтт",
         email="criscat@gmail.com",
-        country="Россия",
-        city="Санкт-Петербург",
+        **resolve_address("Россия", "Санкт-Петербург"),
         street="ул Чайковского",
         house_number="7",
         level=1,
@@ -628,4 +654,1451 @@ def test_delete_transaction_api(api_client, user_first, jwt_token_for_first_user
     """ Тест для удаления транзакции """
     api_client.force_authenticate(user=user_first)
     response = api_client.delete(f'/transactions/{first_transaction.id}/')
-    assert response.status_code == 204
\ No newline at end of file
+    assert response.status_code == 204
+
+# Тесты трассировки
+
+
+def _span_names(span):
+    names = [span['name']]
+    for child in span['children']:
+        names.extend(_span_names(child))
+    return names
+
+
+@pytest.mark.django_db
+def test_tracing_exports_request_phases(api_client, settings, tmp_path, jwt_token_for_first_user, first_transaction):
+    """ Тест записи спанов по фазам запроса в JSON-файл """
+    trace_file = tmp_path / 'traces.jsonl'
+    settings.TRACING = {
+        'ENABLED': True,
+        'EXPORTER': 'config.tracing.JSONFileExporter',
+        'EXPORTER_OPTIONS': {'path': trace_file},
+    }
+    api_client.credentials(HTTP_AUTHORIZATION=jwt_token_for_first_user)
+    response = api_client.get('/transactions/')
+    assert response.status_code == 200
+
+    trace = json.loads(trace_file.read_text(encoding='utf-8').splitlines()[0])
+    names = _span_names(trace)
+    assert trace['name'] == 'request'
+    for name in ('authentication', 'permissions', 'queryset', 'db.query',
+                 'serializer.to_representation', 'render'):
+        assert name in names
+
+
+@pytest.mark.django_db
+def test_tracing_skips_fast_requests(api_client, settings, tmp_path, user_first):
+    """ Тест отбрасывания запросов быстрее порога SLOW_REQUEST_MS """
+    trace_file = tmp_path / 'traces.jsonl'
+    settings.TRACING = {
+        'ENABLED': True,
+        'EXPORTER_OPTIONS': {'path': trace_file},
+        'SLOW_REQUEST_MS': 60_000,
+    }
+    api_client.force_authenticate(user=user_first)
+    api_client.get('/manufacturers/')
+    assert not trace_file.exists()
+
+
+# Тесты админ-панели
+
+
+@pytest.fixture
+def admin_client_staff(client):
+    """ Фикстура клиента админки под суперпользователем с доступом в админ-панель """
+    admin_user = User.objects.create_user(username='staff', password='staff', is_staff=True, is_superuser=True)
+    client.force_login(admin_user)
+    return client
+
+
+def create_transactions(count, product, seller, buyer, owner):
+    Transaction.objects.bulk_create([
+        Transaction(product=product, seller_manufacturer=seller, buyer_retail_network=buyer, amount=1, debt=10,
+                    owner=owner)
+        for _ in range(count)
+    ])
+
+
+@pytest.mark.django_db
+def test_transaction_admin_changelist_query_budget(admin_client_staff, user_first, first_product, first_manufacturer,
+                                                   first_retail_network):
+    """ Тест постоянного числа запросов страницы транзакций в админке независимо от количества строк """
+    create_transactions(3, first_product, first_manufacturer, first_retail_network, user_first)
+    with CaptureQueriesContext(connection) as small:
+        assert admin_client_staff.get('/admin/electronics_network/transaction/').status_code == 200
+
+    create_transactions(150, first_product, first_manufacturer, first_retail_network, user_first)
+    with CaptureQueriesContext(connection) as large:
+        assert admin_client_staff.get('/admin/electronics_network/transaction/').status_code == 200
+
+    assert len(large.captured_queries) == len(small.captured_queries)
+    assert len(large.captured_queries) <= 15
+
+
+@pytest.mark.django_db
+def test_estimated_count_paginator_caps_count(user_first, first_product, first_manufacturer, first_retail_network):
+    """ Тест ограничения количества строк в пагинаторе админки """
+    create_transactions(12, first_product, first_manufacturer, first_retail_network, user_first)
+    paginator = EstimatedCountPaginator(Transaction.objects.order_by('pk'), 5)
+    paginator.count_cap = 10
+    assert paginator.count == 10
+    assert len(paginator.page(2).object_list) == 5
+
+
+def create_products_with_suppliers(count, owner, manufacturer, retail_network, individual_entrepreneur):
+    products = Product.objects.bulk_create([
+        Product(name=f'Продукт {i}', model='Тест', release_date='2024-02-20', owner=owner, manufacturer=manufacturer)
+        for i in range(count)
+    ])
+    for product in products:
+        product.retailers.add(retail_network)
+        product.entrepreneurs.add(individual_entrepreneur)
+    return products
+
+
+@pytest.mark.django_db
+def test_product_admin_supplier_levels_query_budget(admin_client_staff, user_first, first_manufacturer,
+                                                    first_retail_network, first_individual_entrepreneur):
+    """ Тест постоянного числа запросов колонки уровней поставщиков в админке продуктов """
+    create_products_with_suppliers(2, user_first, first_manufacturer, first_retail_network,
+                                   first_individual_entrepreneur)
+    with CaptureQueriesContext(connection) as small:
+        response = admin_client_staff.get('/admin/electronics_network/product/')
+    assert response.status_code == 200
+
+    create_products_with_suppliers(20, user_first, first_manufacturer, first_retail_network,
+                                   first_individual_entrepreneur)
+    with CaptureQueriesContext(connection) as large:
+        response = admin_client_staff.get('/admin/electronics_network/product/')
+    assert response.status_code == 200
+    assert len(large.captured_queries) == len(small.captured_queries)
+
+
+@pytest.mark.django_db
+def test_product_admin_staff_sees_own_products(client, user_second, first_product):
+    """ Тест админки продуктов для сотрудника без прав суперпользователя: только его продукты """
+    staff = User.objects.create_user(username='manager', password='manager', is_staff=True)
+    staff.user_permissions.add(Permission.objects.get(codename='view_product'))
+    own = Product.objects.create(name='Свой', model='Тест', release_date='2024-02-20', owner=staff)
+    client.force_login(staff)
+    response = client.get('/admin/electronics_network/product/')
+    assert response.status_code == 200
+    assert list(response.context['cl'].result_list) == [own]
+
+
+@pytest.mark.django_db
+def test_product_supplier_levels_api(api_client, user_first, first_manufacturer, first_retail_network,
+                                     first_individual_entrepreneur):
+    """ Тест поля supplier_levels в списке продуктов без запросов на каждый продукт """
+    create_products_with_suppliers(5, user_first, first_manufacturer, first_retail_network,
+                                   first_individual_entrepreneur)
+    api_client.force_authenticate(user=user_first)
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get('/products/')
+    assert response.status_code == 200
+    assert len(context.captured_queries) <= 4
+    assert response.json()['results'][0]['supplier_levels'] == [0, 1, 1]
+
+
+@pytest.mark.django_db
+def test_transaction_admin_autocomplete_filter(admin_client_staff, first_transaction, first_manufacturer,
+                                               second_retail_network):
+    """ Тест фильтра транзакций по продавцу без вывода всех звеньев сети """
+    url = f'/admin/electronics_network/transaction/?seller_manufacturer__id__exact={first_manufacturer.id}'
+    response = admin_client_staff.get(url)
+    assert response.status_code == 200
+    content = response.content.decode()
+    assert f'<option value="{first_manufacturer.id}" selected>{first_manufacturer.name}</option>' in content
+    assert second_retail_network.name not in content
+
+
+@pytest.mark.django_db
+def test_admin_autocomplete_uses_prefix_search(admin_client_staff, first_retail_network, second_retail_network):
+    """ Тест префиксного поиска звеньев сети в autocomplete админки """
+    response = admin_client_staff.get('/admin/autocomplete/', {
+        'app_label': 'electronics_network', 'model_name': 'transaction', 'field_name': 'buyer_retail_network',
+        'term': 'Зол',
+    })
+    assert response.status_code == 200
+    assert [item['text'] for item in response.json()['results']] == [second_retail_network.name]
+
+
+@pytest.mark.django_db
+def test_admin_city_autocomplete(admin_client_staff, first_manufacturer):
+    """ Тест подсказок городов из справочника для фильтра по городу """
+    response = admin_client_staff.get('/admin/autocomplete/', {
+        'app_label': 'electronics_network', 'model_name': 'manufacturer', 'field_name': 'city', 'term': 'Санкт',
+    })
+    assert response.status_code == 200
+    assert response.json()['results'] == [{'id': str(first_manufacturer.city_id), 'text': 'Санкт-Петербург'}]
+
+    response = admin_client_staff.get('/admin/electronics_network/manufacturer/',
+                                      {'city__id__exact': first_manufacturer.city_id})
+    assert response.status_code == 200
+    assert first_manufacturer.name in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_admin_adds_countries_and_cities(admin_client_staff, first_manufacturer):
+    """ Тест справочников в админке: каноническое название, заполненный ключ, дубль — ошибка формы """
+    for name in ('  франция ', 'Германия'):
+        response = admin_client_staff.post('/admin/electronics_network/country/add/', {'name': name})
+        assert response.status_code == 302
+    assert sorted(Country.objects.values_list('name', 'key')) == [
+        ('Германия', 'германия'), ('Россия', 'россия'), ('Франция', 'франция')]
+
+    response = admin_client_staff.post('/admin/electronics_network/country/add/', {'name': 'ГЕРМАНИЯ'})
+    assert response.status_code == 200 and response.context['adminform'].form.errors
+    assert Country.objects.count() == 3
+
+    france = Country.objects.get(key='франция')
+    response = admin_client_staff.post('/admin/electronics_network/city/add/', {'name': 'париж', 'country': france.id})
+    assert response.status_code == 302
+    assert resolve_address('Франция', 'ПАРИЖ')['city'] == City.objects.get(name='Париж', key='париж')
+
+
+@pytest.mark.django_db
+def test_node_admin_rejects_city_of_other_country(admin_client_staff, first_manufacturer):
+    """ Тест формы звена в админке: город другой страны не сохраняется """
+    france = resolve_address('Франция', 'Париж')
+    response = admin_client_staff.post('/admin/electronics_network/manufacturer/add/', {
+        'name': 'Дельта', 'email': 'delta@yandex.ru', 'country': france['country'].id,
+        'city': first_manufacturer.city_id, 'street': 'Риволи', 'house_number': '1', 'level': 0,
+    })
+    assert response.status_code == 200
+    assert 'city' in response.context['adminform'].form.errors
+    assert not Manufacturer.objects.filter(name='Дельта').exists()
+
+
+# Тесты фоновых задач
+
+
+@pytest.mark.django_db
+def test_clear_debt_admin_action_runs_in_background(admin_client_staff, first_transaction, first_retail_network):
+    """ Тест обнуления долга через очередь задач вместо HTTP-запроса """
+    response = admin_client_staff.post('/admin/electronics_network/retailnetwork/', {
+        'action': 'clear_debt_for_selected_retailnetworks', '_selected_action': [first_retail_network.id],
+    })
+    assert response.status_code == 302
+    first_transaction.refresh_from_db()
+    assert first_transaction.debt == 10000
+
+    assert run_pending_jobs() == 1
+    first_transaction.refresh_from_db()
+    job = Job.objects.get()
+    assert first_transaction.debt == 0
+    assert (job.status, job.processed, job.total, job.get_progress()) == (Job.STATUS_DONE, 1, 1, 100)
+
+
+@pytest.mark.django_db
+def test_job_resumes_from_cursor_and_retries(user_first, first_product, first_manufacturer, first_retail_network,
+                                             monkeypatch):
+    """ Тест повтора упавшей задачи с места остановки """
+    create_transactions(5, first_product, first_manufacturer, first_retail_network, user_first)
+    monkeypatch.setattr(jobs.ClearDebtTask, 'chunk_size', 2)
+    original = jobs.ClearDebtTask.process_chunk
+    calls = []
+
+    def flaky_process_chunk(self, queryset, params):
+        calls.append(sorted(queryset.values_list('pk', flat=True)))
+        if len(calls) == 2:
+            raise RuntimeError('сбой')
+        original(self, queryset, params)
+
+    monkeypatch.setattr(jobs.ClearDebtTask, 'process_chunk', flaky_process_chunk)
+    job = jobs.enqueue('clear_debt', {'buyer_field': 'buyer_retail_network', 'buyer_ids': [first_retail_network.id]})
+    jobs.run_pending_jobs()
+    job.refresh_from_db()
+    assert (job.status, job.processed, job.attempts) == (Job.STATUS_PENDING, 2, 1)
+
+    Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+    jobs.run_pending_jobs()
+    job.refresh_from_db()
+    assert (job.status, job.processed, job.attempts) == (Job.STATUS_DONE, 5, 2)
+    assert calls[1] == calls[2]
+    assert not Transaction.objects.exclude(debt=0).exists()
+
+
+@pytest.mark.django_db
+def test_job_cancellation(user_first, first_product, first_manufacturer, first_retail_network):
+    """ Тест отмены выполняющейся задачи """
+    create_transactions(3, first_product, first_manufacturer, first_retail_network, user_first)
+    job = jobs.enqueue('clear_debt', {'buyer_field': 'buyer_retail_network', 'buyer_ids': [first_retail_network.id]})
+    Job.objects.filter(pk=job.pk).update(cancel_requested=True)
+    jobs.run_pending_jobs()
+    job.refresh_from_db()
+    assert job.status == Job.STATUS_CANCELLED
+    assert Transaction.objects.filter(debt=0).count() == 0
+
+
+# Тесты оплат
+
+
+@pytest.mark.django_db
+def test_payment_applies_to_oldest_transactions_first(api_client, user_first, first_product, first_manufacturer,
+                                                      first_retail_network):
+    """ Тест зачёта частичной оплаты начиная с самых старых транзакций """
+    create_transactions(3, first_product, first_manufacturer, first_retail_network, user_first)
+    api_client.force_authenticate(user=user_first)
+    response = api_client.post('/payments/', {'buyer_retail_network': first_retail_network.id, 'amount': '15.00'},
+                               format='json')
+    assert response.status_code == 201
+    assert response.json()['applied_amount'] == '15.00'
+    assert [str(debt) for debt in Transaction.objects.order_by('pk').values_list('debt', flat=True)] == \
+           ['0.00', '5.00', '10.00']
+
+
+@pytest.mark.django_db
+def test_payment_overpayment_is_not_applied(api_client, user_first, first_product, first_manufacturer,
+                                            first_retail_network, first_individual_entrepreneur):
+    """ Тест оплаты больше долга и оплаты с двумя покупателями """
+    create_transactions(2, first_product, first_manufacturer, first_retail_network, user_first)
+    api_client.force_authenticate(user=user_first)
+    response = api_client.post('/payments/', {'buyer_retail_network': first_retail_network.id, 'amount': '100.00'},
+                               format='json')
+    assert response.json()['applied_amount'] == '20.00'
+    assert not Transaction.objects.exclude(debt=0).exists()
+
+    response = api_client.post('/payments/', {'buyer_retail_network': first_retail_network.id,
+                                              'buyer_individual_entrepreneur': first_individual_entrepreneur.id,
+                                              'amount': '1.00'}, format='json')
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_payments_keep_balances_exact(user_first, first_product, first_manufacturer,
+                                                 first_retail_network):
+    """ Стресс-тест параллельных оплат: долг уменьшается ровно на сумму всех оплат """
+    if not connection.features.has_select_for_update_skip_locked:
+        pytest.skip('Нужна база с SELECT ... FOR UPDATE SKIP LOCKED')
+
+    create_transactions(50, first_product, first_manufacturer, first_retail_network, user_first)
+
+    def pay(_):
+        client = APIClient()
+        client.force_authenticate(user=user_first)
+        try:
+            response = client.post('/payments/', {'buyer_retail_network': first_retail_network.id, 'amount': '2.00'},
+                                   format='json')
+            return response.status_code, Decimal(response.json()['applied_amount'])
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(pay, range(200)))
+
+    assert all(status == 201 for status, _ in results)
+    assert sum(applied for _, applied in results) == Decimal('400.00')
+    assert Transaction.objects.aggregate(Sum('debt'))['debt__sum'] == Decimal('100.00')
+    assert not Transaction.objects.filter(debt__lt=0).exists()
+
+
+@pytest.mark.django_db
+def test_payment_locks_consumed_rows_and_resumes(monkeypatch, user_first, first_product, first_manufacturer,
+                                                 first_retail_network):
+    """ Тест оплаты: порядок по дате создания, блокировка только зачитываемых строк, продолжение после сбоя """
+    create_transactions(4, first_product, first_manufacturer, first_retail_network, user_first)
+    oldest, second, third, newest = Transaction.objects.order_by('pk')
+    Transaction.objects.filter(pk=newest.pk).update(created_at=oldest.created_at - timedelta(days=1))
+    payment = Payment.objects.create(owner=user_first, buyer_retail_network=first_retail_network,
+                                     amount=Decimal('25.00'))
+
+    # сбой во втором шаге: первый шаг уже зафиксировал и уменьшение долга, и зачтённую сумму
+    monkeypatch.setattr(payments, 'BATCH_SIZE', 1)
+    record_updates, calls = changes.record_updates, []
+
+    def fail_second_step(queryset):
+        calls.append(queryset)
+        if len(calls) == 2:
+            raise RuntimeError('сбой')
+        record_updates(queryset)
+
+    monkeypatch.setattr(changes, 'record_updates', fail_second_step)
+    with pytest.raises(RuntimeError):
+        payments.apply_payment(payment, Transaction.objects.all())
+    payment.refresh_from_db()
+    assert payment.applied_amount == Decimal('10.00')
+    assert Transaction.objects.get(pk=newest.pk).debt == 0
+
+    monkeypatch.setattr(changes, 'record_updates', record_updates)
+    monkeypatch.setattr(payments, 'BATCH_SIZE', 50)
+    with CaptureQueriesContext(connection) as context:
+        assert payments.apply_payment(payment, Transaction.objects.all()) == Decimal('25.00')
+    assert [str(debt) for debt in Transaction.objects.order_by('pk').values_list('debt', flat=True)] == \
+           ['0.00', '5.00', '10.00', '0.00']
+    if connection.features.has_select_for_update:
+        locked = [query['sql'] for query in context.captured_queries if 'FOR UPDATE' in query['sql']]
+        assert len(locked) == 1 and f'({oldest.pk}, {second.pk})' in locked[0]
+
+
+# Тесты аналитики продаж
+
+
+def rollup_totals():
+    return sorted(SalesRollup.objects.exclude(transactions_count=0)
+                  .values_list('product_id', 'country', 'seller_level', 'transactions_count', 'amount', 'debt'))
+
+
+@pytest.mark.django_db
+def test_sales_rollup_is_maintained_incrementally(api_client, user_first, first_transaction, first_product,
+                                                  first_manufacturer, first_individual_entrepreneur):
+    """ Тест обновления агрегатов при создании, оплате, изменении и удалении транзакций """
+    second = Transaction.objects.create(product=first_product, seller_manufacturer=first_manufacturer,
+                                        buyer_individual_entrepreneur=first_individual_entrepreneur, amount=5,
+                                        debt='500.00', owner=user_first)
+    assert rollup_totals() == [(first_product.id, 'Россия', 0, 2, 15, 10500)]
+
+    api_client.force_authenticate(user=user_first)
+    api_client.post('/payments/', {'buyer_individual_entrepreneur': first_individual_entrepreneur.id,
+                                   'amount': '200.00'}, format='json')
+    second.refresh_from_db()
+    second.amount = 7
+    second.save()
+    first_transaction.delete()
+    assert rollup_totals() == [(first_product.id, 'Россия', 0, 1, 7, 300)]
+
+    incremental = rollup_totals()
+    rollups.rebuild()
+    assert rollup_totals() == incremental
+
+
+@pytest.mark.django_db
+def test_sales_analytics_reads_only_rollups(api_client, user_first, first_transaction, first_product, user_second):
+    """ Тест эндпоинта аналитики без обращения к таблице транзакций """
+    api_client.force_authenticate(user=user_first)
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get('/analytics/sales/', {'group_by': 'bucket,country,seller_level', 'bucket': 'month'})
+    assert response.status_code == 200
+    assert response.json()['results'] == [
+        {'bucket': localtime(first_transaction.created_at).date().replace(day=1).isoformat(), 'country': 'Россия',
+         'seller_level': 0, 'transactions_count': 1, 'amount': 10, 'debt': '10000.00'},
+    ]
+    assert not [query for query in context.captured_queries
+                if Transaction._meta.db_table in query['sql']]
+
+    api_client.force_authenticate(user=user_second)
+    assert api_client.get('/analytics/sales/', {'group_by': 'product'}).json()['results'][0]['amount'] == 10
+    assert api_client.get('/analytics/sales/', {'group_by': 'owner'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_sales_analytics_rejects_bad_dates(api_client, user_first, first_transaction):
+    """ Тест аналитики: некорректная дата периода — ошибка 400, а не 500 """
+    api_client.force_authenticate(user=user_first)
+    response = api_client.get('/analytics/sales/', {'date_from': 'abc', 'date_to': '2026-02-30'})
+    assert response.status_code == 400
+    assert set(response.json()) == {'date_from'}
+
+    today = localtime(first_transaction.created_at).date()
+    response = api_client.get('/analytics/sales/', {'date_from': today.isoformat(), 'date_to': today.isoformat()})
+    assert response.json()['results'][0]['transactions_count'] == 1
+    response = api_client.get('/analytics/sales/', {'date_to': (today - timedelta(days=1)).isoformat()})
+    assert response.json()['results'] == []
+
+
+# Тесты секционирования транзакций
+
+
+@pytest.mark.django_db
+def test_transaction_list_filters_by_created_at(api_client, user_first, first_transaction, first_product,
+                                                first_manufacturer, first_retail_network):
+    """ Тест фильтра транзакций по периоду создания """
+    old = Transaction.objects.create(product=first_product, seller_manufacturer=first_manufacturer,
+                                     buyer_retail_network=first_retail_network, owner=user_first,
+                                     created_at=make_aware(datetime(2020, 3, 15)))
+    api_client.force_authenticate(user=user_first)
+    response = api_client.get('/transactions/', {'created_after': '2020-03-01T00:00:00+03:00',
+                                                 'created_before': '2020-04-01T00:00:00+03:00'})
+    assert response.status_code == 200
+    assert [row['id'] for row in response.json()['results']] == [old.id]
+    assert response.json()['results'][0]['created_at'].startswith('2020-03-15')
+
+
+@pytest.mark.django_db
+def test_transaction_partitions_create_and_detach(user_first, first_product, first_manufacturer,
+                                                  first_retail_network):
+    """ Тест создания и отсоединения помесячных секций (только PostgreSQL) """
+    if not partitions.is_partitioned():
+        with pytest.raises(partitions.PartitioningNotSupported):
+            partitions.list_partitions()
+        pytest.skip('Секционирование транзакций есть только в PostgreSQL')
+
+    month = make_aware(datetime(2019, 5, 1))
+    name = partitions.partition_name(month)
+    transaction = Transaction.objects.create(product=first_product, seller_manufacturer=first_manufacturer,
+                                             buyer_retail_network=first_retail_network, owner=user_first,
+                                             created_at=make_aware(datetime(2019, 5, 20)))
+
+    assert partitions.create_partition(month)
+    assert not partitions.create_partition(month)
+    assert name in dict(partitions.list_partitions())
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT id FROM {name}')
+        assert cursor.fetchall() == [(transaction.id,)]
+        cursor.execute(f'EXPLAIN SELECT * FROM {partitions.TABLE} WHERE created_at >= %s AND created_at < %s',
+                       [month, partitions.add_months(month, 1)])
+        plan = '\n'.join(row[0] for row in cursor.fetchall())
+        # тест идёт в одной транзакции: отложенные проверки внешних ключей мешают удалить секцию
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    assert name in plan and partitions.DEFAULT_PARTITION not in plan
+
+    assert partitions.detach_partition(month, drop=True)
+    assert name not in dict(partitions.list_partitions())
+    assert not Transaction.objects.filter(pk=transaction.pk).exists()
+
+
+# Тесты единой таблицы звеньев сети
+
+
+@pytest.mark.django_db
+def test_network_nodes_rebuild_mirrors_network(user_first, user_second, first_transaction, second_retail_network,
+                                               first_individual_entrepreneur, first_manufacturer,
+                                               first_retail_network):
+    """ Тест заполнения NetworkNode и колонок продавца и покупателя по существующим данным """
+    nodes.rebuild()
+    assert NetworkNode.objects.count() == 4
+    manufacturer_node = NetworkNode.objects.get(kind='manufacturer', source_id=first_manufacturer.id)
+    network_node = NetworkNode.objects.get(kind='retail_network', source_id=first_retail_network.id)
+    assert network_node.supplier == manufacturer_node
+    assert NetworkNode.objects.get(kind='retail_network', source_id=second_retail_network.id).supplier == network_node
+    assert NetworkNode.objects.get(kind='individual_entrepreneur',
+                                   source_id=first_individual_entrepreneur.id).supplier == manufacturer_node
+
+    first_transaction.refresh_from_db()
+    assert (first_transaction.seller, first_transaction.buyer) == (manufacturer_node, network_node)
+    separate = set(Transaction.objects.filter(nodes.counterparty_filter(owner=user_first)))
+    assert separate == {first_transaction}
+    assert not Transaction.objects.filter(nodes.counterparty_filter(owner=user_second)).exists()
+
+    # повторное заполнение обновляет записи на месте: id звеньев и ссылки транзакций сохраняются
+    IndividualEntrepreneur.objects.filter(pk=first_individual_entrepreneur.pk).update(
+        manufacturer=None, retail_network=first_retail_network, level=2)
+    second_retail_network_id = second_retail_network.id
+    Transaction.objects.filter(pk=first_transaction.pk).update(
+        buyer_retail_network=None, buyer_individual_entrepreneur=first_individual_entrepreneur)
+    second_retail_network.delete()
+    nodes.rebuild()
+    assert NetworkNode.objects.get(kind='retail_network', source_id=first_retail_network.id).pk == network_node.pk
+    assert not NetworkNode.objects.filter(kind='retail_network', source_id=second_retail_network_id).exists()
+    assert NetworkNode.objects.get(kind='individual_entrepreneur').supplier == network_node
+    first_transaction.refresh_from_db()
+    assert (first_transaction.seller, first_transaction.buyer.kind) == (manufacturer_node, 'individual_entrepreneur')
+
+
+@pytest.mark.django_db
+def test_unified_network_nodes_keep_api_shape(settings, api_client, user_first, first_product, first_manufacturer,
+                                              first_individual_entrepreneur):
+    """ Тест режима единой таблицы: звенья и транзакции синхронизируются, формат API не меняется """
+    settings.NETWORK_NODES_UNIFIED = True
+    transaction = Transaction.objects.create(product=first_product, seller_manufacturer=first_manufacturer,
+                                             buyer_individual_entrepreneur=first_individual_entrepreneur,
+                                             owner=user_first)
+    assert transaction.seller.kind == 'manufacturer' and transaction.buyer.name == 'Крис Кэтт'
+    assert list(Transaction.objects.filter(nodes.counterparty_filter(role='buyer',
+                                                                     node=first_individual_entrepreneur))) \
+        == [transaction]
+
+    first_individual_entrepreneur.city = resolve_address('Россия', 'Казань')['city']
+    first_individual_entrepreneur.save()
+    assert NetworkNode.objects.get(pk=transaction.buyer_id).city.name == 'Казань'
+
+    api_client.force_authenticate(user=user_first)
+    result = api_client.get(f'/transactions/{transaction.id}/').json()
+    assert 'seller' not in result and result['seller_manufacturer'] == 'Гамма'
+
+    first_individual_entrepreneur.delete()
+    assert not NetworkNode.objects.filter(kind='individual_entrepreneur').exists()
+
+
+@pytest.mark.django_db
+def test_unified_counterparty_filter_reads_node_columns(settings, user_first, user_second, first_transaction,
+                                                        first_retail_network):
+    """ Тест режима единой таблицы: сделки контрагента ищутся по колонкам seller и buyer без JOIN'ов """
+    settings.NETWORK_NODES_UNIFIED = True
+    nodes.rebuild()
+    sql = str(Transaction.objects.filter(nodes.counterparty_filter(owner=user_first)).query)
+    assert '"seller_id" IN (SELECT' in sql and '"buyer_id" IN (SELECT' in sql and 'JOIN' not in sql
+    assert list(Transaction.objects.filter(nodes.counterparty_filter(owner=user_first))) == [first_transaction]
+    assert not Transaction.objects.filter(nodes.counterparty_filter(owner=user_second)).exists()
+
+    sql = str(Transaction.objects.filter(nodes.counterparty_filter(role='buyer', node=first_retail_network)).query)
+    assert '"buyer_id" IN (SELECT' in sql and '"seller_id"' not in sql.split('WHERE')[1]
+    assert list(Transaction.objects.filter(nodes.counterparty_filter(role='buyer', node=first_retail_network))) \
+        == [first_transaction]
+
+
+# Тесты разреженных наборов полей
+
+
+@pytest.mark.django_db
+def test_sparse_fieldsets_trim_payload_and_sql(api_client, user_first, first_retail_network, second_retail_network):
+    """ Тест ?fields= и ?exclude=: в ответе и в SQL только запрошенные поля и связи """
+    api_client.force_authenticate(user=user_first)
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get('/retail_networks/', {'fields': 'id,name,level'})
+    assert response.status_code == 200
+    assert response.json()['results'][0] == {'id': first_retail_network.id, 'name': 'Серебро', 'level': 1}
+    select = context.captured_queries[-1]['sql']
+    assert '"email"' not in select and '"street"' not in select
+
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get('/retail_networks/', {'fields': 'id,manufacturer'})
+    assert response.json()['results'][0] == {'id': first_retail_network.id, 'manufacturer': {'name': 'Гамма'}}
+    assert len(context.captured_queries) == 2
+    assert 'JOIN' in context.captured_queries[-1]['sql'] and '"country"' not in context.captured_queries[-1]['sql']
+
+    result = api_client.get(f'/retail_networks/{second_retail_network.id}/', {'exclude': 'email,street'}).json()
+    assert 'email' not in result and result['retail_network'] == {'name': 'Серебро'}
+    assert api_client.get('/retail_networks/', {'fields': 'id,password'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_sparse_fieldsets_on_all_resources(api_client, user_first, first_transaction, first_individual_entrepreneur):
+    """ Тест ?fields= на всех пяти ресурсах сети """
+    api_client.force_authenticate(user=user_first)
+    for url in ('/manufacturers/', '/retail_networks/', '/individual_entrepreneurs/', '/products/',
+                '/transactions/'):
+        response = api_client.get(url, {'fields': 'id,name'} if url != '/transactions/' else {'fields': 'id,product'})
+        assert response.status_code == 200, url
+        assert len(response.json()['results'][0]) == 2, url
+    result = api_client.get('/transactions/', {'fields': 'product,debt'}).json()['results'][0]
+    assert result == {'product': 'Тестовая продукция - Тест', 'debt': '10000.00'}
+
+
+# Тесты форматов ответа
+
+
+@pytest.mark.django_db
+def test_orjson_renderer_matches_drf_json(api_client, user_first, first_transaction):
+    """ Тест: JSON через orjson совпадает с ответом стандартного JSONRenderer DRF """
+    api_client.force_authenticate(user=user_first)
+    response = api_client.get('/transactions/')
+    assert response['Content-Type'] == 'application/json'
+    assert response.content == JSONRenderer().render(response.data)
+    data = {'debt': Decimal('1.50'), 'text': 'a b', 'nested': [{'id': 1}]}
+    assert ORJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+@pytest.mark.django_db
+def test_msgpack_content_negotiation(api_client, user_first, user_second, first_transaction):
+    """ Тест выбора MessagePack через Accept и Content-Type на эндпоинтах сети и пользователей """
+    api_client.force_authenticate(user=user_first)
+    json_data = api_client.get('/transactions/').json()
+    response = api_client.get('/transactions/', HTTP_ACCEPT='application/msgpack')
+    assert response['Content-Type'] == 'application/msgpack'
+    assert msgpack.unpackb(response.content) == json_data
+
+    body = msgpack.packb({'name': 'Бета', 'email': 'beta@yandex.ru', 'country': 'Россия', 'city': 'Москва',
+                          'street': 'Тверская', 'house_number': '1', 'level': 0})
+    response = api_client.post('/manufacturers/', body, content_type='application/msgpack',
+                               HTTP_ACCEPT='application/msgpack')
+    assert response.status_code == 201
+    assert msgpack.unpackb(response.content)['name'] == 'Бета'
+
+    api_client.force_authenticate(user=user_second)
+    response = api_client.get(f'/users/users/{user_first.id}/', HTTP_ACCEPT='application/msgpack')
+    assert msgpack.unpackb(response.content)['username'] == 'test_active'
+
+
+@pytest.mark.django_db
+def test_benchmark_renderers_command():
+    """ Тест команды сравнения рендереров """
+    out = StringIO()
+    call_command('benchmark_renderers', rows=3, repeat=1, stdout=out)
+    assert out.getvalue().count('TransactionReadSerializer') == 3
+    assert not User.objects.filter(username='benchmark_renderers').exists()
+
+
+# Тесты режима values для списков
+
+
+@pytest.mark.django_db
+def test_values_fast_path_is_byte_identical(api_client, user_first, first_transaction, second_retail_network,
+                                            first_individual_entrepreneur, monkeypatch):
+    """ Тест: списки через values() совпадают байт в байт с обычной сериализацией моделей """
+    first_transaction.product.retailers.add(second_retail_network)
+    first_transaction.product.entrepreneurs.add(first_individual_entrepreneur)
+    api_client.force_authenticate(user=user_first)
+    requests = [(url, params) for url in ('/manufacturers/', '/retail_networks/', '/individual_entrepreneurs/',
+                                          '/products/', '/transactions/')
+                for params in ({}, {'fields': 'id,name'} if url != '/transactions/' else {'fields': 'id,product'})]
+    fast = [api_client.get(url, params).content for url, params in requests]
+    monkeypatch.setattr(ValuesListViewMixin, 'list',
+                        lambda self, request, *args, **kwargs: super(ValuesListViewMixin, self).list(request))
+    slow = [api_client.get(url, params).content for url, params in requests]
+    assert fast == slow
+    assert json.loads(fast[6])['results'][0]['supplier_levels'] == [0, 2, 1]
+
+
+@pytest.mark.django_db
+def test_values_fast_path_queries(api_client, user_first, first_transaction):
+    """ Тест: страница читается одним запросом values() без JOIN, связи — отдельным запросом на связь """
+    api_client.force_authenticate(user=user_first)
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get('/retail_networks/')
+    assert response.status_code == 200
+    assert len(context.captured_queries) == 2
+    assert 'JOIN' in context.captured_queries[-1]['sql']
+    # COUNT(*) пагинатора — по выборке без колонок связей из values()
+    assert 'JOIN' not in context.captured_queries[0]['sql'] and 'COUNT(*)' in context.captured_queries[0]['sql']
+    assert response.json()['count'] == 1
+
+    plan = RowPlan(ProductSerializer(), Product)
+    assert set(plan.many) == {'retailers', 'entrepreneurs'}
+    assert 'manufacturer__level' in plan.columns
+
+
+# Тесты раскрытия связей
+
+
+@pytest.mark.django_db
+def test_expand_inlines_related_objects(api_client, user_first, first_transaction, second_retail_network,
+                                        first_individual_entrepreneur):
+    """ Тест ?expand=: связи выводятся полными объектами, через точку раскрываются вложенные связи """
+    first_transaction.product.retailers.add(second_retail_network)
+    api_client.force_authenticate(user=user_first)
+
+    result = api_client.get(f'/retail_networks/{second_retail_network.id}/',
+                            {'expand': 'retail_network.manufacturer'}).json()
+    assert result['retail_network']['name'] == 'Серебро'
+    assert result['retail_network']['manufacturer']['name'] == 'Гамма'
+    assert result['retail_network']['manufacturer']['level'] == 0
+    assert result['manufacturer'] is None
+    result = api_client.get(f'/retail_networks/{second_retail_network.id}/',
+                            {'expand': 'retail_network.manufacturer', 'fields': 'id,retail_network'}).json()
+    assert set(result) == {'id', 'retail_network'} and result['retail_network']['manufacturer']['name'] == 'Гамма'
+
+    result = api_client.get('/transactions/', {'expand': 'product.retailers,buyer_retail_network'}).json()['results'][0]
+    assert result['product']['retailers'][0]['name'] == 'Золото'
+    assert result['product']['retailers'][0]['retail_network'] == {'name': 'Серебро'}
+    assert result['buyer_retail_network']['level'] == 1
+    assert result['seller_manufacturer'] == 'Гамма'
+
+    assert api_client.get('/products/', {'expand': 'owner'}).status_code == 400
+    assert api_client.get('/transactions/', {'expand': 'product.owner'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_expand_query_count_does_not_grow_with_page(api_client, user_first, first_product, first_manufacturer,
+                                                    first_retail_network, second_retail_network):
+    """ Тест: JOIN'ы и prefetch для ?expand= строятся по дереву, число запросов не зависит от числа строк """
+    first_product.retailers.add(first_retail_network, second_retail_network)
+    api_client.force_authenticate(user=user_first)
+    params = {'expand': 'product.retailers.manufacturer,product.entrepreneurs,buyer_retail_network.manufacturer'}
+    counts = []
+    for _ in range(2):
+        Transaction.objects.bulk_create([
+            Transaction(owner=user_first, product=first_product, seller_manufacturer=first_manufacturer,
+                        buyer_retail_network=first_retail_network, amount=1, debt=10) for _ in range(3)
+        ])
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get('/transactions/', params)
+        assert response.status_code == 200
+        counts.append(len(context.captured_queries))
+    assert counts[0] == counts[1]
+    assert len(response.json()['results'][0]['product']['retailers']) == 2
+
+
+# Тесты получения объектов по списку id
+
+
+@pytest.mark.django_db
+def test_batch_returns_requested_objects_in_one_query(api_client, user_first, user_second, first_retail_network,
+                                                      second_retail_network, first_manufacturer):
+    """ Тест batch: объекты в порядке запроса одним запросом, отсутствующие и чужие id — в not_found """
+    foreign = RetailNetwork.objects.create(owner=user_second, name='Чужая', email='a@example.com', street='ул',
+                                           house_number='1', level=1, manufacturer=first_manufacturer,
+                                           **resolve_address('Россия', 'Москва'))
+    api_client.force_authenticate(user=user_first)
+    ids = f'{second_retail_network.id},999999,{foreign.id},{first_retail_network.id}'
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get('/retail_networks/batch/', {'ids': ids, 'fields': 'name'})
+    assert response.status_code == 200
+    assert response.json() == {'results': [{'name': 'Золото'}, {'name': 'Серебро'}], 'not_found': [999999, foreign.id],
+                               'invalid': []}
+    assert len(context.captured_queries) == 1
+
+    response = api_client.post('/retail_networks/batch/', {'ids': [first_retail_network.id]}, format='json')
+    assert response.json()['results'][0]['manufacturer'] == {'name': 'Гамма'}
+    assert api_client.get('/retail_networks/batch/').status_code == 400
+    assert api_client.get('/retail_networks/batch/', {'ids': ','.join(['1'] * 501)}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_list_with_ids_reports_invalid_ids(api_client, user_first, first_retail_network, second_retail_network):
+    """ Тест ?ids= на списке: ответ как у batch, значения, не являющиеся id, — в invalid, а не ошибка пакета """
+    api_client.force_authenticate(user=user_first)
+    response = api_client.get('/retail_networks/', {'ids': f'a,{first_retail_network.id},0,999999', 'fields': 'name'})
+    assert response.status_code == 200
+    assert response.json() == {'results': [{'name': 'Серебро'}], 'not_found': [999999], 'invalid': ['a', '0']}
+
+    response = api_client.post('/retail_networks/batch/', {'ids': [second_retail_network.id, 'x']}, format='json')
+    assert response.json()['invalid'] == ['x']
+    assert api_client.get('/retail_networks/', {'ids': ''}).status_code == 400
+    assert 'count' in api_client.get('/retail_networks/').json()
+
+
+@pytest.mark.django_db
+def test_batch_on_all_resources(api_client, user_first, first_transaction, first_individual_entrepreneur):
+    """ Тест batch на всех ресурсах сети """
+    api_client.force_authenticate(user=user_first)
+    for url, obj in (('/manufacturers/', first_transaction.seller_manufacturer),
+                     ('/individual_entrepreneurs/', first_individual_entrepreneur),
+                     ('/products/', first_transaction.product), ('/transactions/', first_transaction)):
+        response = api_client.post(f'{url}batch/', {'ids': [obj.id, 999999]}, format='json')
+        assert response.status_code == 200, url
+        assert response.json()['results'] == [api_client.get(f'{url}{obj.id}/').json()], url
+        assert response.json()['not_found'] == [999999], url
+
+
+# Тесты ленты изменений
+
+
+# на PostgreSQL лента отдаёт только записи завершённых транзакций
+@pytest.mark.django_db(transaction=True, databases='__all__')
+def test_changes_feed_with_cascaded_tombstones(api_client, user_first, first_transaction, second_retail_network):
+    """ Тест /changes/: созданные и изменённые объекты с текущим состоянием, надгробия каскадного удаления """
+    api_client.force_authenticate(user=user_first)
+    response = api_client.get('/changes/')
+    assert response.status_code == 200
+    feed = response.json()
+    assert not feed['has_more']
+    created = {(item['resource'], item['id']): item for item in feed['results']}
+    assert created[('transaction', first_transaction.id)]['action'] == 'created'
+    assert created[('transaction', first_transaction.id)]['data']['debt'] == '10000.00'
+    assert created[('retail_network', second_retail_network.id)]['data']['name'] == 'Золото'
+    cursor = feed['cursor']
+    assert api_client.get('/changes/', {'cursor': cursor}).json()['results'] == []
+
+    first_transaction.product.retailers.add(second_retail_network)
+    second_retail_network.name = 'Платина'
+    second_retail_network.save()
+    feed = api_client.get('/changes/', {'cursor': cursor}).json()
+    assert [(item['resource'], item['action']) for item in feed['results']] == [
+        ('product', 'updated'), ('retail_network', 'updated')]
+    assert feed['results'][1]['data']['name'] == 'Платина'
+    cursor = feed['cursor']
+
+    # удаление завода каскадно удаляет сети, продукт и транзакцию
+    first_transaction.seller_manufacturer.delete()
+    feed = api_client.get('/changes/', {'cursor': cursor}).json()
+    deleted = {(item['resource'], item['id']) for item in feed['results'] if item['action'] == 'deleted'}
+    assert {('transaction', first_transaction.id), ('product', first_transaction.product_id),
+            ('retail_network', second_retail_network.id),
+            ('manufacturer', first_transaction.seller_manufacturer_id)} <= deleted
+    assert all(item['data'] is None for item in feed['results'])
+
+
+# на PostgreSQL лента отдаёт только записи завершённых транзакций
+@pytest.mark.django_db(transaction=True, databases='__all__')
+def test_changes_feed_paging_and_filters(api_client, user_first, user_second, first_transaction):
+    """ Тест /changes/: постраничное чтение по курсору, фильтр ресурсов, только свои объекты, сжатие журнала """
+    Manufacturer.objects.create(name='Чужой', email='a@example.com', street='ул', house_number='1', level=0,
+                                owner=user_second, **resolve_address('Россия', 'Москва'))
+    api_client.force_authenticate(user=user_first)
+    seen, cursor, has_more = [], None, True
+    while has_more:
+        feed = api_client.get('/changes/', {'cursor': cursor, 'limit': 2} if cursor else {'limit': 2}).json()
+        assert len(feed['results']) <= 2
+        seen.extend((item['resource'], item['id']) for item in feed['results'])
+        cursor, has_more = feed['cursor'], feed['has_more']
+    assert sorted(seen) == sorted({('manufacturer', first_transaction.seller_manufacturer_id),
+                                   ('retail_network', first_transaction.buyer_retail_network_id),
+                                   ('product', first_transaction.product_id),
+                                   ('transaction', first_transaction.id)})
+
+    feed = api_client.get('/changes/', {'resources': 'transaction'}).json()
+    assert [item['resource'] for item in feed['results']] == ['transaction']
+    assert api_client.get('/changes/', {'cursor': 'abc'}).status_code == 400
+    assert api_client.get('/changes/', {'resources': 'user'}).status_code == 400
+
+    first_transaction.amount = 20
+    first_transaction.save()
+    out = StringIO()
+    call_command('compact_changes', stdout=out)
+    assert 'Удалено записей журнала: 1' in out.getvalue()
+    feed = api_client.get('/changes/', {'resources': 'transaction'}).json()
+    assert feed['results'][0]['action'] == 'updated' and feed['results'][0]['data']['amount'] == 20
+
+
+# Тесты чтения с реплик
+
+
+def test_replica_router_routes_reads_and_pins_writers(settings):
+    """ Тест маршрутизатора: безопасные запросы читают с реплики, после записи пользователь читает с основной базы """
+    settings.DATABASE_REPLICAS = ['replica_1', 'replica_2']
+    cache.clear()
+    routes = []
+
+    def view(request):
+        routes.append((router.db_for_read(Product), router.db_for_read(User)))
+        if request.method == 'POST':
+            routes.append(router.db_for_write(Product))
+        return HttpResponse()
+
+    middleware = ReplicaRoutingMiddleware(view)
+    factory = RequestFactory()
+
+    def call(method, user_id):
+        request = getattr(factory, method)('/products/')
+        request.user = User(pk=user_id)
+        middleware(request)
+        return routes.pop(0)
+
+    assert call('get', 1)[0] in settings.DATABASE_REPLICAS
+    # пользователи и сессии всегда читаются с основной базы
+    assert call('get', 1)[1] == 'default'
+    assert call('post', 1) == ('default', 'default')
+    assert routes.pop() == 'default'
+    assert call('get', 1) == ('default', 'default')
+    assert call('get', 2)[0] in settings.DATABASE_REPLICAS
+    # вне запроса (команды, фоновые задачи) — основная база
+    assert router.db_for_read(Product) == 'default'
+    assert not router.allow_migrate('replica_1', 'electronics_network')
+
+
+@pytest.mark.django_db(transaction=True, databases='__all__')
+def test_replica_reads_through_api(settings, api_client, user_first, user_second, first_manufacturer):
+    """ Тест API с двумя псевдонимами баз: списки и лента изменений читаются с реплики, записавший — с основной """
+    if not settings.DATABASE_REPLICAS:
+        pytest.skip('Нужны реплики: POSTGRES_REPLICA_HOSTS')
+    cache.clear()
+
+    def replica_queries(user, url, params=None):
+        api_client.force_authenticate(user=user)
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias]))
+                        for alias in settings.DATABASE_REPLICAS]
+            response = api_client.get(url, params)
+        assert response.status_code == 200
+        return response.json(), sum(len(context) for context in captured)
+
+    data, queries = replica_queries(user_first, '/manufacturers/')
+    assert queries and data['results'][0]['name'] == 'Гамма'
+    api_client.patch(f'/manufacturers/{first_manufacturer.id}/', {'name': 'Дельта'}, format='json')
+    data, queries = replica_queries(user_first, '/manufacturers/')
+    assert queries == 0 and data['results'][0]['name'] == 'Дельта'
+    assert replica_queries(user_second, '/manufacturers/')[1]
+
+    cache.delete(pin_cache_key(user_first.pk))
+    data, queries = replica_queries(user_first, '/changes/')
+    assert queries and {item['id'] for item in data['results'] if item['resource'] == 'manufacturer'} == {
+        first_manufacturer.id}
+
+
+# Тесты схемы OpenAPI
+
+
+def test_openapi_schema_is_built_once(monkeypatch, api_client):
+    """ Тест схемы: строится один раз, отдаётся с ETag и Cache-Control, повторный запрос получает 304 """
+    monkeypatch.setattr(schema, '_documents', {})
+    monkeypatch.setattr(schema.settings, 'OPENAPI_SCHEMA_FILE', '/nonexistent/openapi.json')
+    builds = []
+    build_documents = schema.build_documents
+    monkeypatch.setattr(schema, 'build_documents', lambda: builds.append(1) or build_documents())
+
+    response = api_client.get('/swagger/', {'format': 'openapi'})
+    assert response.status_code == 200
+    assert '/products/' in json.loads(response.content)['paths']
+    assert 'max-age=3600' in response['Cache-Control'] and 'public' in response['Cache-Control']
+    assert api_client.get('/redoc/', {'format': 'openapi'}).content == response.content
+    assert api_client.get('/swagger/', {'format': 'yaml'}).status_code == 200
+    assert builds == [1]
+    cached = api_client.get('/swagger/', {'format': 'openapi'}, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert cached.status_code == 304
+    assert api_client.get('/swagger/').status_code == 200
+
+
+def test_openapi_schema_file_from_build_command(monkeypatch, tmp_path, api_client):
+    """ Тест build_openapi_schema: файл сборки отдаётся без генерации, файл от другого кода не используется """
+    path = tmp_path / 'openapi.json'
+    monkeypatch.setattr(schema.settings, 'OPENAPI_SCHEMA_FILE', str(path))
+    call_command('build_openapi_schema', stdout=StringIO())
+    expected = json.loads(path.read_text())['documents']['openapi']
+
+    monkeypatch.setattr(schema, '_documents', {})
+    monkeypatch.setattr(schema, 'build_documents', lambda: pytest.fail('схема должна читаться из файла'))
+    assert api_client.get('/swagger/', {'format': 'openapi'}).content.decode() == expected
+
+    data = json.loads(path.read_text())
+    path.write_text(json.dumps({**data, 'fingerprint': 'old'}))
+    monkeypatch.setattr(schema, '_documents', {})
+    monkeypatch.setattr(schema, 'build_documents', lambda: {'openapi': '{}'})
+    assert api_client.get('/swagger/', {'format': 'openapi'}).content == b'{}'
+
+
+# Тесты справочников стран и городов
+
+
+@pytest.mark.django_db
+def test_address_input_is_canonicalized(api_client, user_first, first_manufacturer):
+    """ Тест справочников: названия приводятся к записям без дублей, частичное изменение города сохраняет страну """
+    api_client.force_authenticate(user=user_first)
+    response = api_client.post('/retail_networks/', {
+        'name': 'Бронза', 'email': 'bronze@yandex.ru', 'country': '  россия ', 'city': 'САНКТ-ПЕТЕРБУРГ',
+        'street': 'Невский', 'house_number': '1', 'level': 1, 'manufacturer': first_manufacturer.id,
+    }, format='json')
+    assert response.status_code == 201
+    network = RetailNetwork.objects.get(pk=response.json()['id'])
+    assert (network.country_id, network.city_id) == (first_manufacturer.country_id, first_manufacturer.city_id)
+    assert Country.objects.count() == 1 and City.objects.count() == 1
+
+    response = api_client.patch(f'/manufacturers/{first_manufacturer.id}/', {'city': 'казань'}, format='json')
+    assert response.status_code == 200
+    assert (response.json()['country'], response.json()['city']) == ('Россия', 'Казань')
+    assert City.objects.get(name='Казань').country_id == first_manufacturer.country_id
+    assert api_client.get(f'/retail_networks/{network.id}/').json()['city'] == 'Санкт-Петербург'
+
+
+@pytest.mark.django_db
+def test_country_filter_uses_foreign_key(api_client, user_first, first_product, first_individual_entrepreneur):
+    """ Тест фильтра по стране: сравнение внешнего ключа вместо iexact по тексту, списки без лишних запросов """
+    api_client.force_authenticate(user=user_first)
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get('/manufacturers/', {'country': 'РОССИЯ'})
+    assert [item['country'] for item in response.json()['results']] == ['Россия']
+    sql = context.captured_queries[-1]['sql']
+    assert '"country_id" IN (SELECT' in sql and 'UPPER' not in sql
+    assert api_client.get('/manufacturers/', {'country': 'Франция'}).json()['results'] == []
+    assert api_client.get('/products/', {'country': 'россия'}).json()['results'][0]['id'] == first_product.id
+
+    with CaptureQueriesContext(connection) as context:
+        result = api_client.get('/individual_entrepreneurs/').json()['results'][0]
+    assert (result['country'], result['city']) == ('Россия', 'Санкт-Петербург')
+    # COUNT(*) и страница: название страны и города приходят JOIN'ом в запросе страницы
+    assert len(context.captured_queries) == 2
+
+
+@pytest.mark.django_db
+def test_address_keeps_field_order(api_client, user_first, first_manufacturer, first_retail_network,
+                                   first_individual_entrepreneur):
+    """ Тест справочников: страна и город остаются после электронной почты, как до переноса в справочники """
+    api_client.force_authenticate(user=user_first)
+    address = ['name', 'email', 'country', 'city', 'street', 'house_number', 'created_at', 'level', 'owner']
+    assert list(api_client.get(f'/manufacturers/{first_manufacturer.id}/').json()) == ['id', *address]
+    assert list(api_client.get('/retail_networks/').json()['results'][0]) == [
+        'id', 'retail_network', 'manufacturer', *address]
+    assert list(api_client.get(f'/individual_entrepreneurs/{first_individual_entrepreneur.id}/').json()) == [
+        'id', 'retail_network', 'manufacturer', *address]
+
+
+# Тесты счётчиков фасетов
+
+
+@pytest.mark.django_db
+def test_facets_scoped_by_owner_and_cached(api_client, user_first, user_second, first_retail_network,
+                                           first_individual_entrepreneur, first_product):
+    """ Тест фасетов: счётчики по объектам владельца, повторный запрос из кэша, запись сбрасывает кэш """
+    cache.clear()
+    first_product.retailers.add(first_retail_network)
+    RetailNetwork.objects.create(name='Чужая сеть', email='other@yandex.ru', street='Невский', house_number='2',
+                                 level=1, manufacturer=first_retail_network.manufacturer, owner=user_second,
+                                 **resolve_address('Россия', 'Москва'))
+    api_client.force_authenticate(user=user_first)
+    facets = api_client.get('/retail_networks/facets/').json()
+    assert facets['country'] == [{'value': first_retail_network.country_id, 'label': 'Россия', 'count': 1}]
+    assert facets['city'] == [{'value': first_retail_network.city_id, 'label': 'Санкт-Петербург', 'count': 1}]
+    assert facets['supplier_type'] == [{'value': 'manufacturer', 'label': 'производитель', 'count': 1}]
+    product_facets = api_client.get('/products/facets/').json()
+    assert [(item['value'], item['count']) for item in product_facets['level']] == [(0, 1), (1, 1)]
+    assert [item['value'] for item in product_facets['supplier_type']] == ['manufacturer', 'retail_network']
+
+    with CaptureQueriesContext(connection) as context:
+        api_client.get('/retail_networks/facets/')
+    assert not [query for query in context.captured_queries if 'retailnetwork' in query['sql']]
+
+    api_client.patch(f'/retail_networks/{first_retail_network.id}/', {'city': 'Казань'}, format='json')
+    cities = api_client.get('/retail_networks/facets/').json()['city']
+    assert [(item['label'], item['count']) for item in cities] == [('Казань', 1)]
+
+    api_client.force_authenticate(user=user_second)
+    cities = api_client.get('/retail_networks/facets/').json()['city']
+    assert sorted((item['label'], item['count']) for item in cities) == [('Казань', 1), ('Москва', 1)]
+
+
+@pytest.mark.django_db
+def test_admin_facet_filters(admin_client_staff, first_manufacturer, first_retail_network, second_retail_network):
+    """ Тест фильтров админки: варианты страны и уровня со счётчиками фасетов, выбор фильтрует список """
+    cache.clear()
+    response = admin_client_staff.get('/admin/electronics_network/retailnetwork/')
+    content = response.content.decode()
+    assert 'Россия (2)' in content and '1 (1)' in content and '2 (1)' in content
+
+    response = admin_client_staff.get('/admin/electronics_network/retailnetwork/', {'level__exact': 2})
+    assert response.status_code == 200
+    assert list(response.context['cl'].result_list) == [second_retail_network]
+
+
+# Тесты массового назначения поставщиков
+
+
+# после теста таблицы очищаются TRUNCATE: откат 100 000 вставок оставил бы мёртвые строки и изменил планы запросов
+@pytest.mark.django_db(transaction=True)
+def test_bulk_assign_suppliers_100k_links(api_client, user_first, first_manufacturer, first_individual_entrepreneur):
+    """ Тест массового назначения: 100 000 связей пакетными INSERT, повтор пропускает существующие, удаление """
+    address = {'country': first_manufacturer.country, 'city': first_manufacturer.city, 'street': 'Невский',
+               'house_number': '1'}
+    retailers = RetailNetwork.objects.bulk_create([
+        RetailNetwork(name=f'Сеть {number}', email='shop@yandex.ru', level=1, manufacturer=first_manufacturer,
+                      owner=user_first, **address)
+        for number in range(1000)
+    ])
+    products = Product.objects.bulk_create([
+        Product(name=f'Продукт {number}', model='M', release_date='2024-01-01', manufacturer=first_manufacturer,
+                owner=user_first)
+        for number in range(100)
+    ])
+    product_ids = [product.id for product in products]
+    retailer_ids = [retailer.id for retailer in retailers]
+    products[0].retailers.add(retailers[0])
+    api_client.force_authenticate(user=user_first)
+
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.post('/products/suppliers/add/', {
+            'products': product_ids, 'retailers': retailer_ids, 'entrepreneurs': [first_individual_entrepreneur.id],
+        }, format='json')
+    assert response.status_code == 200
+    assert response.json() == {'added': {'retailers': 99999, 'entrepreneurs': 100}}
+    assert Product.retailers.through.objects.count() == 100000
+    inserts = [query for query in context.captured_queries
+               if query['sql'].startswith('INSERT') and '_product_retailers' in query['sql']]
+    # 20 пакетов по 5000 связей; SQLite делит пакет по числу параметров запроса
+    per_batch = -(-5000 // connection.ops.bulk_batch_size(['product_id', 'retailnetwork_id'], [None] * 5000))
+    assert len(inserts) == 20 * per_batch
+    assert len(context.captured_queries) - len(inserts) < 20
+    assert Change.objects.filter(resource='product', action=Change.ACTION_UPDATED).count() == 101
+
+    response = api_client.post('/products/suppliers/add/', {'products': product_ids, 'retailers': retailer_ids},
+                               format='json')
+    assert response.json() == {'added': {'retailers': 0}}
+
+    response = api_client.post('/products/suppliers/remove/', {
+        'products': product_ids[:50], 'retailers': retailer_ids, 'entrepreneurs': [first_individual_entrepreneur.id],
+    }, format='json')
+    assert response.json() == {'removed': {'retailers': 50000, 'entrepreneurs': 50}}
+    assert Product.retailers.through.objects.count() == 50000
+    assert list(products[0].retailers.all()) == [] and products[99].retailers.count() == 1000
+
+
+@pytest.mark.django_db
+def test_bulk_assign_suppliers_rejects_foreign_objects(api_client, user_first, user_second, first_product,
+                                                       first_retail_network):
+    """ Тест массового назначения: чужие и несуществующие id отклоняют запрос целиком """
+    foreign_product = Product.objects.create(name='Чужой', model='X', release_date='2024-01-01', owner=user_second)
+    api_client.force_authenticate(user=user_first)
+
+    response = api_client.post('/products/suppliers/add/', {
+        'products': [first_product.id, foreign_product.id], 'retailers': [first_retail_network.id, 999999],
+    }, format='json')
+    assert response.status_code == 400
+    assert response.json() == {'products': [f'Объекты не найдены: {foreign_product.id}'],
+                               'retailers': ['Объекты не найдены: 999999']}
+    assert not first_product.retailers.exists()
+
+    response = api_client.post('/products/suppliers/add/', {'products': [first_product.id]}, format='json')
+    assert response.status_code == 400
+
+    api_client.force_authenticate(user=user_second)
+    response = api_client.post('/products/suppliers/add/', {
+        'products': [first_product.id, foreign_product.id], 'retailers': [first_retail_network.id],
+    }, format='json')
+    assert response.json() == {'added': {'retailers': 2}}
+
+
+@pytest.mark.django_db
+def test_bulk_assign_suppliers_counts_inserted_links(monkeypatch, api_client, user_first, first_product,
+                                                     first_retail_network, second_retail_network):
+    """ Тест массового назначения: связь, добавленная параллельно после проверки существующих, не считается """
+    first_product.retailers.add(first_retail_network)
+    # другая транзакция успела вставить связь между чтением существующих связей и INSERT
+    monkeypatch.setattr(suppliers, '_links', lambda *args: Product.retailers.through.objects.none())
+    api_client.force_authenticate(user=user_first)
+    response = api_client.post('/products/suppliers/add/', {
+        'products': [first_product.id], 'retailers': [first_retail_network.id, second_retail_network.id],
+    }, format='json')
+    assert response.json() == {'added': {'retailers': 1}}
+    assert first_product.retailers.count() == 2
+
+
+# Тесты остатков продуктов
+
+
+def stock_levels():
+    rows = Stock.objects.all()
+    return {(row.product_id, row.manufacturer_id, row.retail_network_id, row.individual_entrepreneur_id): row.quantity
+            for row in rows}
+
+
+@pytest.mark.django_db
+def test_stock_follows_transaction_writes(api_client, user_first, first_transaction, first_product, first_manufacturer,
+                                          first_retail_network, first_individual_entrepreneur):
+    """ Тест остатков: создание, изменение количества и удаление транзакции меняют остатки звеньев """
+    product, network = first_product, first_retail_network
+    assert stock_levels() == {(product.id, first_manufacturer.id, None, None): -10,
+                              (product.id, None, network.id, None): 10}
+
+    api_client.force_authenticate(user=user_first)
+    product.retailers.add(network)
+    response = api_client.post('/transactions/', {
+        'product': product.id, 'seller_manufacturer': None, 'seller_retail_network': network.id,
+        'seller_individual_entrepreneur': None, 'buyer_manufacturer': None, 'buyer_retail_network': None,
+        'buyer_individual_entrepreneur': first_individual_entrepreneur.id, 'amount': 4, 'debt': '0.00',
+    }, format='json')
+    assert response.status_code == 201
+    assert stock_levels()[(product.id, None, network.id, None)] == 6
+    assert stock_levels()[(product.id, None, None, first_individual_entrepreneur.id)] == 4
+
+    first_transaction.amount = 15
+    first_transaction.save()
+    api_client.delete(f"/transactions/{response.json()['id']}/")
+    results = api_client.get('/stock/', {'retail_network': network.id}).json()['results']
+    assert [(row['product'], row['quantity']) for row in results] == [(product.id, 15)]
+    assert api_client.get('/stock/', {'nonzero': 'true'}).json()['count'] == 2
+
+    expected = stock_levels()
+    stock.rebuild()
+    assert {key: value for key, value in stock_levels().items() if value} == \
+           {key: value for key, value in expected.items() if value}
+
+
+@pytest.mark.django_db
+def test_rebuild_stock_recovers_from_drift(api_client, user_first, user_second, first_transaction, first_product,
+                                           first_retail_network):
+    """ Тест пересчёта остатков: пакетная вставка без сигналов расходится с таблицей, команда rebuild_stock чинит """
+    Transaction.objects.bulk_create([
+        Transaction(product=first_product, seller_retail_network=first_retail_network,
+                    buyer_retail_network=first_retail_network, amount=1, owner=user_first),
+        Transaction(product=first_product, seller_manufacturer=first_product.manufacturer,
+                    buyer_retail_network=first_retail_network, amount=5, owner=user_first),
+    ])
+    Stock.objects.filter(retail_network=first_retail_network).update(quantity=999)
+
+    call_command('rebuild_stock', stdout=StringIO())
+    assert stock_levels() == {(first_product.id, first_product.manufacturer_id, None, None): -15,
+                              (first_product.id, None, first_retail_network.id, None): 15}
+
+    api_client.force_authenticate(user=user_second)
+    assert api_client.get('/stock/').json()['count'] == 2
+    api_client.force_authenticate(user=User.objects.create_user(username='third', password='x'))
+    assert api_client.get('/stock/').json()['count'] == 0
+
+
+@pytest.mark.django_db
+def test_stock_rows_locked_in_key_order(user_first, first_product, first_retail_network, second_retail_network):
+    """ Тест остатков: встречные продажи A→B и B→A меняют строки остатков в одном порядке """
+    orders = []
+    for seller, buyer in ((first_retail_network, second_retail_network),
+                          (second_retail_network, first_retail_network)):
+        deltas = stock.new_deltas()
+        stock.add_rows(deltas, [stock.instance_movement(Transaction(
+            product=first_product, seller_retail_network=seller, buyer_retail_network=buyer, amount=1,
+            owner=user_first))], 1)
+        with CaptureQueriesContext(connection) as context:
+            stock.apply_deltas(deltas)
+        orders.append([int(node_id) for query in context.captured_queries if query['sql'].startswith('UPDATE')
+                       for node_id in re.findall(r'"retail_network_id" = (\d+)', query['sql'])])
+    assert orders[0] == orders[1] == sorted([first_retail_network.id, second_retail_network.id])
+
+
+@pytest.mark.django_db
+def test_stock_keyed_by_node_across_owners(api_client, user_first, first_transaction, first_product,
+                                           first_manufacturer, first_retail_network):
+    """ Тест остатков: транзакции разных пользователей с одним звеном меняют одну строку, её видит владелец звена """
+    stranger = User.objects.create_user(username='third', password='x')
+    Transaction.objects.create(product=first_product, seller_manufacturer=first_manufacturer,
+                               buyer_retail_network=first_retail_network, amount=5, owner=stranger)
+    assert stock_levels() == {(first_product.id, first_manufacturer.id, None, None): -15,
+                              (first_product.id, None, first_retail_network.id, None): 15}
+
+    api_client.force_authenticate(user=user_first)
+    results = api_client.get('/stock/', {'retail_network': first_retail_network.id}).json()['results']
+    assert [row['quantity'] for row in results] == [15]
+    assert api_client.get(f"/stock/{results[0]['id']}/").status_code == 200
+    api_client.force_authenticate(user=stranger)
+    assert api_client.get('/stock/').json()['count'] == 0
+    assert api_client.get(f"/stock/{results[0]['id']}/").status_code == 404
+
+
+# Тесты снимка иерархии
+
+
+@pytest.mark.django_db
+def test_hierarchy_snapshot_lookups(api_client, settings, tmp_path, user_first, first_manufacturer,
+                                    first_retail_network, second_retail_network, first_individual_entrepreneur):
+    """ Тест снимка иерархии: путь до производителя и размер поддерева из файла, без запросов к базе """
+    settings.HIERARCHY_SNAPSHOT_FILE = tmp_path / 'hierarchy.snapshot'
+    snapshot = hierarchy.get_snapshot()
+    assert len(snapshot) == 4
+    with CaptureQueriesContext(connection) as context:
+        path = snapshot.path_to_root('retail_network', second_retail_network.id)
+        sizes = [snapshot.subtree_size('manufacturer', first_manufacturer.id),
+                 snapshot.subtree_size('retail_network', first_retail_network.id)]
+    assert not context.captured_queries
+    assert [(node['type'], node['id'], node['level']) for node in path] == [
+        ('retail_network', second_retail_network.id, 2), ('retail_network', first_retail_network.id, 1),
+        ('manufacturer', first_manufacturer.id, 0)]
+    assert sizes == [4, 2]
+    assert snapshot.path_to_root('retail_network', 999999) is None
+
+    api_client.force_authenticate(user=user_first)
+    response = api_client.get(f'/individual_entrepreneurs/{first_individual_entrepreneur.id}/hierarchy/')
+    assert response.json() == {'path': [
+        {'type': 'individual_entrepreneur', 'id': first_individual_entrepreneur.id, 'level': 1},
+        {'type': 'manufacturer', 'id': first_manufacturer.id, 'level': 0}], 'subtree_size': 1}
+
+
+@pytest.mark.django_db
+def test_hierarchy_snapshot_swapped_after_commit(settings, tmp_path, monkeypatch, django_capture_on_commit_callbacks,
+                                                 user_first, first_manufacturer, first_retail_network):
+    """ Тест подмены снимка: после фиксации изменений ставится одна фоновая сборка, процессы видят новый снимок """
+    settings.HIERARCHY_SNAPSHOT_FILE = tmp_path / 'hierarchy.snapshot'
+    old = hierarchy.get_snapshot()
+    # другой процесс сервера: своё отображение того же файла
+    worker = hierarchy.Snapshot(settings.HIERARCHY_SNAPSHOT_FILE)
+    builds = []
+    write_snapshot = hierarchy.write_snapshot
+    monkeypatch.setattr(hierarchy, 'write_snapshot', lambda path=None: builds.append(path) or write_snapshot(path))
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        for number in range(3):
+            RetailNetwork.objects.create(name=f'Сеть {number}', email='shop@yandex.ru', level=2,
+                                         retail_network=first_retail_network, owner=user_first,
+                                         **resolve_address('Россия', 'Москва'), street='Тверская', house_number='1')
+    assert len(callbacks) == 3 and not builds
+    assert Job.objects.filter(name='rebuild_hierarchy', status=Job.STATUS_PENDING).count() == 1
+    assert jobs.run_pending_jobs() == 1 and len(builds) == 1
+
+    current = hierarchy.get_snapshot()
+    assert current is not old and len(current) == 5
+    assert current.subtree_size('manufacturer', first_manufacturer.id) == 5
+    # прежние отображения дочитывают старый файл
+    assert len(old) == len(worker) == 2
+    assert hierarchy.Snapshot(settings.HIERARCHY_SNAPSHOT_FILE).built_at == current.built_at
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['.hierarchy.snapshot.lock', 'hierarchy.snapshot']
+
+
+@pytest.mark.django_db
+def test_hierarchy_rebuilt_only_on_structure_change(settings, tmp_path, django_capture_on_commit_callbacks,
+                                                    user_first, first_manufacturer, first_retail_network,
+                                                    second_retail_network):
+    """ Тест снимка иерархии: сборку ставит смена поставщика или уровня и удаление, но не правка адреса """
+    settings.HIERARCHY_SNAPSHOT_FILE = tmp_path / 'hierarchy.snapshot'
+    hierarchy.get_snapshot()
+    rebuilds = Job.objects.filter(name='rebuild_hierarchy')
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        first_manufacturer.name = 'Дельта'
+        first_manufacturer.save()
+        second_retail_network.street = 'Невский'
+        second_retail_network.save()
+    assert not callbacks and not rebuilds.exists()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        second_retail_network.retail_network, second_retail_network.manufacturer = None, first_manufacturer
+        second_retail_network.level = 1
+        second_retail_network.save()
+    jobs.run_pending_jobs()
+    path = hierarchy.get_snapshot().path_to_root('retail_network', second_retail_network.id)
+    assert [node['type'] for node in path] == ['retail_network', 'manufacturer']
+
+    with django_capture_on_commit_callbacks(execute=True):
+        second_retail_network.delete()
+    assert rebuilds.count() == 2
+
+
+@pytest.mark.django_db
+def test_hierarchy_snapshot_keeps_newer_build(settings, tmp_path, monkeypatch, user_first, first_manufacturer,
+                                              first_retail_network):
+    """ Тест снимка иерархии: старая сборка, завершившаяся после более новой, не подменяет её файл """
+    settings.HIERARCHY_SNAPSHOT_FILE = tmp_path / 'hierarchy.snapshot'
+    read_nodes = hierarchy._read_nodes
+
+    def slow_read_nodes():
+        nodes = read_nodes()
+        # пока старая сборка читает базу, звено добавляется и более новая сборка другого процесса завершается
+        monkeypatch.setattr(hierarchy, '_read_nodes', read_nodes)
+        RetailNetwork.objects.create(name='Бронза', email='bronze@yandex.ru', level=2,
+                                     retail_network=first_retail_network, owner=user_first,
+                                     **resolve_address('Россия', 'Москва'), street='Тверская', house_number='1')
+        hierarchy.write_snapshot()
+        return nodes
+
+    monkeypatch.setattr(hierarchy, '_read_nodes', slow_read_nodes)
+    hierarchy.write_snapshot()
+    assert len(hierarchy.Snapshot(settings.HIERARCHY_SNAPSHOT_FILE)) == 3
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['.hierarchy.snapshot.lock', 'hierarchy.snapshot']
+
+
+# Тесты отчёта о долге нижестоящих покупателей
+
+
+def debt_exposure_network(owner, manufacturer, first_retail_network, second_retail_network,
+                          first_individual_entrepreneur):
+    """ Долги сети второго уровня, ИП у неё и ИП производителя; долг сети первого уровня — в first_transaction """
+    entrepreneur = IndividualEntrepreneur.objects.create(
+        name='ИП у сети', email='ip@yandex.ru', **resolve_address('Россия', 'Москва'), street='Тверская',
+        house_number='1', level=2, retail_network=second_retail_network, owner=owner)
+    for buyer, debt in ((second_retail_network, '500.00'), (entrepreneur, '25.50'),
+                        (first_individual_entrepreneur, '100.00'), (entrepreneur, '0.00')):
+        field = 'buyer_retail_network' if isinstance(buyer, RetailNetwork) else 'buyer_individual_entrepreneur'
+        Transaction.objects.create(seller_manufacturer=manufacturer, amount=1, debt=debt, owner=owner, **{field: buyer})
+    return Manufacturer.objects.create(name='Без покупателей', email='empty@yandex.ru', level=0, owner=owner,
+                                       **resolve_address('Россия', 'Москва'), street='Тверская', house_number='2')
+
+
+@pytest.mark.django_db
+def test_debt_exposure_report_sums_downstream_tree(api_client, monkeypatch, user_first, user_second,
+                                                   first_manufacturer, first_transaction, first_retail_network,
+                                                   second_retail_network, first_individual_entrepreneur):
+    """ Тест отчёта о долге: сети обоих уровней и ИП дерева производителя, JSON и CSV по объектам пользователя """
+    # запрос к API считает отчёт в процессе сервера, без пула
+    workers, report = [], debt_exposure.report
+    monkeypatch.setattr(debt_exposure, 'report', lambda owner_id=None, **kwargs:
+                        workers.append(kwargs.get('workers')) or report(owner_id, **kwargs))
+    empty = debt_exposure_network(user_first, first_manufacturer, first_retail_network, second_retail_network,
+                                  first_individual_entrepreneur)
+    foreign = Manufacturer.objects.create(name='Чужой', email='foreign@yandex.ru', level=0, owner=user_second,
+                                          **resolve_address('Россия', 'Москва'), street='Тверская', house_number='3')
+    api_client.force_authenticate(user=user_first)
+
+    response = api_client.get('/reports/debt_exposure/')
+    assert response.json() == {'results': [
+        {'manufacturer': first_manufacturer.id, 'name': 'Гамма', 'retail_networks_debt': '10500.00',
+         'entrepreneurs_debt': '125.50', 'debt': '10625.50', 'debtors': 4},
+        {'manufacturer': empty.id, 'name': 'Без покупателей', 'retail_networks_debt': '0.00',
+         'entrepreneurs_debt': '0.00', 'debt': '0.00', 'debtors': 0},
+    ]}
+
+    response = api_client.get('/reports/debt_exposure/', {'format': 'csv'})
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    assert response.content.decode().splitlines() == [
+        'manufacturer,name,retail_networks_debt,entrepreneurs_debt,debt,debtors',
+        f'{first_manufacturer.id},Гамма,10500.00,125.50,10625.50,4',
+        f'{empty.id},Без покупателей,0.00,0.00,0.00,0',
+    ]
+
+    api_client.force_authenticate(user=user_second)
+    results = api_client.get('/reports/debt_exposure/').json()['results']
+    assert [row['manufacturer'] for row in results] == [first_manufacturer.id, empty.id, foreign.id]
+    assert workers == [1, 1, 1]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_debt_exposure_report_process_pool(monkeypatch, tmp_path, user_first, first_manufacturer, first_transaction,
+                                           first_retail_network, second_retail_network, first_individual_entrepreneur):
+    """ Тест отчёта пулом процессов: части считаются в своих соединениях и совпадают с расчётом в одном процессе """
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        pytest.skip('процессы пула не видят базу SQLite в памяти')
+    debt_exposure_network(user_first, first_manufacturer, first_retail_network, second_retail_network,
+                          first_individual_entrepreneur)
+    pools = []
+    monkeypatch.setattr(debt_exposure, 'ProcessPoolExecutor',
+                        lambda workers, **kwargs: pools.append(workers) or ProcessPoolExecutor(workers, **kwargs))
+
+    output = tmp_path / 'debt_exposure.json'
+    call_command('debt_exposure_report', '--format', 'json', '--workers', '2', '--output', str(output))
+    assert pools == [2]
+    assert json.loads(output.read_text(encoding='utf-8')) == json.loads(json.dumps(
+        debt_exposure.report(workers=1), cls=DjangoJSONEncoder))
+    assert json.loads(output.read_text(encoding='utf-8'))[0]['debt'] == '10625.50'
@@ -0,0 +1,203 @@
+""" Регрессионные тесты планов запросов (EXPLAIN) для эндпоинтов electronics_network
+
+Тест наполняет базу большим набором данных, снимает SQL каждого эндпоинта, прогоняет его через EXPLAIN
+и сравнивает форму плана (тип сканирования, индекс, оценка строк) со снимком в query_plan_snapshots.json.
+Последовательное сканирование таблиц транзакций и звеньев сети — всегда ошибка.
+Перезаписать снимки: QUERY_PLAN_UPDATE_SNAPSHOTS=1 pytest electronics_network/test_query_plans.py
+"""
+import json
+import math
+import os
+import re
+from datetime import date
+from pathlib import Path
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from electronics_network.addresses import resolve_address
+from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction
+from users.models import User
+
+SNAPSHOT_FILE = Path(__file__).with_name('query_plan_snapshots.json')
+UPDATE_SNAPSHOTS = os.getenv('QUERY_PLAN_UPDATE_SNAPSHOTS') == '1'
+# планировщик PostgreSQL выбирает последовательное сканирование для небольших таблиц,
+# поэтому для него база наполняется до десятков тысяч транзакций
+SEED_OWNERS = {'postgresql': 1000, 'sqlite': 20}
+
+GUARDED_TABLES = {
+    Transaction._meta.db_table,
+    Manufacturer._meta.db_table,
+    RetailNetwork._meta.db_table,
+    IndividualEntrepreneur._meta.db_table,
+    Product._meta.db_table,
+}
+
+ENDPOINTS = {
+    'manufacturer-list': ('/manufacturers/', None),
+    'manufacturer-detail': ('/manufacturers/{}/', Manufacturer),
+    'retail_network-list': ('/retail_networks/', None),
+    'retail_network-detail': ('/retail_networks/{}/', RetailNetwork),
+    'individual_entrepreneur-list': ('/individual_entrepreneurs/', None),
+    'individual_entrepreneur-detail': ('/individual_entrepreneurs/{}/', IndividualEntrepreneur),
+    'product-list': ('/products/', None),
+    'product-detail': ('/products/{}/', Product),
+    'transaction-list': ('/transactions/', None),
+    'transaction-detail': ('/transactions/{}/', Transaction),
+}
+
+
+def seed_network(owners_count):
+    """ Наполнить базу: на каждого владельца заводы, сети, ИП, продукты и транзакции """
+    address = {'email': 'node@example.com', **resolve_address('Россия', 'Москва'), 'street': 'Тверская',
+               'house_number': '1'}
+    owners = User.objects.bulk_create([User(username=f'owner_{i}') for i in range(owners_count)])
+    manufacturers = Manufacturer.objects.bulk_create([
+        Manufacturer(owner=owner, name=f'Завод {owner.pk}-{i}', level=0, **address)
+        for owner in owners for i in range(5)
+    ])
+    retail_networks = RetailNetwork.objects.bulk_create([
+        RetailNetwork(owner=manufacturer.owner, manufacturer=manufacturer, name=f'Сеть {manufacturer.pk}-{i}',
+                      level=1, **address)
+        for manufacturer in manufacturers for i in range(2)
+    ])
+    IndividualEntrepreneur.objects.bulk_create([
+        IndividualEntrepreneur(owner=network.owner, retail_network=network, name=f'ИП {network.pk}', level=2,
+                               **address)
+        for network in retail_networks
+    ])
+    products = Product.objects.bulk_create([
+        Product(owner=manufacturer.owner, manufacturer=manufacturer, name=f'Продукт {manufacturer.pk}-{i}',
+                model='Модель', release_date=date(2024, 1, 1))
+        for manufacturer in manufacturers for i in range(2)
+    ])
+    Product.retailers.through.objects.bulk_create([
+        Product.retailers.through(product_id=product.pk, retailnetwork_id=network.pk)
+        for product, network in zip(products, retail_networks)
+    ])
+    Transaction.objects.bulk_create([
+        Transaction(owner=product.owner, product=product, seller_manufacturer=product.manufacturer,
+                    buyer_retail_network=network, amount=1, debt=100)
+        for product, network in zip(products, retail_networks) for _ in range(10)
+    ])
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return owners[0]
+
+
+def explain(sql):
+    """ Форма плана запроса: список узлов сканирования в порядке обхода """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0][0]['Plan']
+            return _postgresql_shape(plan, *_partitions(cursor))
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return _sqlite_shape(cursor.fetchall())
+    pytest.skip(f'EXPLAIN не поддержан для {connection.vendor}')
+
+
+def _partitions(cursor):
+    """ Секции таблиц и их индексов -> родительская таблица или индекс; множество пустых секций """
+    cursor.execute(
+        'SELECT child.relname, parent.relname, child.relkind, child.reltuples FROM pg_inherits '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent'
+    )
+    rows = cursor.fetchall()
+    parents = {child: parent for child, parent, kind, tuples in rows}
+    empty = {child for child, parent, kind, tuples in rows if kind == 'r' and tuples <= 0}
+    return parents, empty
+
+
+def _postgresql_shape(plan, parents, empty):
+    # секции называются по месяцам, поэтому в снимок попадает имя родительской таблицы и индекса;
+    # пустые секции (будущие месяцы, секция по умолчанию) читаются мгновенно и в снимок не попадают
+    shape = []
+    if 'Relation Name' in plan and plan['Relation Name'] not in empty:
+        rows_order = round(math.log10(plan['Plan Rows'])) if plan['Plan Rows'] else 0
+        index = plan.get('Index Name')
+        shape.append({
+            'scan': plan['Node Type'],
+            'table': parents.get(plan['Relation Name'], plan['Relation Name']),
+            'index': parents.get(index, index),
+            'rows': f'1e{rows_order}',
+        })
+    for child in plan.get('Plans', []):
+        shape.extend(_postgresql_shape(child, parents, empty))
+    return shape
+
+
+def _sqlite_shape(rows):
+    shape = []
+    for row in rows:
+        match = re.match(r'(SCAN|SEARCH) (\w+)', row[-1])
+        if match:
+            scan, table = match.groups()
+            index = re.search(r'USING (?:COVERING )?INDEX (\w+)', row[-1])
+            if index:
+                index = index.group(1)
+            elif 'USING INTEGER PRIMARY KEY' in row[-1]:
+                index = 'PRIMARY KEY'
+            shape.append({'scan': scan, 'table': table, 'index': index})
+    return shape
+
+
+def is_full_scan(node):
+    """ Последовательное (полное) сканирование таблицы """
+    if connection.vendor == 'postgresql':
+        return node['scan'] == 'Seq Scan'
+    return node['scan'] == 'SCAN'
+
+
+def capture_plans(client, owner):
+    plans = {}
+    for name, (url, model) in ENDPOINTS.items():
+        if model is not None:
+            url = url.format(model.objects.filter(owner=owner).order_by('pk').values_list('pk', flat=True)[0])
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        assert response.status_code == 200, name
+        plans[name] = [
+            {'sql': query['sql'], 'plan': explain(query['sql'])}
+            for query in context.captured_queries
+            if query['sql'].lstrip().upper().startswith('SELECT')
+        ]
+    return plans
+
+
+def load_snapshots():
+    if SNAPSHOT_FILE.exists():
+        return json.loads(SNAPSHOT_FILE.read_text(encoding='utf-8'))
+    return {}
+
+
+@pytest.mark.django_db
+def test_owner_filtered_endpoints_query_plans():
+    """ Тест планов запросов эндпоинтов для обычного пользователя-владельца """
+    owner = seed_network(int(os.getenv('QUERY_PLAN_SEED_OWNERS', SEED_OWNERS.get(connection.vendor, 20))))
+    client = APIClient()
+    client.force_authenticate(user=owner)
+    plans = capture_plans(client, owner)
+
+    full_scans = [
+        f"{name}: {node['table']} <- {query['sql']}"
+        for name, queries in plans.items()
+        for query in queries
+        for node in query['plan']
+        if node['table'] in GUARDED_TABLES and is_full_scan(node)
+    ]
+    assert not full_scans, 'Полное сканирование таблицы:\n' + '\n'.join(full_scans)
+
+    shapes = {name: [query['plan'] for query in queries] for name, queries in plans.items()}
+    snapshots = load_snapshots()
+    if UPDATE_SNAPSHOTS:
+        snapshots[connection.vendor] = shapes
+        SNAPSHOT_FILE.write_text(json.dumps(snapshots, ensure_ascii=False, indent=2, sort_keys=True) + '\n',
+                                 encoding='utf-8')
+    elif connection.vendor in snapshots:
+        for name, shape in shapes.items():
+            assert shape == snapshots[connection.vendor].get(name), f'План запросов {name} изменился'
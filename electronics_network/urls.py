@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from electronics_network.views import (ProductViewSet, ManufacturerViewSet, RetailNetworkViewSet,
-                                       IndividualEntrepreneurViewSet, TransactionViewSet)
+                                       IndividualEntrepreneurViewSet, TransactionViewSet, PaymentViewSet,
+                                       SalesAnalyticsView, ChangesView, StockViewSet, DebtExposureView)
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
@@ -9,8 +10,13 @@ router.register(r'manufacturers', ManufacturerViewSet, basename='manufacturer')
 router.register(r'retail_networks', RetailNetworkViewSet, basename='retail_network')
 router.register(r'individual_entrepreneurs', IndividualEntrepreneurViewSet, basename='individual_entrepreneur')
 router.register(r'transactions', TransactionViewSet, basename='transaction')
+router.register(r'payments', PaymentViewSet, basename='payment')
+router.register(r'stock', StockViewSet, basename='stock')
 
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('analytics/sales/', SalesAnalyticsView.as_view(), name='analytics-sales'),
+    path('changes/', ChangesView.as_view(), name='changes'),
+    path('reports/debt_exposure/', DebtExposureView.as_view(), name='reports-debt-exposure'),
 ]
@@ -1,30 +1,51 @@
 import django_filters
-from rest_framework import viewsets, filters
-from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncMonth, TruncYear
+from rest_framework import viewsets, filters, mixins, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+from config.renderers import CSVRenderer
+from config.tracing import TracingViewMixin
+from electronics_network import changes, debt_exposure
+from electronics_network.expansion import ExpandViewMixin
+from electronics_network.facets import FacetsViewMixin
+from electronics_network.fastpath import ValuesListViewMixin
+from electronics_network.fieldsets import SparseFieldsViewMixin
+from electronics_network.hierarchy import HierarchyViewMixin
+from electronics_network.multiget import MultiGetViewMixin
+from electronics_network.models import Manufacturer, RetailNetwork, IndividualEntrepreneur, Product, Transaction, \
+    Payment, SalesRollup, Stock
 from electronics_network.pagination import ManufacturerPagination, RetailNetworkPagination, \
-    IndividualEntrepreneurPagination, ProductPagination, TransactionPagination
+    IndividualEntrepreneurPagination, ProductPagination, TransactionPagination, PaymentPagination, StockPagination
 from electronics_network.permissions import IsOwnerOrSuperuser, IsActiveAuthenticatedUser
 from electronics_network.serializers import ManufacturerSerializer, ProductSerializer, \
     IndividualEntrepreneurWriteSerializer, IndividualEntrepreneurReadSerializer, RetailNetworkWriteSerializer,\
-    RetailNetworkReadSerializer, TransactionReadSerializer, TransactionWriteSerializer
-from electronics_network.filters import ManufacturerFilter, ProductFilter
+    RetailNetworkReadSerializer, TransactionReadSerializer, TransactionWriteSerializer, PaymentSerializer, \
+    StockSerializer
+from electronics_network.filters import ManufacturerFilter, ProductFilter, TransactionFilter, StockFilter
+from electronics_network.payments import apply_payment
+from electronics_network.suppliers import ProductSuppliersViewMixin
 
 
-class ManufacturerViewSet(viewsets.ModelViewSet):
+class ManufacturerViewSet(TracingViewMixin, MultiGetViewMixin, ExpandViewMixin, SparseFieldsViewMixin,
+                          ValuesListViewMixin, FacetsViewMixin, HierarchyViewMixin, viewsets.ModelViewSet):
     """ Производитель """
     serializer_class = ManufacturerSerializer
     permission_classes = [IsOwnerOrSuperuser, IsActiveAuthenticatedUser]
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend, filters.SearchFilter]
     filterset_class = ManufacturerFilter
-    search_fields = ['name', 'country']
+    search_fields = ['name', 'country__name']
     pagination_class = ManufacturerPagination
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Manufacturer.objects.select_related('country', 'city')
         if user.is_superuser:
-            return Manufacturer.objects.all().order_by('pk')
+            return queryset.order_by('pk')
         else:
-            return Manufacturer.objects.filter(owner=user).order_by('pk')
+            return queryset.filter(owner=user).order_by('pk')
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
@@ -33,17 +54,19 @@ class ManufacturerViewSet(viewsets.ModelViewSet):
         serializer.save(owner=self.request.user)
 
 
-class RetailNetworkViewSet(viewsets.ModelViewSet):
+class RetailNetworkViewSet(TracingViewMixin, MultiGetViewMixin, ExpandViewMixin, SparseFieldsViewMixin,
+                           ValuesListViewMixin, FacetsViewMixin, HierarchyViewMixin, viewsets.ModelViewSet):
     """ Розничная сеть """
     permission_classes = [IsOwnerOrSuperuser, IsActiveAuthenticatedUser]
     pagination_class = RetailNetworkPagination
 
     def get_queryset(self):
         user = self.request.user
+        queryset = RetailNetwork.objects.select_related('country', 'city')
         if user.is_superuser:
-            return RetailNetwork.objects.all().order_by('pk')
+            return queryset.order_by('pk')
         else:
-            return RetailNetwork.objects.filter(owner=user).order_by('pk')
+            return queryset.filter(owner=user).order_by('pk')
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -58,17 +81,19 @@ class RetailNetworkViewSet(viewsets.ModelViewSet):
         serializer.save(owner=self.request.user)
 
 
-class IndividualEntrepreneurViewSet(viewsets.ModelViewSet):
+class IndividualEntrepreneurViewSet(TracingViewMixin, MultiGetViewMixin, ExpandViewMixin, SparseFieldsViewMixin,
+                                    ValuesListViewMixin, FacetsViewMixin, HierarchyViewMixin, viewsets.ModelViewSet):
     """ Индивидуальный предприниматель """
     permission_classes = [IsOwnerOrSuperuser, IsActiveAuthenticatedUser]
     pagination_class = IndividualEntrepreneurPagination
 
     def get_queryset(self):
         user = self.request.user
+        queryset = IndividualEntrepreneur.objects.select_related('country', 'city')
         if user.is_superuser:
-            return IndividualEntrepreneur.objects.all().order_by('pk')
+            return queryset.order_by('pk')
         else:
-            return IndividualEntrepreneur.objects.filter(owner=user).order_by('pk')
+            return queryset.filter(owner=user).order_by('pk')
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -83,7 +108,8 @@ class IndividualEntrepreneurViewSet(viewsets.ModelViewSet):
         serializer.save(owner=self.request.user)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(TracingViewMixin, MultiGetViewMixin, ExpandViewMixin, SparseFieldsViewMixin,
+                     ValuesListViewMixin, FacetsViewMixin, ProductSuppliersViewMixin, viewsets.ModelViewSet):
     """ Продукт """
     serializer_class = ProductSerializer
     permission_classes = [IsOwnerOrSuperuser, IsActiveAuthenticatedUser]
@@ -94,10 +120,11 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Product.objects.select_related('manufacturer').prefetch_related('retailers', 'entrepreneurs')
         if user.is_superuser:
-            return Product.objects.all().order_by('pk')
+            return queryset.order_by('pk')
         else:
-            return Product.objects.filter(owner=user).order_by('pk')
+            return queryset.filter(owner=user).order_by('pk')
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
@@ -106,9 +133,12 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer.save(owner=self.request.user)
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(TracingViewMixin, MultiGetViewMixin, ExpandViewMixin, SparseFieldsViewMixin,
+                         ValuesListViewMixin, viewsets.ModelViewSet):
     """ Продажи """
     permission_classes = [IsOwnerOrSuperuser, IsActiveAuthenticatedUser]
+    filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
+    filterset_class = TransactionFilter
     pagination_class = TransactionPagination
 
     def get_queryset(self):
@@ -119,13 +149,166 @@ class TransactionViewSet(viewsets.ModelViewSet):
             return Transaction.objects.filter(owner=user).order_by('pk')
 
     def get_serializer_class(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'batch']:
             return TransactionReadSerializer
         return TransactionWriteSerializer
 
-
+    # запись транзакции и изменение остатков и агрегатов в её сигналах — одна транзакция базы
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    @transaction.atomic
     def perform_update(self, serializer):
         serializer.save(owner=self.request.user)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+
+
+class PaymentViewSet(TracingViewMixin, MultiGetViewMixin, mixins.CreateModelMixin, mixins.ListModelMixin,
+                     mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """ Оплата задолженности: зачитывается в счёт самых старых транзакций покупателя """
+    serializer_class = PaymentSerializer
+    permission_classes = [IsOwnerOrSuperuser, IsActiveAuthenticatedUser]
+    pagination_class = PaymentPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_superuser:
+            return Payment.objects.all().order_by('pk')
+        else:
+            return Payment.objects.filter(owner=user).order_by('pk')
+
+    def get_transactions(self):
+        user = self.request.user
+        if user.is_superuser:
+            return Transaction.objects.all()
+        else:
+            return Transaction.objects.filter(owner=user)
+
+    def perform_create(self, serializer):
+        payment = serializer.save(owner=self.request.user)
+        apply_payment(payment, self.get_transactions())
+
+
+class StockViewSet(TracingViewMixin, ValuesListViewMixin, viewsets.ReadOnlyModelViewSet):
+    """ Остатки продуктов у звеньев сети: закупки минус продажи, поддерживаются при записи транзакций """
+    serializer_class = StockSerializer
+    permission_classes = [IsOwnerOrSuperuser, IsActiveAuthenticatedUser]
+    filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
+    filterset_class = StockFilter
+    pagination_class = StockPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_superuser:
+            return Stock.objects.all().order_by('pk')
+        else:
+            return Stock.objects.filter(Q(manufacturer__owner=user) | Q(retail_network__owner=user)
+                                        | Q(individual_entrepreneur__owner=user)).order_by('pk')
+
+
+class SalesAnalyticsView(TracingViewMixin, APIView):
+    """ Объём продаж и долг по продукту, стране производителя, уровню продавца и периоду.
+
+    Читает только агрегаты SalesRollup, поэтому время ответа не зависит от размера таблицы транзакций.
+    Параметры: group_by=bucket,product,country,seller_level; bucket=day|month|year; date_from, date_to.
+    """
+    permission_classes = [IsActiveAuthenticatedUser]
+    dimensions = ('bucket', 'product', 'country', 'seller_level')
+    bucket_functions = {'month': TruncMonth, 'year': TruncYear}
+    debt_field = serializers.DecimalField(max_digits=16, decimal_places=2)
+    date_field = serializers.DateField()
+
+    def get(self, request):
+        group_by = [field for field in request.query_params.get('group_by', 'bucket').split(',') if field]
+        unknown = set(group_by) - set(self.dimensions)
+        if unknown:
+            raise serializers.ValidationError({'group_by': f"Неизвестные измерения: {', '.join(sorted(unknown))}"})
+        bucket = request.query_params.get('bucket', 'day')
+        if bucket not in ('day', *self.bucket_functions):
+            raise serializers.ValidationError({'bucket': 'Допустимые значения: day, month, year.'})
+
+        queryset = SalesRollup.objects.all()
+        if not request.user.is_superuser:
+            queryset = queryset.filter(owner=request.user)
+        date_from, date_to = self.get_date('date_from'), self.get_date('date_to')
+        if date_from:
+            queryset = queryset.filter(bucket__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(bucket__lte=date_to)
+        if 'bucket' in group_by and bucket in self.bucket_functions:
+            queryset = queryset.annotate(period=self.bucket_functions[bucket]('bucket'))
+            group_by = ['period' if field == 'bucket' else field for field in group_by]
+
+        rows = (
+            queryset.values(*group_by)
+            .annotate(transactions_count=Sum('transactions_count'), amount=Sum('amount'), debt=Sum('debt'))
+            .order_by(*group_by)
+        )
+        return Response({'results': [self.to_representation(row) for row in rows]})
+
+    def get_date(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return self.date_field.run_validation(value)
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({name: exc.detail})
+
+    def to_representation(self, row):
+        data = {('bucket' if key == 'period' else key): value for key, value in row.items()}
+        data['debt'] = self.debt_field.to_representation(data['debt'])
+        return data
+
+
+
+class DebtExposureView(TracingViewMixin, APIView):
+    """ Долг нижестоящих покупателей по производителям: сетей первого и второго уровня и ИП в дереве каждого.
+
+    Считается в процессе сервера без пула: запуск процессов на каждый запрос дороже самого отчёта,
+    пул процессов — у команды debt_exposure_report. Формат: JSON или CSV (?format=csv).
+    """
+    permission_classes = [IsActiveAuthenticatedUser]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer]
+    csv_columns = debt_exposure.COLUMNS
+    debt_field = serializers.DecimalField(max_digits=16, decimal_places=2)
+
+    def get(self, request):
+        owner_id = None if request.user.is_superuser else request.user.pk
+        return Response({'results': [self.to_representation(row) for row in debt_exposure.report(owner_id, workers=1)]})
+
+    def to_representation(self, row):
+        return {**row, **{column: self.debt_field.to_representation(row[column])
+                          for column in ('retail_networks_debt', 'entrepreneurs_debt', 'debt')}}
+
+
+class ChangesView(TracingViewMixin, APIView):
+    """ Лента изменений для инкрементальной синхронизации.
+
+    Отдаёт созданные, изменённые и удалённые объекты сети после непрозрачного курсора и курсор продолжения.
+    Параметры: cursor (без него — с начала журнала), resources=product,transaction, limit (до 1000).
+    """
+    permission_classes = [IsActiveAuthenticatedUser]
+    max_limit = 1000
+
+    def get(self, request):
+        try:
+            position = changes.decode_cursor(request.query_params.get('cursor'))
+        except ValueError:
+            raise serializers.ValidationError({'cursor': 'Недействительный курсор.'})
+        resources = [name for name in request.query_params.get('resources', '').split(',') if name]
+        unknown = set(resources) - set(changes.RESOURCES)
+        if unknown:
+            raise serializers.ValidationError({'resources': f"Неизвестные ресурсы: {', '.join(sorted(unknown))}"})
+        try:
+            limit = serializers.IntegerField(min_value=1, max_value=self.max_limit).run_validation(
+                request.query_params.get('limit', 100))
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({'limit': exc.detail})
+
+        results, position, has_more = changes.read_changes(request.user, position, resources, limit)
+        return Response({'results': results, 'cursor': changes.encode_cursor(position), 'has_more': has_more})
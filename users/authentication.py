@@ -0,0 +1,37 @@
+""" Аутентификация для users """
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+def user_cache_key(user_id):
+    return f'jwt_user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    """ Сбросить закэшированного пользователя, чтобы следующий запрос перечитал его из базы """
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """ JWT-аутентификация с кэшем пользователей вместо запроса к базе на каждый вызов API.
+
+    В кэш попадают только пользователи, прошедшие проверки JWTAuthentication (в том числе is_active).
+    Запись сбрасывается сигналами после фиксации сохранения или удаления пользователя (users.signals),
+    а срок жизни ограничен настройкой JWT_USER_CACHE_TIMEOUT. QuerySet.update() и bulk_update()
+    сигналов не отправляют: после них нужно вызвать invalidate_cached_user для каждого изменённого пользователя,
+    иначе прежние права действуют до истечения срока кэша.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(key, user, getattr(settings, 'JWT_USER_CACHE_TIMEOUT', 300))
+        return user
@@ -1,15 +1,17 @@
 """ Сериалайзеры для users """
 from rest_framework import serializers
+from config.tracing import TracingSerializerMixin, TracedListSerializer
 from django.contrib.auth.hashers import make_password
 
 from users.models import User
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TracingSerializerMixin, serializers.ModelSerializer):
     """ Сериалайзер пользователя """
     class Meta:
         model = User
         fields = ['username', 'password', 'is_active']
         extra_kwargs = {'password': {'write_only': True}}
+        list_serializer_class = TracedListSerializer
 
     def create(self, validated_data):
         validated_data['password'] = make_password(validated_data['password'])
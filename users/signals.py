@@ -0,0 +1,20 @@
+""" Сигналы для users """
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from users.authentication import invalidate_cached_user
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_jwt_user(sender, instance, **kwargs):
+    """ Изменение пользователя (is_active, is_superuser, пароль) сбрасывает его из кэша аутентификации.
+
+    Запись сбрасывается после фиксации транзакции: до неё параллельный запрос прочитал бы из базы
+    прежнего пользователя и снова положил бы его в кэш.
+    """
+    transaction.on_commit(partial(invalidate_cached_user, instance.pk))
@@ -0,0 +1,77 @@
+""" Тесты аутентификации для users """
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.authentication import user_cache_key
+from users.models import User
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """ Фикстура для очистки кэша между тестами """
+    cache.clear()
+
+
+@pytest.fixture
+def user():
+    """ Фикстура для создания пользователя """
+    return User.objects.create_user(username='test_active', password='test', is_active=True)
+
+
+@pytest.fixture
+def admin():
+    """ Фикстура для создания суперпользователя """
+    return User.objects.create_user(username='admin', password='admin', is_active=True, is_staff=True,
+                                    is_superuser=True)
+
+
+def auth_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client
+
+
+def user_queries(context):
+    return [query['sql'] for query in context.captured_queries if User._meta.db_table in query['sql']]
+
+
+@pytest.mark.django_db
+def test_cached_jwt_user_skips_user_query(user):
+    """ Тест отсутствия запроса пользователя при повторной аутентификации """
+    client = auth_client(user)
+    assert client.get('/manufacturers/').status_code == 200
+
+    with CaptureQueriesContext(connection) as context:
+        assert client.get('/manufacturers/').status_code == 200
+    assert not user_queries(context)
+
+
+@pytest.mark.django_db
+def test_deactivated_user_is_rejected_immediately(user, admin, django_capture_on_commit_callbacks):
+    """ Тест сброса кэша при деактивации пользователя через UserViewSet """
+    client = auth_client(user)
+    assert client.get('/manufacturers/').status_code == 200
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = auth_client(admin).patch(f'/users/users/{user.pk}/', {'is_active': False}, format='json')
+    assert response.status_code == 200
+    assert client.get('/manufacturers/').status_code == 401
+
+
+@pytest.mark.django_db
+def test_superuser_flag_change_is_visible_immediately(user, django_capture_on_commit_callbacks):
+    """ Тест сброса кэша после фиксации изменения флага суперпользователя """
+    client = auth_client(user)
+    client.get('/manufacturers/')
+
+    with django_capture_on_commit_callbacks(execute=True):
+        user.is_superuser = True
+        user.save()
+        # до фиксации кэш не сбрасывается: параллельный запрос перечитал бы из базы прежнего пользователя
+        assert cache.get(user_cache_key(user.pk)) is not None
+    response = client.get('/users/users/')
+    assert response.status_code == 200
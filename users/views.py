@@ -1,5 +1,6 @@
 """ Представления для users """
 from rest_framework import viewsets
+from config.tracing import TracingViewMixin
 from users.models import User
 from users.pagination import UserPagination
 from users.permissions import UserPermission
@@ -8,7 +9,7 @@ from rest_framework.response import Response
 from rest_framework import status
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(TracingViewMixin, viewsets.ModelViewSet):
     """ ViewSet для пользователей """
     serializer_class = UserSerializer
     queryset = User.objects.all().order_by('pk')